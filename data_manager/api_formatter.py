@@ -1,29 +1,36 @@
-from typing import List, Dict, Any
-from .models import CompactData
+from typing import List, Dict, Any, AsyncIterator, Callable, Tuple
+from .models import CompactData, ColumnarData, EncodedRows
+from . import serialization
 from datetime import datetime
+from decimal import Decimal
+from operator import itemgetter
 
 
 class APIFormatter:
     @staticmethod
-    def to_compact_format(data: List[Dict[str, Any]], metadata: Dict[str, Any] = None) -> CompactData:
-        """Конвертирует данные в компактный формат"""
+    def to_compact_format(data: List[Dict[str, Any]], metadata: Dict[str, Any] = None,
+                          dictionary_encode: bool = True) -> CompactData:
+        """Конвертирует данные в компактный формат (строковые колонки с малым числом значений - словарем)"""
         if not data:
             return CompactData(headers=[], data=[], metadata=metadata or {})
 
         # Получаем заголовки из ключей первого элемента
         headers = list(data[0].keys())
 
-        # Преобразуем данные в список списков
-        compact_data = []
-        for item in data:
-            row = []
-            for header in headers:
-                value = item[header]
-                # Преобразуем datetime в строку для JSON
-                if isinstance(value, datetime):
-                    value = value.isoformat()
-                row.append(value)
-            compact_data.append(row)
+        # Преобразуем данные в список списков: колонки datetime и Decimal преобразуются целиком
+        rows = list(map(itemgetter(*headers), data)) if len(headers) > 1 else [(item[headers[0]],) for item in data]
+        converters = APIFormatter._value_converters(rows)
+        if converters:
+            columns = list(zip(*rows))
+            for index, convert in converters:
+                column = columns[index]
+                try:
+                    columns[index] = list(map(convert, column))
+                except TypeError:
+                    # В колонке есть NULL (None in column медленнее: Decimal == None идет через abc)
+                    columns[index] = [None if value is None else convert(value) for value in column]
+            rows = zip(*columns)
+        compact_data = list(map(list, rows))
 
         metadata = metadata or {
             'total_count': len(data),
@@ -31,19 +38,36 @@ class APIFormatter:
             'format': 'compact'
         }
 
-        return CompactData(headers=headers, data=compact_data, metadata=metadata)
+        compact = CompactData(headers=headers, data=compact_data, metadata=metadata)
+        if dictionary_encode:
+            compact.encode_dictionaries()
+        return compact
+
+    @staticmethod
+    def _value_converters(rows: List[tuple]) -> List[Tuple[int, Callable[[Any], Any]]]:
+        """(индекс, преобразование) для колонок, которых нет в JSON: datetime - строка ISO 8601,
+        Decimal (NUMERIC) - float, чтобы кодировщик писал число без вызова default на каждое значение"""
+        converters = []
+        for index in range(len(rows[0])):
+            sample = next((row[index] for row in rows if row[index] is not None), None)
+            if isinstance(sample, datetime):
+                converters.append((index, datetime.isoformat))
+            elif isinstance(sample, Decimal):
+                converters.append((index, float))
+        return converters
 
     @staticmethod
     def from_compact_format(compact_data: CompactData) -> List[Dict[str, Any]]:
         """Восстанавливает данные из компактного формата"""
         result = []
         headers = compact_data.headers
+        dictionaries = [compact_data.dictionaries.get(header) for header in headers]
 
         for row in compact_data.data:
             item = {}
             for i, header in enumerate(headers):
                 if i < len(row):
-                    item[header] = row[i]
+                    item[header] = dictionaries[i][row[i]] if dictionaries[i] is not None else row[i]
             result.append(item)
 
         return result
@@ -54,8 +78,44 @@ class APIFormatter:
         compact_data = APIFormatter.to_compact_format(data, metadata)
         return compact_data.to_json()
 
+    @staticmethod
+    def to_columnar(data: List[Dict[str, Any]], metadata: Dict[str, Any] = None) -> bytes:
+        """Конвертирует данные в колоночный бинарный формат (см. ColumnarData)"""
+        if not data:
+            return ColumnarData(headers=[], columns=[], metadata=metadata or {}).to_bytes()
+
+        headers = list(data[0].keys())
+        columns = [[item[header] for item in data] for header in headers]
+        return ColumnarData(headers=headers, columns=columns, metadata=metadata or {}).to_bytes()
+
     @staticmethod
     def from_json(json_str: str) -> List[Dict[str, Any]]:
         """Быстрое восстановление из JSON"""
         compact_data = CompactData.from_json(json_str)
-        return APIFormatter.from_compact_format(compact_data)
\ No newline at end of file
+        return APIFormatter.from_compact_format(compact_data)
+
+    @staticmethod
+    async def iter_encoded_json(rows: EncodedRows) -> AsyncIterator[str]:
+        """Компактный JSON {"h":...,"d":[...],"x":{...},"c":N,"w":W} из строк, закодированных PostgreSQL.
+
+        Порции строк уже JSON - здесь только склейка без разбора значений.
+        """
+        yield '{"h":' + serialization.dumps(rows.headers) + ',"d":['
+        first = True
+        async for chunk in rows.chunks:
+            if chunk:
+                yield chunk if first else ',' + chunk
+                first = False
+
+        tail = ']'
+        if rows.dictionaries:
+            tail += ',"x":' + serialization.dumps(rows.dictionaries)
+        tail += ',"c":' + str(rows.total)
+        if rows.watermark is not None:
+            tail += ',"w":' + serialization.dumps(rows.watermark)
+        yield tail + '}'
+
+    @staticmethod
+    async def encoded_to_json(rows: EncodedRows) -> str:
+        """Компактный JSON целиком из строк, закодированных PostgreSQL"""
+        return ''.join([piece async for piece in APIFormatter.iter_encoded_json(rows)])
@@ -0,0 +1,228 @@
+import asyncio
+import sys
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+
+@dataclass
+class CacheEntry:
+    """Запись кеша: значение, его размер в байтах и версия данных, из которой оно построено.
+
+    compute и version_fn сохраняются, чтобы запись можно было пересчитать в фоне.
+    """
+    value: Any
+    size: int
+    created_at: float = field(default_factory=time.monotonic)
+    version: Any = None
+    compute: Optional[Callable[[], Awaitable[Any]]] = None
+    version_fn: Optional[Callable[[], Any]] = None
+    tables: Tuple[str, ...] = ()
+    last_access: float = field(default_factory=time.monotonic)
+
+    @property
+    def age(self) -> float:
+        return time.monotonic() - self.created_at
+
+    @property
+    def idle(self) -> float:
+        return time.monotonic() - self.last_access
+
+    @property
+    def outdated(self) -> bool:
+        """Данные таблиц изменились после построения записи"""
+        return self.version_fn is not None and self.version_fn() != self.version
+
+
+class DataCache:
+    """LRU кеш ответов API с бюджетом памяти в байтах и TTL.
+
+    Одновременные промахи по одному ключу ждут одно вычисление (single-flight),
+    вместо N одинаковых запросов к БД. Запись старше TTL, но не старше
+    TTL + stale_ttl, отдается сразу (STALE), а пересчет идет в фоне.
+    """
+
+    def __init__(self, max_bytes: int = 512 * 1024 * 1024, ttl: float = 300, stale_ttl: float = 300):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.bytes_held = 0
+        self._entries: 'OrderedDict[str, CacheEntry]' = OrderedDict()
+        self._in_flight: Dict[str, asyncio.Future] = {}
+        self._stats = {'hits': 0, 'misses': 0, 'coalesced': 0, 'stale': 0, 'refreshes': 0,
+                       'evictions': 0, 'expired': 0}
+
+    def get(self, key: str, version: Any = None, allow_stale: bool = False) -> Optional[CacheEntry]:
+        """Возвращает актуальную запись или None (просроченные и устаревшие записи удаляются)"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+
+        # Устаревшую по версии запись не отдаем никогда - данные уже другие
+        if entry.version != version or entry.age >= self.ttl + self.stale_ttl:
+            self._stats['expired'] += 1
+            self._remove(key)
+            return None
+
+        if entry.age >= self.ttl and not allow_stale:
+            return None
+
+        entry.last_access = time.monotonic()
+        self._entries.move_to_end(key)
+        return entry
+
+    def discard(self, key: str) -> bool:
+        """Удаляет запись (например, устаревшую после изменения таблицы)"""
+        if key not in self._entries:
+            return False
+        self._remove(key)
+        return True
+
+    def peek(self, key: str) -> Optional[CacheEntry]:
+        """Запись без проверок и без влияния на LRU и статистику"""
+        return self._entries.get(key)
+
+    def set(self, key: str, value: Any, version: Any = None, **recipe) -> Optional[CacheEntry]:
+        """Сохраняет значение и вытесняет давно неиспользуемые записи сверх бюджета.
+
+        recipe - compute, version_fn, tables: как пересчитать запись в фоне.
+        """
+        size = self._size_of(value)
+        entry = CacheEntry(value=value, size=size, version=version, **recipe)
+
+        previous = self._entries.get(key)
+        if previous is not None:
+            # Фоновое обновление не считается обращением клиента
+            entry.last_access = previous.last_access
+            self._remove(key)
+
+        # Значение больше всего бюджета не кешируем - оно вытеснило бы все остальное
+        if size > self.max_bytes:
+            return entry
+
+        self._entries[key] = entry
+        self.bytes_held += size
+
+        while self.bytes_held > self.max_bytes:
+            oldest_key = next(iter(self._entries))
+            self._remove(oldest_key)
+            self._stats['evictions'] += 1
+
+        return entry
+
+    async def get_or_compute(self, key: str, compute: Callable[[], Awaitable[Any]],
+                             version_fn: Callable[[], Any] = None,
+                             tables: Tuple[str, ...] = ()) -> Tuple[CacheEntry, str]:
+        """Возвращает (запись, статус): HIT, STALE, MISS или COALESCED (дождались чужого вычисления).
+
+        version_fn возвращает текущую версию данных: запись другой версии не отдается.
+        """
+        version = version_fn() if version_fn else None
+        entry = self.get(key, version, allow_stale=True)
+        if entry is not None:
+            if entry.age < self.ttl:
+                self._stats['hits'] += 1
+                return entry, 'HIT'
+            # Stale-while-revalidate: клиент не ждет пересчета
+            self._stats['stale'] += 1
+            self._start_fill(key, compute, version_fn, tables)
+            return entry, 'STALE'
+
+        in_flight = self._in_flight.get(key)
+        if in_flight is not None:
+            self._stats['coalesced'] += 1
+            return await asyncio.shield(in_flight), 'COALESCED'
+
+        self._stats['misses'] += 1
+        task = self._start_fill(key, compute, version_fn, tables)
+        return await asyncio.shield(task), 'MISS'
+
+    def refresh(self, key: str) -> Optional[asyncio.Future]:
+        """Пересчитывает запись по сохраненному рецепту (одно вычисление на ключ)"""
+        entry = self._entries.get(key)
+        if entry is None or entry.compute is None:
+            return None
+        self._stats['refreshes'] += 1
+        return self._start_fill(key, entry.compute, entry.version_fn, entry.tables)
+
+    def is_due(self, entry: CacheEntry, margin: float) -> bool:
+        """Запись пора пересчитать: истекает в ближайшие margin секунд или данные изменились"""
+        return entry.age >= self.ttl - margin or entry.outdated
+
+    def entries(self) -> List[Tuple[str, CacheEntry]]:
+        """Снимок записей кеша (от давно используемых к недавним)"""
+        return list(self._entries.items())
+
+    def is_refreshing(self, key: str) -> bool:
+        return key in self._in_flight
+
+    def _start_fill(self, key: str, compute: Callable[[], Awaitable[Any]],
+                    version_fn: Optional[Callable[[], Any]], tables: Tuple[str, ...]) -> asyncio.Future:
+        task = self._in_flight.get(key)
+        if task is None:
+            # Вычисление в отдельной задаче: отмена запроса-инициатора не отменит ожидающих
+            task = asyncio.ensure_future(self._fill(key, compute, version_fn, tables))
+            task.add_done_callback(self._report_failure)
+            self._in_flight[key] = task
+        return task
+
+    async def _fill(self, key: str, compute: Callable[[], Awaitable[Any]],
+                    version_fn: Optional[Callable[[], Any]], tables: Tuple[str, ...]) -> CacheEntry:
+        try:
+            # Версия до чтения из БД: запись во время загрузки не попадет в кеш как актуальная
+            version = version_fn() if version_fn else None
+            value = await compute()
+            return self.set(key, value, version, compute=compute, version_fn=version_fn, tables=tables)
+        finally:
+            self._in_flight.pop(key, None)
+
+    @staticmethod
+    def _report_failure(task: asyncio.Future):
+        # Фоновый пересчет никто не ждет - ошибку нужно хотя бы залогировать
+        if not task.cancelled() and task.exception() is not None:
+            print(f"⚠️ Ошибка пересчета записи кеша: {task.exception()}")
+
+    def clear(self) -> list:
+        """Очищает кеш и возвращает удаленные ключи"""
+        keys = list(self._entries)
+        self._entries.clear()
+        self.bytes_held = 0
+        return keys
+
+    def stats(self) -> Dict[str, Any]:
+        """Счетчики попаданий/промахов/вытеснений и занятый объем"""
+        return {
+            **self._stats,
+            'total_entries': len(self._entries),
+            'bytes_held': self.bytes_held,
+            'max_bytes': self.max_bytes,
+            'ttl': self.ttl,
+            'stale_ttl': self.stale_ttl,
+            'in_flight': len(self._in_flight),
+            'entries': [
+                {
+                    'key': key,
+                    'age_seconds': entry.age,
+                    'idle_seconds': entry.idle,
+                    'ttl': self.ttl,
+                    'size_bytes': entry.size,
+                    'tables': list(entry.tables),
+                    'expired': entry.age >= self.ttl
+                }
+                for key, entry in self._entries.items()
+            ]
+        }
+
+    def _remove(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.bytes_held -= entry.size
+
+    @staticmethod
+    def _size_of(value: Any) -> int:
+        if isinstance(value, (bytes, bytearray)):
+            return len(value)
+        if hasattr(value, 'size_bytes'):
+            return value.size_bytes
+        return sys.getsizeof(value)
@@ -0,0 +1,158 @@
+import asyncio
+import json
+import time
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from .cache import DataCache
+from .compression import precompress
+from .database import DatabaseManager
+from .query_engine import QueryEngine
+
+
+class CacheWarmer:
+    """Фоновый прогрев кеша данных по сохраненным layout.
+
+    Раз в interval секунд и сразу после события изменения таблицы (NOTIFY):
+    - считает панели всех активных layout (как /api/layout/data) и держит их в кеше;
+    - пересчитывает записи датасетов таблиц, которые читают layout, за refresh_margin
+      секунд до истечения TTL или сразу после изменения данных.
+
+    Записи, к которым клиенты не обращались дольше idle_timeout, не прогреваются,
+    а устаревшие по версии данных удаляются.
+    """
+
+    def __init__(self, cache: DataCache, db_manager: DatabaseManager, query_engine: QueryEngine,
+                 interval: float = 30, refresh_margin: float = 60, idle_timeout: float = 3600):
+        self.cache = cache
+        self.db_manager = db_manager
+        self.query_engine = query_engine
+        self.interval = interval
+        self.refresh_margin = refresh_margin
+        self.idle_timeout = idle_timeout
+        self._task: Optional[asyncio.Task] = None
+        self._wake = asyncio.Event()
+        # Активные layout перечитываются только после изменения dashboard_layouts
+        self._layouts: Optional[List[Tuple[str, str, Dict[str, Any]]]] = None
+        self._layouts_version: Optional[str] = None
+        db_manager.on_table_change(self.on_table_change)
+        self._stats = {'runs': 0, 'layouts': 0, 'layouts_warmed': 0, 'datasets_refreshed': 0,
+                       'errors': 0, 'last_run_seconds': None, 'hot_tables': []}
+
+    async def start(self, app=None):
+        """Запускает фоновый цикл (подходит как обработчик app.on_startup)"""
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+            print(f"🔥 Прогрев кеша запущен (каждые {self.interval} сек)")
+
+    async def stop(self, app=None):
+        """Останавливает фоновый цикл (подходит как обработчик app.on_cleanup)"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def on_table_change(self, table_name: str, version: int):
+        """Событие изменения таблицы: пересчитать затронутые записи, не дожидаясь interval"""
+        self._wake.set()
+
+    async def _run(self):
+        while True:
+            self._wake.clear()
+            try:
+                await self.warm()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self._stats['errors'] += 1
+                print(f"⚠️ Ошибка прогрева кеша: {e}")
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def warm(self):
+        """Один проход прогрева: панели layout, затем горячие датасеты"""
+        started = time.monotonic()
+        layouts = await self._active_layouts()
+
+        hot_tables: Set[str] = set()
+        for dashboard_id, name, layout in layouts:
+            tables = self.query_engine.layout_tables(layout)
+            hot_tables.update(tables)
+            try:
+                if await self._warm_layout(dashboard_id, name, layout, tables):
+                    self._stats['layouts_warmed'] += 1
+            except Exception as e:
+                self._stats['errors'] += 1
+                print(f"⚠️ Ошибка прогрева layout {dashboard_id}/{name}: {e}")
+
+        # Пересчеты датасетов идут по одному, чтобы прогрев не занимал весь пул соединений
+        for key, entry in self.cache.entries():
+            if not set(entry.tables) & hot_tables or entry.idle > self.idle_timeout:
+                # Холодную запись с устаревшими данными никто не отдаст - освобождаем память
+                if entry.outdated and not self.cache.is_refreshing(key):
+                    self.cache.discard(key)
+                continue
+            if self.cache.is_refreshing(key) or not self.cache.is_due(entry, self.refresh_margin):
+                continue
+            refresh = self.cache.refresh(key)
+            if refresh is None:
+                continue
+            try:
+                await asyncio.shield(refresh)
+                self._stats['datasets_refreshed'] += 1
+            except Exception:
+                # Ошибку пересчета уже залогировал DataCache
+                self._stats['errors'] += 1
+
+        self._stats['runs'] += 1
+        self._stats['layouts'] = len(layouts)
+        self._stats['hot_tables'] = sorted(hot_tables)
+        self._stats['last_run_seconds'] = round(time.monotonic() - started, 3)
+
+    async def _warm_layout(self, dashboard_id: str, name: str, layout: Dict[str, Any],
+                           tables: Tuple[str, ...]) -> bool:
+        """Держит в кеше результат layout; возвращает True, если пришлось считать"""
+        key = self.query_engine.layout_cache_key(dashboard_id, name, layout)
+        entry = self.cache.peek(key)
+
+        if entry is not None:
+            if self.cache.is_refreshing(key) or not self.cache.is_due(entry, self.refresh_margin):
+                return False
+            await asyncio.shield(self.cache.refresh(key))
+            return True
+
+        async def build_response():
+            return await precompress(await self.query_engine.render_layout(dashboard_id, name, layout))
+
+        def version_fn():
+            return tuple(self.db_manager.get_table_version(table) for table in tables)
+
+        await self.cache.get_or_compute(key, build_response, version_fn=version_fn, tables=tables)
+        return True
+
+    async def _active_layouts(self) -> List[Tuple[str, str, Dict[str, Any]]]:
+        """Все активные layout всех дашбордов: (dashboard_id, name, config)"""
+        layouts_version = self.db_manager.get_table_version('dashboard_layouts')
+        if self._layouts is None or self._layouts_version != layouts_version:
+            self._layouts = await self._load_layouts()
+            self._layouts_version = layouts_version
+        return self._layouts
+
+    async def _load_layouts(self) -> List[Tuple[str, str, Dict[str, Any]]]:
+        layouts = []
+        for dashboard in await self.db_manager.get_all_dashboards():
+            dashboard_id = dashboard['dashboard_id']
+            for layout in await self.db_manager.get_dashboard_layouts(dashboard_id):
+                config = await self.db_manager.load_layout(dashboard_id, layout['name'])
+                if isinstance(config, str):
+                    config = json.loads(config)
+                if config.get('panels'):
+                    layouts.append((dashboard_id, layout['name'], config))
+        return layouts
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self._stats, 'running': self._task is not None and not self._task.done()}
@@ -0,0 +1,245 @@
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Optional
+
+
+def quote_ident(name: str) -> str:
+    """Экранирует идентификатор PostgreSQL"""
+    return '"' + name.replace('"', '""') + '"'
+
+
+# Схема всех таблиц текущей схемы БД одним запросом: колонки, типы, NULL, ограничения длины
+# и точности, оценка числа строк (у секционированной таблицы - сумма по секциям).
+# Секции в каталог не попадают: запросы идут к родительской таблице.
+# $1 - список таблиц или NULL (все таблицы)
+CATALOG_QUERY = '''
+    SELECT col.table_name, col.column_name, col.data_type,
+           col.is_nullable = 'YES' AS nullable,
+           col.character_maximum_length, col.numeric_precision, col.numeric_scale,
+           COALESCE((
+               SELECT SUM(GREATEST(part.reltuples, 0))
+               FROM pg_partition_tree(cls.oid) tree
+               JOIN pg_class part ON part.oid = tree.relid
+               WHERE tree.isleaf
+           ), 0)::bigint AS row_estimate
+    FROM information_schema.columns col
+    JOIN pg_class cls
+      ON cls.oid = to_regclass(quote_ident(col.table_schema) || '.' || quote_ident(col.table_name))
+    WHERE col.table_schema = current_schema()
+      AND NOT cls.relispartition
+      AND ($1::text[] IS NULL OR col.table_name = ANY($1::text[]))
+    ORDER BY col.table_name, col.ordinal_position
+'''
+
+# Событийный триггер DDL: изменение схемы таблицы увеличивает ее версию и публикует
+# table_changes с признаком schema - все процессы перечитывают каталог и сбрасывают кеш/ETag.
+# Создание секций (CREATE TABLE ... PARTITION OF) схему родительской таблицы не меняет
+SCHEMA_EVENTS_FUNCTION = '''
+    CREATE OR REPLACE FUNCTION notify_schema_change() RETURNS event_trigger
+    LANGUAGE plpgsql AS $$
+    DECLARE
+        changed TEXT[];
+        changed_table TEXT;
+        new_version BIGINT;
+    BEGIN
+        IF TG_EVENT = 'sql_drop' THEN
+            SELECT array_agg(DISTINCT (parse_ident(obj.object_identity))[2]) INTO changed
+            FROM pg_event_trigger_dropped_objects() obj
+            WHERE obj.object_type IN ('table', 'table column') AND obj.schema_name = current_schema();
+        ELSE
+            SELECT array_agg(DISTINCT cls.relname::text) INTO changed
+            FROM pg_event_trigger_ddl_commands() cmd
+            JOIN pg_class cls ON cls.oid = cmd.objid
+            WHERE cmd.object_type IN ('table', 'table column') AND cmd.schema_name = current_schema()
+              AND NOT cls.relispartition;
+        END IF;
+
+        FOREACH changed_table IN ARRAY COALESCE(changed, '{}') LOOP
+            CONTINUE WHEN changed_table = 'table_versions';
+            INSERT INTO table_versions (table_name, version, updated_at)
+            VALUES (changed_table, 1, CURRENT_TIMESTAMP)
+            ON CONFLICT (table_name)
+            DO UPDATE SET version = table_versions.version + 1, updated_at = CURRENT_TIMESTAMP
+            RETURNING version INTO new_version;
+            PERFORM pg_notify('table_changes', json_build_object(
+                'table', changed_table, 'version', new_version, 'schema', true)::text);
+        END LOOP;
+    END
+    $$
+'''
+
+TEXT_TYPES = {'character varying', 'text', 'character'}
+TIMESTAMP_TYPES = {'timestamp without time zone', 'timestamp with time zone'}
+INTEGER_TYPES = {'smallint', 'integer', 'bigint'}
+
+SCHEMA_EVENT_TRIGGERS = {
+    'schema_changes_ddl': 'ddl_command_end',
+    'schema_changes_drop': 'sql_drop',
+}
+
+
+@dataclass
+class ColumnInfo:
+    name: str
+    data_type: str
+    nullable: bool
+    # VARCHAR(n) - n; NUMERIC(p, s) - p и s (для проверки значений до COPY)
+    max_length: Optional[int] = None
+    numeric_precision: Optional[int] = None
+    numeric_scale: Optional[int] = None
+
+
+@dataclass
+class TableSchema:
+    """Схема таблицы из каталога PostgreSQL и SQL тексты запросов данных, построенные по ней.
+
+    Тексты запросов стабильны (колонки перечислены явно, лимиты и значения - параметры),
+    поэтому кеш prepared statements asyncpg на каждом соединении переиспользует их.
+    """
+    name: str
+    columns: List[ColumnInfo]
+    row_estimate: int = 0
+
+    def __post_init__(self):
+        self.column_types: Dict[str, str] = {column.name: column.data_type for column in self.columns}
+        # Колонки данных: все, кроме суррогатного id
+        self.data_columns: List[str] = [column.name for column in self.columns if column.name != 'id']
+        self.identifier = quote_ident(self.name)
+        self._select_list = ', '.join(quote_ident(name) for name in self.data_columns)
+        # Текстовые колонки - кандидаты в словари компактного формата
+        self.text_columns: List[str] = [name for name in self.data_columns if self.column_types[name] in TEXT_TYPES]
+        self._statements: Dict[Any, str] = {}
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[Any]) -> Dict[str, 'TableSchema']:
+        """Схемы таблиц из строк CATALOG_QUERY"""
+        grouped: Dict[str, List[Any]] = {}
+        for row in rows:
+            grouped.setdefault(row['table_name'], []).append(row)
+        return {
+            table_name: cls(
+                name=table_name,
+                columns=[
+                    ColumnInfo(row['column_name'], row['data_type'], row['nullable'],
+                               row['character_maximum_length'], row['numeric_precision'], row['numeric_scale'])
+                    for row in table_rows
+                ],
+                row_estimate=table_rows[0]['row_estimate']
+            )
+            for table_name, table_rows in grouped.items()
+        }
+
+    def check_columns(self, names: Iterable[str]):
+        """Проверяет имена колонок по схеме (они попадают в текст SQL); неизвестная - ValueError"""
+        for name in names:
+            if name not in self.column_types:
+                raise ValueError(f"Неизвестная колонка '{name}' в таблице '{self.name}'")
+
+    def statement(self, kind: str) -> str:
+        """SQL текст запроса данных kind (строится один раз на версию схемы)"""
+        if kind not in self._statements:
+            self._statements[kind] = self._build_statement(kind)
+        return self._statements[kind]
+
+    def _build_statement(self, kind: str) -> str:
+        if kind == 'select':
+            # LIMIT NULL - без ограничения, один текст для любых лимитов
+            return f'SELECT {self._select_list} FROM {self.identifier} LIMIT $1'
+        if kind == 'watermark':
+            return f'SELECT COALESCE(MAX(id), 0) FROM {self.identifier}'
+        if kind == 'since':
+            return f'SELECT id, {self._select_list} FROM {self.identifier} WHERE id > $1 ORDER BY id LIMIT $2'
+        if kind == 'compact_profile':
+            # Число строк начала выборки ($1 строк) и до $2 различных значений каждой текстовой колонки
+            # (выбор словарей)
+            distinct = ''.join(
+                f', ARRAY(SELECT DISTINCT {quote_ident(name)} FROM selected WHERE {quote_ident(name)} IS NOT NULL LIMIT $2) '
+                f'AS {quote_ident(name)}'
+                for name in self.text_columns
+            )
+            return (
+                f'WITH selected AS MATERIALIZED ('
+                f'SELECT {", ".join(quote_ident(name) for name in self.text_columns) or "id"} '
+                f'FROM {self.identifier} ORDER BY id LIMIT $1) '
+                f'SELECT (SELECT COUNT(*) FROM selected) AS total{distinct}'
+            )
+        raise ValueError(f"Неизвестный тип запроса: {kind}")
+
+    def compact_chunk(self, epoch_dates: bool, dictionary_columns: List[str]) -> str:
+        """Порция строк компактного формата, собранная PostgreSQL: JSON массивы строк через запятую.
+
+        $1 - последний id предыдущей порции, $2 - размер порции, $3.. - словари dictionary_columns
+        (значение заменяется индексом в словаре). Значения порции, которых нет в словаре, получают
+        следующие индексы и возвращаются в added_N - вызывающий дописывает их в словарь N.
+        epoch_dates - TIMESTAMP как unix timestamp (UTC).
+        Возвращает одну строку: rows (текст), last_id, row_count, added_0...
+        """
+        key = ('compact_chunk', epoch_dates, tuple(dictionary_columns))
+        if key not in self._statements:
+            self._statements[key] = self._build_compact_chunk(epoch_dates, dictionary_columns)
+        return self._statements[key]
+
+    def _build_compact_chunk(self, epoch_dates: bool, dictionary_columns: List[str]) -> str:
+        ctes = [
+            f'chunk AS MATERIALIZED (SELECT id, {self._select_list} FROM {self.identifier} '
+            f'WHERE id > $1 ORDER BY id LIMIT $2)'
+        ]
+        joins = []
+        added = []
+        dictionaries = {}
+        for index, name in enumerate(dictionary_columns):
+            alias = f'dict_{index}'
+            column = quote_ident(name)
+            dictionaries[name] = alias
+            # Новые значения порции - в конец словаря (EXCEPT убирает повторы)
+            ctes.append(
+                f'added_{index} AS (SELECT ARRAY(SELECT {column}::text FROM chunk WHERE {column} IS NOT NULL '
+                f'EXCEPT SELECT unnest(${index + 3}::text[])) AS new_values)'
+            )
+            joins.append(
+                f'LEFT JOIN unnest(${index + 3}::text[] || (SELECT new_values FROM added_{index})) '
+                f'WITH ORDINALITY AS {alias}(value, code) ON {alias}.value = chunk.{column}::text'
+            )
+            added.append(f'(SELECT new_values FROM added_{index}) AS added_{index}')
+
+        # Массив строки собирается из текстов значений: json_build_array разделяет элементы ", "
+        values = []
+        for name in self.data_columns:
+            column = f'chunk.{quote_ident(name)}'
+            if name in dictionaries:
+                value = f'({dictionaries[name]}.code - 1)::text'
+            elif epoch_dates and self.column_types[name] in TIMESTAMP_TYPES:
+                value = f'extract(epoch FROM {column})::bigint::text'
+            elif self.column_types[name] in INTEGER_TYPES:
+                value = f'{column}::text'
+            else:
+                # Строки экранируются, NUMERIC - число, TIMESTAMP - строка ISO 8601
+                value = f'to_json({column})::text'
+            values.append(f"COALESCE({value}, 'null')")
+
+        return (
+            f"WITH {', '.join(ctes)} "
+            f"SELECT string_agg('[' || concat_ws(',', {', '.join(values)}) || ']', ',' ORDER BY chunk.id) AS rows, "
+            f"MAX(chunk.id) AS last_id, COUNT(*) AS row_count{''.join(', ' + item for item in added)} "
+            f"FROM chunk "
+            + ' '.join(joins)
+        )
+
+    def select_where(self, where_clause: str, limit_param: int, with_id: bool = False,
+                     order_by: Optional[str] = None) -> str:
+        """SELECT по условию (параметры $1..$n-1 в where_clause) с LIMIT ${limit_param}"""
+        select_list = f'id, {self._select_list}' if with_id else self._select_list
+        query = f'SELECT {select_list} FROM {self.identifier} WHERE {where_clause}'
+        if order_by:
+            query += f' ORDER BY {order_by}'
+        return query + f' LIMIT ${limit_param}'
+
+    def describe(self) -> Dict[str, Any]:
+        """Описание для /api/metadata"""
+        return {
+            'table_name': self.name,
+            'columns': self.data_columns,
+            'column_types': {name: self.column_types[name] for name in self.data_columns},
+            'nullable': [column.name for column in self.columns if column.nullable and column.name != 'id'],
+            'row_estimate': self.row_estimate,
+            'total_columns': len(self.data_columns),
+        }
@@ -0,0 +1,695 @@
+import asyncio
+import time
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from .database import DatabaseManager
+
+
+# Шаг date_trunc в секундах; month/year считаются через datetime64
+FIXED_GRANULARITY_SECONDS = {'minute': 60, 'hour': 3600, 'day': 86400, 'week': 7 * 86400}
+# date_trunc('week') в PostgreSQL начинает неделю с понедельника: 1970-01-05 00:00 UTC
+WEEK_ORIGIN = 4 * 86400
+CALENDAR_UNITS = {'month': 'M', 'year': 'Y'}
+# Время хранится в микросекундах epoch - с той же точностью, что TIMESTAMP в PostgreSQL
+US_PER_SECOND = 1000000
+# NULL в колонке времени (NaT)
+NAT = -(1 << 63)
+
+TIME_TYPES = {'timestamp without time zone', 'timestamp with time zone', 'date'}
+INTEGER_TYPES = {'integer', 'bigint', 'smallint'}
+FLOAT_TYPES = {'numeric', 'real', 'double precision'}
+CATEGORY_TYPES = {'character varying', 'text', 'character'}
+
+# Групповой ключ считается без сортировки (bincount), пока произведение кардинальностей меньше
+DENSE_GROUP_LIMIT = 1 << 24
+
+# Bitmap индекс строится для словарных колонок с числом значений не больше этого
+BITMAP_MAX_CARDINALITY = 64
+# Число единичных бит в каждом байте (popcount упакованных bitmap)
+POPCOUNT = np.array([bin(byte).count('1') for byte in range(256)], dtype=np.uint8) if np is not None else None
+
+
+class ColumnarStore:
+    """Копия таблицы в памяти процесса: колонки NumPy вместо строк Python.
+
+    TIMESTAMP хранятся как epoch в микросекундах (int64), DECIMAL и INTEGER - как float64 (NULL = NaN),
+    VARCHAR - как коды словаря (int32). Фильтры, GROUP BY и даунсэмплинг считаются
+    векторно, без запросов к БД. Новые строки (id больше загруженного) дочитываются
+    по событию изменения таблицы; пока копия отстает от версии таблицы, запросы идут в БД.
+    Когда хранение удаляет старые данные (горизонт таблицы растет), строки раньше
+    горизонта вырезаются из колонок без перечитывания таблицы.
+
+    Для словарных колонок с малым числом значений (environment, status, ...) хранится
+    bitmap индекс: упакованный бит на строку для каждого значения. Фильтры по ним -
+    OR bitmap значений и AND между колонками по байтам, счетчики фасетов - popcount.
+    """
+
+    CHUNK_ROWS = 50000
+    # Колонка времени, к которой относится горизонт хранения таблицы
+    TIME_FIELD = 'timestamp'
+
+    def __init__(self, db_manager: DatabaseManager, table_name: str = 'server_metrics'):
+        self.db_manager = db_manager
+        self.table_name = table_name
+        self.enabled = np is not None
+        self.ready = False
+        self.version: Optional[str] = None
+        self.last_id = 0
+        self.size = 0
+        self.horizon = None
+        self.kinds: Dict[str, str] = {}
+        self.dictionaries: Dict[str, List[Any]] = {}
+        self._codes: Dict[str, Dict[Any, int]] = {}
+        self._columns: Dict[str, Any] = {}
+        # {колонка: {код значения: np.packbits маска строк}}
+        self._bitmaps: Dict[str, Dict[int, Any]] = {}
+        self._ids = None
+        self._task: Optional[asyncio.Task] = None
+        self._dirty = False
+        self._stats = {'loaded_rows': 0, 'appends': 0, 'queries': 0, 'load_seconds': None, 'errors': 0,
+                       'expired_rows': 0}
+        if self.enabled:
+            db_manager.on_table_change(self.on_table_change)
+
+    async def start(self, app=None):
+        """Загружает таблицу в фоне (подходит как обработчик app.on_startup)"""
+        if not self.enabled:
+            print("⚠️ NumPy не установлен, колоночное хранилище в памяти отключено")
+            return
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._sync())
+
+    async def stop(self, app=None):
+        """Останавливает загрузку (подходит как обработчик app.on_cleanup)"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def on_table_change(self, table_name: str, version: int):
+        """Событие изменения таблицы: дочитать новые строки"""
+        if table_name != self.table_name or self._task is None:
+            return
+        if self._task.done():
+            self._task = asyncio.ensure_future(self._sync())
+        else:
+            # Событие во время загрузки - после нее нужен еще один проход
+            self._dirty = True
+
+    @property
+    def is_current(self) -> bool:
+        """В памяти все изменения таблицы, о которых знает процесс"""
+        return self.ready and self.version == self.db_manager.get_table_version(self.table_name)
+
+    async def _sync(self):
+        while True:
+            self._dirty = False
+            try:
+                await self._load_new_rows()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self._stats['errors'] += 1
+                print(f"⚠️ Ошибка загрузки {self.table_name} в память: {e}")
+                return
+            if not self._dirty:
+                return
+
+    async def _load_new_rows(self):
+        started = time.monotonic()
+        # Версия до чтения: строки, записанные во время загрузки, дочитает следующий проход
+        version = self.db_manager.get_table_version(self.table_name)
+        if not self.kinds:
+            self._init_schema(await self.db_manager.get_column_types(self.table_name))
+            if not self.kinds:
+                return
+        horizon = self.db_manager.get_table_horizon(self.table_name)
+        if horizon is not None and (self.horizon is None or horizon > self.horizon):
+            self._drop_before(horizon)
+
+        columns = ', '.join(f'"{name}"' for name in self.kinds)
+        loaded = 0
+        async with self.db_manager.pool.acquire() as conn:
+            async with conn.transaction():
+                cursor = await conn.cursor(
+                    f'SELECT id, {columns} FROM "{self.table_name}" WHERE id > $1 ORDER BY id',
+                    self.last_id
+                )
+                while True:
+                    rows = await cursor.fetch(self.CHUNK_ROWS)
+                    if not rows:
+                        break
+                    self._append(rows)
+                    loaded += len(rows)
+
+        self.version = version
+        if not self.ready:
+            self.ready = True
+            self._stats['load_seconds'] = round(time.monotonic() - started, 3)
+            print(f"✅ {self.table_name} загружена в память: {self.size} строк, "
+                  f"{self.nbytes / 1024 / 1024:.1f} MB, {self._stats['load_seconds']} сек")
+        elif loaded:
+            self._stats['appends'] += 1
+        self._stats['loaded_rows'] += loaded
+
+    def _init_schema(self, column_types: Dict[str, str]):
+        for name, data_type in column_types.items():
+            if name == 'id':
+                continue
+            if data_type in TIME_TYPES:
+                self.kinds[name] = 'time'
+            elif data_type in INTEGER_TYPES:
+                self.kinds[name] = 'integer'
+            elif data_type in FLOAT_TYPES:
+                self.kinds[name] = 'float'
+            elif data_type in CATEGORY_TYPES:
+                self.kinds[name] = 'category'
+                self.dictionaries[name] = []
+                self._codes[name] = {}
+                self._bitmaps[name] = {}
+        for name, kind in self.kinds.items():
+            self._columns[name] = np.empty(0, dtype=self._dtype(kind))
+        self._ids = np.empty(0, dtype=np.int64)
+
+    def _append(self, rows: List[Any]):
+        count = len(rows)
+        new_size = self.size + count
+        if new_size > len(self._ids):
+            # Запас по емкости: дочитывание новых строк не копирует колонки каждый раз
+            capacity = max(new_size, int(len(self._ids) * 1.25))
+            self._ids = self._grow(self._ids, capacity)
+            for name in self._columns:
+                self._columns[name] = self._grow(self._columns[name], capacity)
+
+        self._ids[self.size:new_size] = [row[0] for row in rows]
+        for index, (name, kind) in enumerate(self.kinds.items(), start=1):
+            values = [row[index] for row in rows]
+            self._columns[name][self.size:new_size] = self._encode(name, kind, values)
+
+        self._update_bitmaps(self.size, new_size)
+        self.size = new_size
+        self.last_id = int(self._ids[new_size - 1])
+
+    def _drop_before(self, horizon):
+        """Вырезает строки со временем раньше горизонта (они удалены из таблицы хранением)"""
+        self.horizon = horizon
+        if not self.size or self.kinds.get(self.TIME_FIELD) != 'time':
+            return
+        keep = self.column(self.TIME_FIELD) >= self._epoch(horizon)
+        removed = self.size - int(keep.sum())
+        if not removed:
+            return
+
+        self._ids = self._ids[:self.size][keep]
+        for name in self._columns:
+            self._columns[name] = self._columns[name][:self.size][keep]
+        self.size = len(self._ids)
+        # Bitmap индексы - по новым позициям строк
+        for name in self._bitmaps:
+            self._bitmaps[name] = {}
+        self._update_bitmaps(0, self.size)
+        self._stats['expired_rows'] += removed
+
+    def _encode(self, name: str, kind: str, values: List[Any]):
+        if kind == 'time':
+            encoded = np.array(values, dtype='datetime64[us]')
+            # NULL (NaT) остается минимальным int64 и не попадает ни в один диапазон
+            return encoded.astype(np.int64)
+        if kind == 'category':
+            codes = self._codes[name]
+            dictionary = self.dictionaries[name]
+            encoded = []
+            for value in values:
+                code = codes.get(value)
+                if code is None:
+                    code = codes[value] = len(dictionary)
+                    dictionary.append(value)
+                encoded.append(code)
+            return np.array(encoded, dtype=np.int32)
+        # NULL в числовых колонках - NaN
+        return np.array([np.nan if value is None else value for value in values], dtype=np.float64)
+
+    def _update_bitmaps(self, old_size: int, new_size: int):
+        """Дописывает в bitmap индексы биты новых строк [old_size, new_size)"""
+        # Неполный последний байт пересчитывается целиком из колонки кодов
+        first_byte = old_size // 8
+        byte_count = (len(self._ids) + 7) // 8
+        for name in list(self._bitmaps):
+            cardinality = len(self.dictionaries[name])
+            if cardinality > BITMAP_MAX_CARDINALITY:
+                # Колонка оказалась высококардинальной - индекс был бы больше самой колонки
+                del self._bitmaps[name]
+                continue
+
+            codes = self._columns[name][first_byte * 8:new_size]
+            bitmaps = self._bitmaps[name]
+            for code in range(cardinality):
+                bitmap = bitmaps.get(code)
+                if bitmap is None:
+                    bitmap = bitmaps[code] = np.zeros(byte_count, dtype=np.uint8)
+                elif len(bitmap) < byte_count:
+                    bitmap = bitmaps[code] = self._grow_zeros(bitmap, byte_count)
+                packed = np.packbits(codes == code)
+                bitmap[first_byte:first_byte + len(packed)] = packed
+
+    @staticmethod
+    def _grow_zeros(array, capacity: int):
+        grown = np.zeros(capacity, dtype=array.dtype)
+        grown[:len(array)] = array
+        return grown
+
+    @staticmethod
+    def _dtype(kind: str):
+        return {'time': np.int64, 'integer': np.float64, 'float': np.float64, 'category': np.int32}[kind]
+
+    @staticmethod
+    def _grow(array, capacity: int):
+        grown = np.empty(capacity, dtype=array.dtype)
+        grown[:len(array)] = array
+        return grown
+
+    def column(self, name: str):
+        return self._columns[name][:self.size]
+
+    @property
+    def nbytes(self) -> int:
+        total = self._ids.nbytes if self._ids is not None else 0
+        total += sum(bitmap.nbytes for bitmaps in self._bitmaps.values() for bitmap in bitmaps.values())
+        return total + sum(array.nbytes for array in self._columns.values())
+
+    # --- запросы ---
+
+    @staticmethod
+    def config_fields(config: Dict[str, Any]) -> Optional[Set[str]]:
+        """Колонки, которые читает панель; None - если панель с пользовательскими выражениями"""
+        fields = {dimension.get('field') for dimension in config.get('dimensions') or []}
+        for measure in config.get('measures') or []:
+            if measure.get('expression'):
+                return None
+            if measure.get('aggregation', 'count') != 'count':
+                fields.add(measure.get('field'))
+            if measure.get('isStacked') and measure.get('categoryField'):
+                fields.add(measure['categoryField'])
+        return fields
+
+    def can_answer(self, table_name: str, fields: Optional[Set[str]], filters: Dict[str, Any] = None,
+                   date_range: Dict[str, Any] = None) -> bool:
+        """Запрос по колонкам, которые есть в памяти, и копия актуальна"""
+        if not self.enabled or table_name != self.table_name or fields is None or not self.is_current:
+            return False
+        fields = set(fields) | set(filters or {})
+        if date_range:
+            fields.add(date_range.get('field', 'timestamp'))
+        return all(field in self.kinds for field in fields)
+
+    def mask(self, filters: Dict[str, Any] = None, date_range: Dict[str, Any] = None,
+             parse_datetime: Callable[[Any], Any] = None):
+        """Булева маска строк (равенство или IN для списков, диапазон дат включительно)"""
+        bits, filters = self.filter_bits(filters)
+        if bits is not None:
+            selected = np.unpackbits(bits, count=self.size).view(bool)
+        else:
+            selected = np.ones(self.size, dtype=bool)
+
+        for name, value in filters.items():
+            encoded = self._encode_values(name, self._as_list(value), parse_datetime)
+            if self.kinds[name] == 'category':
+                # Коды словаря плотные: таблица принадлежности вместо isin (без сортировки)
+                lookup = np.zeros(len(self.dictionaries[name]) + 1, dtype=bool)
+                lookup[encoded] = True
+                lookup[-1] = False
+                selected &= lookup[self.column(name)]
+            else:
+                selected &= np.isin(self.column(name), encoded)
+
+        if date_range:
+            column = self.column(date_range.get('field', 'timestamp'))
+            if date_range.get('start'):
+                selected &= column >= self._epoch(parse_datetime(date_range['start']))
+            if date_range.get('end'):
+                selected &= column <= self._epoch(parse_datetime(date_range['end']))
+        return selected
+
+    def filter_bits(self, filters: Dict[str, Any] = None) -> Tuple[Any, Dict[str, Any]]:
+        """Пересечение bitmap фильтров по индексированным колонкам.
+
+        Возвращает (упакованные биты строк или None, фильтры без bitmap индекса).
+        """
+        bits = None
+        rest = {}
+        for name, value in (filters or {}).items():
+            if name not in self._bitmaps:
+                rest[name] = value
+                continue
+            value_bits = self._bitmap_union(name, self._encode_values(name, self._as_list(value), None))
+            bits = value_bits if bits is None else np.bitwise_and(bits, value_bits, out=bits)
+        return bits, rest
+
+    def _bitmap_union(self, name: str, codes):
+        byte_count = (self.size + 7) // 8
+        bitmaps = self._bitmaps[name]
+        union = np.zeros(byte_count, dtype=np.uint8)
+        for code in codes.tolist():
+            if code in bitmaps:
+                np.bitwise_or(union, bitmaps[code][:byte_count], out=union)
+        return union
+
+    def facet_counts(self, name: str, filters: Dict[str, Any] = None, date_range: Dict[str, Any] = None,
+                     parse_datetime: Callable[[Any], Any] = None) -> Dict[Any, int]:
+        """Число строк для каждого значения словарной колонки среди строк, прошедших фильтры"""
+        self._stats['queries'] += 1
+        dictionary = self.dictionaries[name]
+        bits, rest = self.filter_bits(filters)
+
+        if name in self._bitmaps and not rest and not date_range:
+            # Только bitmap фильтры: счетчик значения - popcount(bitmap значения AND фильтр)
+            byte_count = (self.size + 7) // 8
+            counts = []
+            for code in range(len(dictionary)):
+                bitmap = self._bitmaps[name][code][:byte_count]
+                if bits is not None:
+                    bitmap = np.bitwise_and(bitmap, bits)
+                counts.append(int(POPCOUNT[bitmap].sum(dtype=np.int64)))
+        else:
+            codes = self.column(name)
+            if filters or date_range:
+                codes = codes[self.mask(filters, date_range, parse_datetime)]
+            counts = np.bincount(codes, minlength=len(dictionary)).tolist()
+
+        return {value: count for value, count in zip(dictionary, counts) if count}
+
+    @staticmethod
+    def _as_list(value: Any) -> List[Any]:
+        return list(value) if isinstance(value, (list, tuple)) else [value]
+
+    def _encode_values(self, name: str, values: List[Any], parse_datetime: Callable[[Any], Any]):
+        kind = self.kinds[name]
+        if kind == 'category':
+            codes = self._codes[name]
+            # Значения, которых нет в словаре, не совпадут ни с одной строкой
+            return np.array([codes.get(str(v) if v is not None else None, -1) for v in values], dtype=np.int32)
+        if kind == 'time':
+            return np.array([self._epoch(parse_datetime(v)) for v in values], dtype=np.int64)
+        return np.array(values, dtype=np.float64)
+
+    @staticmethod
+    def _epoch(value) -> int:
+        return int(np.datetime64(value, 'us').astype(np.int64))
+
+    def aggregate(self, config: Dict[str, Any], compiled: Dict[str, Any], filters: Dict[str, Any] = None,
+                  date_range: Dict[str, Any] = None,
+                  parse_datetime: Callable[[Any], Any] = None) -> List[Dict[str, Any]]:
+        """GROUP BY панели по колонкам в памяти.
+
+        compiled - результат QueryEngine._compile_panel: имена групп и ключи мер совпадают
+        с SQL версией, значения - тех же типов (epoch для дат, float для числовых мер).
+        """
+        self._stats['queries'] += 1
+        rows = np.flatnonzero(self.mask(filters, date_range, parse_datetime))
+        granularities = {
+            dimension.get('field'): dimension.get('granularity', 'day')
+            for dimension in config.get('dimensions') or []
+        }
+
+        keys = []
+        for name, _ in compiled['groups']:
+            granularity = granularities.get(name, 'day') if self.kinds[name] == 'time' else None
+            keys.append((name, *self._group_key(name, rows, granularity)))
+
+        group_ids, group_count, key_indexes = self._group(keys, len(rows))
+
+        result_columns = {}
+        for (name, _, decode), key_index in zip(keys, key_indexes):
+            result_columns[name] = decode(key_index)
+
+        counts = np.bincount(group_ids, minlength=group_count)
+        measure_keys = [key for key, _ in compiled['measures']]
+        for key, measure in zip(measure_keys, config.get('measures') or []):
+            result_columns[key] = self._measure(measure, rows, group_ids, group_count, counts)
+
+        names = list(result_columns)
+        return [dict(zip(names, values)) for values in zip(*(result_columns[name] for name in names))]
+
+    def _group_key(self, name: str, rows, granularity: Optional[str]) -> Tuple[Any, Callable]:
+        """(плотные целые коды группы >= 0, функция коды -> значения результата)"""
+        values = self.column(name)[rows]
+        kind = self.kinds[name]
+
+        if kind == 'category':
+            dictionary = self.dictionaries[name]
+            return values, lambda codes: [dictionary[code] for code in codes.tolist()]
+
+        if kind == 'time':
+            if granularity in CALENDAR_UNITS:
+                unit = CALENDAR_UNITS[granularity]
+                periods = values.astype('datetime64[us]').astype(f'datetime64[{unit}]').astype(np.int64)
+                origin = int(periods.min()) if len(periods) else 0
+
+                def decode(codes):
+                    periods = (codes + origin).astype(f'datetime64[{unit}]')
+                    return periods.astype('datetime64[s]').astype(np.int64).tolist()
+                return periods - origin, decode
+
+            step = FIXED_GRANULARITY_SECONDS[granularity]
+            shift = WEEK_ORIGIN if granularity == 'week' else 0
+            buckets = (values // US_PER_SECOND - shift) // step
+            origin = int(buckets.min()) if len(buckets) else 0
+            return buckets - origin, lambda codes: ((codes + origin) * step + shift).tolist()
+
+        # Числовая колонка как группа: коды - номера уникальных значений
+        uniques, inverse = np.unique(values, return_inverse=True)
+        if kind == 'integer':
+            return inverse, lambda codes: uniques[codes].astype(np.int64).tolist()
+        return inverse, lambda codes: uniques[codes].tolist()
+
+    @staticmethod
+    def _group(keys: List[Tuple[str, Any, Callable]], row_count: int) -> Tuple[Any, int, List[Any]]:
+        """Номер группы каждой строки, число групп и коды ключей каждой группы"""
+        if not keys:
+            # Без размерностей - одна группа (как SELECT без GROUP BY), даже если строк нет
+            return np.zeros(row_count, dtype=np.int64), 1, []
+
+        cardinalities = [int(codes.max()) + 1 if len(codes) else 1 for _, codes, _ in keys]
+        composite = np.zeros(row_count, dtype=np.int64)
+        for (_, codes, _), cardinality in zip(keys, cardinalities):
+            composite = composite * cardinality + codes
+
+        space = 1
+        for cardinality in cardinalities:
+            space *= cardinality
+        if space <= DENSE_GROUP_LIMIT:
+            present = np.flatnonzero(np.bincount(composite, minlength=space))
+            remap = np.empty(space, dtype=np.int64)
+            remap[present] = np.arange(len(present))
+            group_ids = remap[composite]
+        else:
+            present, group_ids = np.unique(composite, return_inverse=True)
+
+        key_indexes = []
+        remainder = present
+        for cardinality in reversed(cardinalities):
+            key_indexes.append(remainder % cardinality)
+            remainder = remainder // cardinality
+        key_indexes.reverse()
+        return group_ids, len(present), key_indexes
+
+    def _measure(self, measure: Dict[str, Any], rows, group_ids, group_count: int, counts) -> List[Any]:
+        aggregation = measure.get('aggregation', 'count')
+        if aggregation == 'count':
+            return counts.tolist()
+
+        name = measure.get('field')
+        kind = self.kinds[name]
+        values = self.column(name)[rows]
+
+        if kind != 'category':
+            # NULL (NaN, NaT) в агрегатах не участвует, как в SQL
+            present = values != NAT if kind == 'time' else ~np.isnan(values)
+            if not present.all():
+                values, group_ids = values[present], group_ids[present]
+                counts = np.bincount(group_ids, minlength=group_count)
+
+        if aggregation == 'count_distinct':
+            if kind == 'category':
+                value_codes, cardinality = values, max(len(self.dictionaries[name]), 1)
+            else:
+                _, value_codes = np.unique(values, return_inverse=True)
+                cardinality = int(value_codes.max()) + 1 if len(value_codes) else 1
+            pairs = group_ids * cardinality + value_codes
+            if group_count * cardinality <= DENSE_GROUP_LIMIT:
+                seen = np.bincount(pairs, minlength=group_count * cardinality) > 0
+                return seen.reshape(group_count, cardinality).sum(axis=1).tolist()
+            return np.bincount(np.unique(pairs) // cardinality, minlength=group_count).tolist()
+
+        if aggregation in ('sum', 'avg'):
+            sums = np.bincount(group_ids, weights=values, minlength=group_count)
+            if aggregation == 'sum':
+                return self._nullify(sums, counts)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                return self._nullify(sums / counts, counts)
+
+        # min/max: для словарных колонок сравниваются значения, а не коды
+        if kind == 'category':
+            dictionary = self.dictionaries[name]
+            order = np.argsort(np.array(dictionary, dtype=object)).astype(np.int32)
+            rank = np.empty(len(order), dtype=np.int32)
+            rank[order] = np.arange(len(order), dtype=np.int32)
+            extreme = self._reduce(aggregation, rank[values], group_ids, group_count, np.int64)
+            return [dictionary[order[value]] if count else None for value, count in zip(extreme.tolist(), counts)]
+
+        dtype = np.int64 if kind == 'time' else np.float64
+        extreme = self._reduce(aggregation, values, group_ids, group_count, dtype)
+        if kind == 'time':
+            # Секунды epoch с округлением, как EXTRACT(EPOCH FROM ...)::bigint в SQL
+            extreme[counts == 0] = 0
+            extreme = (extreme + US_PER_SECOND // 2) // US_PER_SECOND
+            return [value if count else None for value, count in zip(extreme.tolist(), counts)]
+        return self._nullify(extreme, counts)
+
+    @staticmethod
+    def _reduce(aggregation: str, values, group_ids, group_count: int, dtype):
+        if aggregation == 'min':
+            initial = np.iinfo(dtype).max if dtype == np.int64 else np.inf
+            result = np.full(group_count, initial, dtype=dtype)
+            np.minimum.at(result, group_ids, values.astype(dtype))
+        else:
+            initial = np.iinfo(dtype).min if dtype == np.int64 else -np.inf
+            result = np.full(group_count, initial, dtype=dtype)
+            np.maximum.at(result, group_ids, values.astype(dtype))
+        return result
+
+    @staticmethod
+    def _nullify(values, counts) -> List[Optional[float]]:
+        """Агрегат пустой группы - NULL, как в SQL"""
+        return [value if count else None for value, count in zip(values.tolist(), counts.tolist())]
+
+    def downsample_rows(self, plan: Dict[str, Any], filters: Dict[str, Any] = None,
+                        date_range: Dict[str, Any] = None,
+                        parse_datetime: Callable[[Any], Any] = None) -> List[Dict[str, Any]]:
+        """Строки как у SQL даунсэмплинга (build_downsample_query), посчитанные в памяти.
+
+        minmax: s, t, vmin, vmax, vavg, cnt по корзинам; lttb: s, t, v - точки min и max корзин.
+        """
+        self._stats['queries'] += 1
+        selected = self.mask(filters, date_range, parse_datetime)
+        # Секунды epoch с дробной частью, как EXTRACT(EPOCH FROM ...)::double precision
+        t = self.column(plan['time_field'])[selected] / US_PER_SECOND
+        v = self.column(plan['measure'])[selected]
+        keep = ~np.isnan(v)
+        t, v = t[keep], v[keep]
+        if not len(t):
+            return []
+
+        series_field = plan['series_field']
+        if series_field:
+            series_codes = self.column(series_field)[selected][keep].astype(np.int64)
+            # Как и в SQL пути - отказ до построения точек
+            max_series = plan.get('max_series')
+            if max_series is not None and len(np.unique(series_codes)) > max_series:
+                raise ValueError(f"Слишком много серий (> {max_series}), добавьте фильтры")
+        else:
+            series_codes = np.zeros(len(t), dtype=np.int64)
+
+        # width_bucket(t, lo, hi, buckets): 1..buckets, t = hi попадает в buckets + 1
+        buckets = plan['buckets']
+        lo = t.min()
+        hi = max(t.max(), lo + 1)
+        bucket = np.minimum(np.floor((t - lo) / (hi - lo) * buckets).astype(np.int64) + 1, buckets + 1)
+        group_ids, group_count, (series_index, _) = self._group(
+            [('s', series_codes, None), ('bucket', bucket, None)], len(t)
+        )
+        series_values = self._series_values(series_field, series_index)
+
+        if plan['method'] == 'minmax':
+            counts = np.bincount(group_ids, minlength=group_count)
+            result = {
+                's': series_values,
+                't': self._reduce('min', t, group_ids, group_count, np.float64),
+                'vmin': self._reduce('min', v, group_ids, group_count, np.float64),
+                'vmax': self._reduce('max', v, group_ids, group_count, np.float64),
+                'vavg': np.bincount(group_ids, weights=v, minlength=group_count) / counts,
+                'cnt': counts,
+            }
+            return self._sorted_rows(result)
+
+        # Точка минимума и максимума каждой корзины (при равных значениях - самая ранняя)
+        points = []
+        for aggregation in ('min', 'max'):
+            extreme = self._reduce(aggregation, v, group_ids, group_count, np.float64)
+            at_extreme = v == extreme[group_ids]
+            first_t = np.full(group_count, np.inf)
+            np.minimum.at(first_t, group_ids[at_extreme], t[at_extreme])
+            points.append((first_t, extreme))
+
+        (min_t, min_v), (max_t, max_v) = points
+        distinct = max_t != min_t
+        result = {
+            's': series_values + [value for value, flag in zip(series_values, distinct.tolist()) if flag],
+            't': np.concatenate([min_t, max_t[distinct]]),
+            'v': np.concatenate([min_v, max_v[distinct]]),
+        }
+        return self._sorted_rows(result)
+
+    def _series_values(self, series_field: Optional[str], series_index) -> List[Any]:
+        if not series_field:
+            return [None] * len(series_index)
+        if self.kinds[series_field] == 'category':
+            dictionary = self.dictionaries[series_field]
+            return [dictionary[code] for code in series_index.tolist()]
+        return series_index.tolist()
+
+    @staticmethod
+    def _sorted_rows(columns: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Строки в порядке ORDER BY s, t"""
+        names = list(columns)
+        values = [column.tolist() if hasattr(column, 'tolist') else column for column in columns.values()]
+        rows = [dict(zip(names, row)) for row in zip(*values)]
+        rows.sort(key=lambda row: (row['s'] is None, row['s'] if row['s'] is not None else '', row['t']))
+        return rows
+
+    def select(self, filters: Dict[str, Any] = None, limit: int = None,
+               parse_datetime: Callable[[Any], Any] = None) -> List[Dict[str, Any]]:
+        """Строки таблицы по фильтрам (как get_filtered_data, без колонки id)"""
+        self._stats['queries'] += 1
+        rows = np.flatnonzero(self.mask(filters, parse_datetime=parse_datetime))
+        if limit:
+            rows = rows[:int(limit)]
+
+        columns = {}
+        for name, kind in self.kinds.items():
+            values = self.column(name)[rows]
+            if kind == 'time':
+                columns[name] = values.astype('datetime64[us]').tolist()
+            elif kind == 'category':
+                columns[name] = np.array(self.dictionaries[name], dtype=object)[values].tolist()
+            elif kind == 'integer':
+                # NaN - NULL
+                columns[name] = [None if value != value else int(value) for value in values.tolist()]
+            else:
+                columns[name] = [None if value != value else value for value in values.tolist()]
+
+        names = list(columns)
+        return [dict(zip(names, row)) for row in zip(*(columns[name] for name in names))]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self._stats,
+            'enabled': self.enabled,
+            'ready': self.ready,
+            'current': self.is_current if self.enabled else False,
+            'table': self.table_name,
+            'rows': self.size,
+            'columns': len(self.kinds),
+            'bytes': self.nbytes if self.enabled else 0,
+            'bitmap_columns': {name: len(bitmaps) for name, bitmaps in self._bitmaps.items()},
+            'version': self.version,
+            'horizon': self.horizon.isoformat() if self.horizon else None,
+        }
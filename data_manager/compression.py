@@ -0,0 +1,114 @@
+import asyncio
+import gzip
+import zlib
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Tuple, Union
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+# Кодировщики для предварительного сжатия (brotli/zstd - если установлены)
+ENCODERS: Dict[str, Callable[[bytes], bytes]] = {
+    'gzip': lambda content: gzip.compress(content, compresslevel=6),
+}
+if brotli is not None:
+    ENCODERS['br'] = lambda content: brotli.compress(content, quality=5)
+if zstandard is not None:
+    ENCODERS['zstd'] = lambda content: zstandard.ZstdCompressor(level=6).compress(content)
+
+# Порядок предпочтения сервера при одинаковом q в Accept-Encoding
+ENCODING_PREFERENCE = ['br', 'zstd', 'gzip']
+
+# Сжатие на лету (compress_middleware): кодировки zlib в порядке предпочтения
+ON_THE_FLY_ENCODINGS = ['gzip', 'deflate']
+
+
+def parse_accept_encoding(accept_encoding: str) -> Dict[str, float]:
+    """Разбирает Accept-Encoding в {кодировка: q}"""
+    weights = {}
+    for part in accept_encoding.lower().split(','):
+        name, _, params = part.strip().partition(';')
+        if not name:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        weights[name.strip()] = q
+    return weights
+
+
+def negotiate_encoding(accept_encoding: str, available,
+                       preference: List[str] = ENCODING_PREFERENCE) -> Optional[str]:
+    """Выбирает лучшую доступную кодировку или None (без сжатия); при равных q - по preference"""
+    weights = parse_accept_encoding(accept_encoding)
+    candidates = [
+        (weights.get(name, weights.get('*', 0.0)), -preference.index(name), name)
+        for name in preference
+        if name in available
+    ]
+    candidates = [candidate for candidate in candidates if candidate[0] > 0]
+    if not candidates:
+        return None
+    return max(candidates)[2]
+
+
+class StreamCompressor:
+    """gzip/deflate для потоковых ответов: каждая порция сбрасывается (Z_SYNC_FLUSH).
+
+    Сжатие StreamResponse в aiohttp копит данные в zlib до write_eof - клиент не получил бы
+    первые строки, пока не прочитана вся выборка.
+    """
+
+    def __init__(self, encoding: str, level: int = 6):
+        wbits = 16 + zlib.MAX_WBITS if encoding == 'gzip' else zlib.MAX_WBITS
+        self.encoding = encoding
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, wbits)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+
+@dataclass
+class PrecompressedBody:
+    """Тело ответа вместе с заранее сжатыми вариантами (строится один раз при заполнении кеша)"""
+    content: bytes
+    variants: Dict[str, bytes] = field(default_factory=dict)
+
+    @classmethod
+    def build(cls, content: Union[str, bytes]) -> 'PrecompressedBody':
+        """Сжимает тело всеми доступными кодировщиками (CPU-bound, вызывать в executor)"""
+        if isinstance(content, str):
+            content = content.encode('utf-8')
+        return cls(content=content, variants={name: encode(content) for name, encode in ENCODERS.items()})
+
+    def select(self, accept_encoding: str) -> Tuple[Optional[str], bytes]:
+        """Возвращает (Content-Encoding или None, тело) под Accept-Encoding клиента"""
+        encoding = negotiate_encoding(accept_encoding, self.variants)
+        if encoding is None:
+            return None, self.content
+        return encoding, self.variants[encoding]
+
+    @property
+    def size_bytes(self) -> int:
+        return len(self.content) + sum(len(variant) for variant in self.variants.values())
+
+
+async def precompress(content: Union[str, bytes]) -> PrecompressedBody:
+    """Строит PrecompressedBody в executor - сжатие CPU-bound и не должно блокировать event loop"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, PrecompressedBody.build, content)
@@ -1,14 +1,55 @@
 import asyncio
 import asyncpg
+from contextlib import asynccontextmanager
 from datetime import datetime, timedelta
-from typing import List, Dict, Any
+from itertools import islice
+from typing import (List, Dict, Any, AsyncIterable, AsyncIterator, Awaitable, Callable, Iterable, Iterator,
+                    Optional, Tuple, Union)
+import base64
 import json
+import operator
+import time
+
+from .catalog import CATALOG_QUERY, SCHEMA_EVENTS_FUNCTION, SCHEMA_EVENT_TRIGGERS, TableSchema
+from .models import CompactData, EncodedRows
 
 
 class DatabaseManager:
+    # Размер страницы keyset пагинации (ограничивается на сервере)
+    DEFAULT_PAGE_SIZE = 5000
+    MAX_PAGE_SIZE = 20000
+    # Строк в одной порции COPY (insert_data)
+    COPY_BATCH_SIZE = 10000
+    # Строк в одной порции JSON, собираемой PostgreSQL (compact_snapshot)
+    ENCODED_CHUNK_ROWS = 10000
+    # По стольким первым строкам выборки выбираются словарные колонки (compact_snapshot)
+    DICTIONARY_PROFILE_ROWS = 10000
+
+    # Канал LISTEN/NOTIFY для событий изменения таблиц
+    TABLE_CHANGES_CHANNEL = 'table_changes'
+    LISTEN_RETRY_SECONDS = 5
+    # Как часто (не чаще) перечитывать оценки числа строк из pg_class после записей
+    CATALOG_REFRESH_SECONDS = 60
+
     def __init__(self, db_url: str):
         self.db_url = db_url
         self.pool = None
+        # Версии данных таблиц из table_versions: общие для всех процессов (используются для ETag и кеша)
+        self.table_versions: Dict[str, int] = {}
+        self._table_change_callbacks: List[Callable[[str, int], None]] = []
+        # Подписчики на изменения схемы таблиц (после перечитывания каталога)
+        self._schema_change_callbacks: List[Callable[[str], None]] = []
+        # Хуки записи: выполняются в транзакции insert_data после вставки (например, rollup)
+        self._write_hooks: Dict[str, List[Callable[[Any], Awaitable[Any]]]] = {}
+        # Хуки порций: перед COPY каждой порции получают границы значений колонки (например, создание секций)
+        self._batch_hooks: Dict[str, List[Tuple[str, Callable[[Any, Any, Any], Awaitable[Any]]]]] = {}
+        # Горизонт таблиц: строки с временем раньше горизонта удалены (хранение, PartitionManager)
+        self.table_horizons: Dict[str, datetime] = {}
+        self._listener_task: Optional[asyncio.Task] = None
+        # Каталог схемы: загружается при подключении, перечитывается по событиям DDL
+        self.catalog: Dict[str, TableSchema] = {}
+        self._catalog_refreshed_at = 0.0
+        self._catalog_task: Optional[asyncio.Task] = None
 
     async def connect(self):
         """Устанавливает соединение с базой данных"""
@@ -21,6 +62,9 @@ class DatabaseManager:
                 command_timeout=60
             )
             await self._ensure_tables()
+            await self.load_catalog()
+            await self.load_table_versions()
+            await self.listen_table_changes()
             print("✅ Подключение к базе данных установлено")
         except Exception as e:
             print(f"❌ Ошибка подключения к базе: {e}")
@@ -46,79 +90,97 @@ class DatabaseManager:
         """Создает все необходимые таблицы"""
         await self._ensure_data_table()
         await self._ensure_layout_table()
+        await self._ensure_versions_table()
+        await self._ensure_schema_events()
 
     async def _ensure_data_table(self):
         """Создает таблицу для данных если не существует"""
         async with self.pool.acquire() as conn:
-            # Таблица серверных данных
-            await conn.execute('''
-                CREATE TABLE IF NOT EXISTS server_metrics (
-                    id SERIAL PRIMARY KEY,
-                    timestamp TIMESTAMP NOT NULL,
-                    server_name VARCHAR(50) NOT NULL,
-                    server_ip VARCHAR(15) NOT NULL,
-                    server_zone VARCHAR(20) NOT NULL,
-                    server_type VARCHAR(20) NOT NULL,
-                    service_name VARCHAR(20) NOT NULL,
-                    environment VARCHAR(20) NOT NULL,
-                    os_type VARCHAR(10) NOT NULL,
-
-                    -- Даты
-                    install_date TIMESTAMP NOT NULL,
-                    last_update_date TIMESTAMP NOT NULL,
-                    next_maintenance_date TIMESTAMP NOT NULL,
-                    last_backup_date TIMESTAMP NOT NULL,
-                    certificate_expiry_date TIMESTAMP NOT NULL,
-
-                    -- Временные метрики (в днях)
-                    days_since_install INTEGER NOT NULL,
-                    days_since_last_update INTEGER NOT NULL,
-                    days_until_maintenance INTEGER NOT NULL,
-                    days_since_last_backup INTEGER NOT NULL,
-                    days_until_cert_expiry INTEGER NOT NULL,
-
-                    -- Ресурсы
-                    cpu_usage DECIMAL(5,2) NOT NULL,
-                    memory_usage DECIMAL(5,2) NOT NULL,
-                    disk_usage DECIMAL(5,2) NOT NULL,
-                    network_in INTEGER NOT NULL,
-                    network_out INTEGER NOT NULL,
-
-                    -- Производительность
-                    response_time DECIMAL(8,2) NOT NULL,
-                    requests_per_second INTEGER NOT NULL,
-                    error_rate DECIMAL(5,2) NOT NULL,
-
-                    -- Бизнес метрики
-                    revenue_impact DECIMAL(10,2) NOT NULL,
-                    user_sessions INTEGER NOT NULL,
-                    throughput INTEGER NOT NULL,
-
-                    -- Статус
-                    status VARCHAR(10) NOT NULL,
-                    uptime_days INTEGER NOT NULL,
-                    last_maintenance TIMESTAMP NOT NULL,
-
-                    -- Индексы для быстрого поиска
-                    CONSTRAINT unique_server_timestamp UNIQUE (server_name, timestamp)
-                )
-            ''')
-
-            # Индексы для ускорения запросов
-            indexes = [
-                'CREATE INDEX IF NOT EXISTS idx_timestamp ON server_metrics(timestamp)',
-                'CREATE INDEX IF NOT EXISTS idx_server_name ON server_metrics(server_name)',
-                'CREATE INDEX IF NOT EXISTS idx_service_name ON server_metrics(service_name)',
-                'CREATE INDEX IF NOT EXISTS idx_environment ON server_metrics(environment)',
-                'CREATE INDEX IF NOT EXISTS idx_status ON server_metrics(status)',
-                'CREATE INDEX IF NOT EXISTS idx_zone ON server_metrics(server_zone)'
-            ]
-
-            for index_sql in indexes:
-                await conn.execute(index_sql)
-
+            await self.create_data_table(conn)
             print("✅ Таблица server_metrics создана/проверена")
 
+    async def create_data_table(self, conn):
+        """Создает server_metrics, секционированную по диапазонам timestamp, с индексами и секцией по умолчанию.
+
+        Секции по периодам создает PartitionManager; строки вне созданных секций попадают
+        в секцию по умолчанию. Ключи уникальности включают ключ секционирования (timestamp).
+        Существующая таблица не меняется (несекционированную переносит PartitionManager).
+        """
+        # Таблица серверных данных
+        await conn.execute('''
+            CREATE TABLE IF NOT EXISTS server_metrics (
+                id SERIAL,
+                timestamp TIMESTAMP NOT NULL,
+                server_name VARCHAR(50) NOT NULL,
+                server_ip VARCHAR(15) NOT NULL,
+                server_zone VARCHAR(20) NOT NULL,
+                server_type VARCHAR(20) NOT NULL,
+                service_name VARCHAR(20) NOT NULL,
+                environment VARCHAR(20) NOT NULL,
+                os_type VARCHAR(10) NOT NULL,
+
+                -- Даты
+                install_date TIMESTAMP NOT NULL,
+                last_update_date TIMESTAMP NOT NULL,
+                next_maintenance_date TIMESTAMP NOT NULL,
+                last_backup_date TIMESTAMP NOT NULL,
+                certificate_expiry_date TIMESTAMP NOT NULL,
+
+                -- Временные метрики (в днях)
+                days_since_install INTEGER NOT NULL,
+                days_since_last_update INTEGER NOT NULL,
+                days_until_maintenance INTEGER NOT NULL,
+                days_since_last_backup INTEGER NOT NULL,
+                days_until_cert_expiry INTEGER NOT NULL,
+
+                -- Ресурсы
+                cpu_usage DECIMAL(5,2) NOT NULL,
+                memory_usage DECIMAL(5,2) NOT NULL,
+                disk_usage DECIMAL(5,2) NOT NULL,
+                network_in INTEGER NOT NULL,
+                network_out INTEGER NOT NULL,
+
+                -- Производительность
+                response_time DECIMAL(8,2) NOT NULL,
+                requests_per_second INTEGER NOT NULL,
+                error_rate DECIMAL(5,2) NOT NULL,
+
+                -- Бизнес метрики
+                revenue_impact DECIMAL(10,2) NOT NULL,
+                user_sessions INTEGER NOT NULL,
+                throughput INTEGER NOT NULL,
+
+                -- Статус
+                status VARCHAR(10) NOT NULL,
+                uptime_days INTEGER NOT NULL,
+                last_maintenance TIMESTAMP NOT NULL,
+
+                -- Индексы для быстрого поиска (id - для дочитывания по watermark)
+                CONSTRAINT server_metrics_pkey PRIMARY KEY (id, timestamp),
+                CONSTRAINT unique_server_timestamp UNIQUE (server_name, timestamp)
+            ) PARTITION BY RANGE (timestamp)
+        ''')
+
+        # Индексы для ускорения запросов (на секционированной таблице создаются в каждой секции)
+        indexes = [
+            'CREATE INDEX IF NOT EXISTS idx_timestamp ON server_metrics(timestamp)',
+            'CREATE INDEX IF NOT EXISTS idx_server_name ON server_metrics(server_name)',
+            'CREATE INDEX IF NOT EXISTS idx_service_name ON server_metrics(service_name)',
+            'CREATE INDEX IF NOT EXISTS idx_environment ON server_metrics(environment)',
+            'CREATE INDEX IF NOT EXISTS idx_status ON server_metrics(status)',
+            'CREATE INDEX IF NOT EXISTS idx_zone ON server_metrics(server_zone)',
+            'CREATE INDEX IF NOT EXISTS idx_os_type ON server_metrics(os_type)',
+            # Поиск по началу имени (prefix в фильтрах) - побайтовое сравнение
+            'CREATE INDEX IF NOT EXISTS idx_server_name_pattern ON server_metrics(server_name text_pattern_ops)'
+        ]
+
+        for index_sql in indexes:
+            await conn.execute(index_sql)
+
+        relkind = await conn.fetchval("SELECT relkind FROM pg_class WHERE oid = to_regclass('server_metrics')")
+        if relkind == 'p':
+            await conn.execute('CREATE TABLE IF NOT EXISTS server_metrics_default PARTITION OF server_metrics DEFAULT')
+
     async def _ensure_layout_table(self):
         """Создает таблицу для хранения layout конфигураций"""
         async with self.pool.acquire() as conn:
@@ -146,6 +208,39 @@ class DatabaseManager:
 
             print("✅ Таблица dashboard_layouts создана/проверена")
 
+    async def _ensure_versions_table(self):
+        """Создает таблицу версий данных (счетчик изменений каждой таблицы)"""
+        async with self.pool.acquire() as conn:
+            await conn.execute('''
+                CREATE TABLE IF NOT EXISTS table_versions (
+                    table_name VARCHAR(100) PRIMARY KEY,
+                    version BIGINT NOT NULL DEFAULT 0,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            await conn.execute('ALTER TABLE table_versions ADD COLUMN IF NOT EXISTS horizon TIMESTAMP')
+
+    async def _ensure_schema_events(self):
+        """Событийные триггеры DDL: изменения схемы таблиц публикуются в table_changes"""
+        async with self.pool.acquire() as conn:
+            try:
+                async with conn.transaction():
+                    await conn.execute(SCHEMA_EVENTS_FUNCTION)
+                    existing = await conn.fetch(
+                        'SELECT evtname FROM pg_event_trigger WHERE evtname = ANY($1::text[])',
+                        list(SCHEMA_EVENT_TRIGGERS)
+                    )
+                    existing = {row['evtname'] for row in existing}
+                    for name, event in SCHEMA_EVENT_TRIGGERS.items():
+                        if name not in existing:
+                            await conn.execute(
+                                f'CREATE EVENT TRIGGER {name} ON {event} EXECUTE FUNCTION notify_schema_change()'
+                            )
+            except asyncpg.PostgresError as e:
+                # Событийные триггеры создает только суперпользователь
+                print(f"⚠️ Триггеры изменения схемы не созданы ({e}); "
+                      f"каталог обновится при перезапуске или DatabaseManager.load_catalog()")
+
     async def save_layout(self, dashboard_id: str, name: str, config: dict) -> bool:
         """Сохраняет layout конфигурацию в БД"""
         async with self.pool.acquire() as conn:
@@ -177,6 +272,8 @@ class DatabaseManager:
 
                 print(f"💾 [DB] Execute result: {result}")
 
+                await self.publish_table_change(conn, 'dashboard_layouts')
+
                 # Проверяем что данные действительно сохранились
                 verify_row = await conn.fetchrow('''
                     SELECT dashboard_id, name, is_active,
@@ -250,27 +347,362 @@ class DatabaseManager:
             ''')
             return [dict(row) for row in rows]
 
-    async def insert_data(self, table_name: str, data: List[Dict[str, Any]]):
-        """Вставляет данные в таблицу (динамически определяет колонки)"""
-        if not data:
+    async def insert_data(self, table_name: str, data: Union[Iterable[Any], AsyncIterable[Any]],
+                          columns: List[str] = None, batch_size: int = None, parallel: int = 1,
+                          bounds: Dict[str, Tuple[Any, Any]] = None) -> int:
+        """Загружает строки в таблицу бинарным COPY порциями по batch_size (динамически определяет колонки).
+
+        data - список, итератор или асинхронный итератор строк: dict (колонки берутся из первой
+        строки) или кортежи в порядке columns. В памяти держится только текущая порция.
+        parallel > 1 - порции копируются параллельно через соединения пула; каждая порция
+        фиксируется отдельно (загрузка не атомарна), хуки записи и событие изменения - после всех порций.
+        bounds - {колонка: (минимум, максимум)} всех строк, если известны: хуки порций вызываются
+        один раз до загрузки, а не перед каждой порцией (DDL хука не идет параллельно с COPY).
+        Возвращает число загруженных строк.
+        """
+        batch_size = max(1, int(batch_size or self.COPY_BATCH_SIZE))
+        rows = aiter(data) if hasattr(data, '__aiter__') else iter(data)
+        first_row = await anext(rows, None) if hasattr(rows, '__anext__') else next(rows, None)
+        if first_row is None:
+            return 0
+
+        if columns is None:
+            # Определяем колонки из первого элемента
+            columns = list(first_row.keys())
+            getter = operator.itemgetter(*columns)
+            to_record = getter if len(columns) > 1 else (lambda row: (getter(row),))
+            sample = first_row
+        else:
+            columns = list(columns)
+            to_record = tuple
+            sample = dict(zip(columns, first_row))
+        batches = self._record_batches(first_row, rows, to_record, batch_size)
+
+        # Создаем таблицу если ее нет в каталоге
+        if table_name not in self.catalog:
+            async with self.pool.acquire() as conn:
+                await self._create_table_if_not_exists(conn, table_name, sample)
+                self.catalog.update(await self._fetch_catalog(conn, [table_name]))
+        self.catalog[table_name].check_columns(columns)
+        if bounds:
+            async with self.pool.acquire() as conn:
+                await self._run_batch_hooks(conn, table_name, bounds)
+        # Колонки хуков порций и их позиции в кортежах
+        bounded = [column for column, _ in self._batch_hooks.get(table_name, []) if column in columns]
+        positions = {column: columns.index(column) for column in bounded if not bounds}
+
+        async def copy(conn, batch: List[tuple]) -> int:
+            if positions:
+                await self._run_batch_hooks(conn, table_name, {
+                    column: self._value_bounds(record[index] for record in batch)
+                    for column, index in positions.items()
+                })
+            await conn.copy_records_to_table(table_name, records=batch, columns=columns)
+            return len(batch)
+
+        return await self._write_batches(table_name, batches, copy, parallel)
+
+    async def copy_binary(self, table_name: str, columns: List[str],
+                          chunks: Union[Iterable[bytes], AsyncIterable[bytes]], parallel: int = 1,
+                          bounds: Dict[str, Tuple[Any, Any]] = None) -> int:
+        """Загружает готовые порции COPY BINARY (например, DataGenerator.iter_copy_chunks).
+
+        Каждая порция - полный поток COPY (заголовок, строки, окончание) для колонок columns.
+        Порции синхронного итератора получаются в потоке, чтобы их подготовка не останавливала
+        цикл событий. Транзакция, хуки записи и событие изменения - как в insert_data.
+        bounds - {колонка: (минимум, максимум)} всех порций: байты порций не разбираются,
+        поэтому хуки порций вызываются один раз до загрузки (например, секции создаются заранее).
+        """
+        (await self.get_table_schema(table_name)).check_columns(columns)
+        if bounds:
+            async with self.pool.acquire() as conn:
+                await self._run_batch_hooks(conn, table_name, bounds)
+
+        async def copy(conn, payload: bytes) -> int:
+            async def source():
+                yield payload
+            status = await conn.copy_to_table(table_name, source=source(), columns=columns, format='binary')
+            return int(status.split()[-1])
+
+        return await self._write_batches(table_name, self._aiter_offloaded(chunks), copy, parallel)
+
+    @staticmethod
+    async def _aiter_offloaded(items: Union[Iterable[Any], AsyncIterable[Any]]) -> AsyncIterator[Any]:
+        if hasattr(items, '__aiter__'):
+            async for item in items:
+                yield item
             return
+        iterator = iter(items)
+        try:
+            while True:
+                item = await asyncio.to_thread(next, iterator, None)
+                if item is None:
+                    return
+                yield item
+        finally:
+            # Генератор порций (например, с пулом процессов) закрывается и при ошибке записи
+            if hasattr(iterator, 'close'):
+                await asyncio.to_thread(iterator.close)
+
+    async def _write_batches(self, table_name: str, batches: AsyncIterator[Any],
+                             copy: Callable[[Any, Any], Awaitable[int]], parallel: int = 1) -> int:
+        """Записывает порции copy(conn, batch) -> число строк; хуки записи и событие изменения - в конце.
+
+        parallel > 1 - порции пишутся параллельно через соединения пула и фиксируются по отдельности.
+        """
+        parallel = max(1, min(int(parallel or 1), self.pool.get_max_size() - 1))
+        error = None
 
-        # Определяем колонки из первого элемента
-        first_row = data[0]
-        columns = list(first_row.keys())
-        placeholders = [f"${i + 1}" for i in range(len(columns))]
+        async with self.pool.acquire() as conn:
+            # Вставка, хуки записи и событие изменения в одной транзакции: NOTIFY уходит только после COMMIT
+            async with conn.transaction():
+                if table_name in self._write_hooks or table_name in self._batch_hooks:
+                    await self.lock_table_writes(conn, table_name)
+                if parallel == 1:
+                    inserted = 0
+                    async for batch in batches:
+                        inserted += await copy(conn, batch)
+                else:
+                    # Порции уже зафиксированы рабочими соединениями: хуки и событие нужны и при ошибке
+                    try:
+                        inserted = await self._copy_parallel(batches, copy, parallel)
+                    except Exception as e:
+                        error, inserted = e, 0
+                for hook in self._write_hooks.get(table_name, []):
+                    await hook(conn)
+                version = await self.publish_table_change(conn, table_name, apply=False)
+
+        self._apply_table_version(table_name, version)
+        if error is not None:
+            raise error
+        return inserted
+
+    async def _run_batch_hooks(self, conn, table_name: str, bounds: Dict[str, Tuple[Any, Any]]):
+        for column, hook in self._batch_hooks.get(table_name, []):
+            low, high = bounds.get(column, (None, None))
+            if low is not None:
+                await hook(conn, low, high)
+
+    @staticmethod
+    def _value_bounds(values: Iterable[Any]) -> Tuple[Any, Any]:
+        """(минимум, максимум) значений без NULL; (None, None) - если значений нет"""
+        values = [value for value in values if value is not None]
+        if not values:
+            return None, None
+        return min(values), max(values)
+
+    @staticmethod
+    async def _record_batches(first_row: Any, rows: Union[Iterator[Any], AsyncIterator[Any]],
+                              to_record: Callable[[Any], tuple], batch_size: int) -> AsyncIterator[List[tuple]]:
+        """Порции кортежей для COPY из итератора или асинхронного итератора строк"""
+        batch = [to_record(first_row)]
+        if hasattr(rows, '__anext__'):
+            async for row in rows:
+                batch.append(to_record(row))
+                if len(batch) >= batch_size:
+                    yield batch
+                    batch = []
+        else:
+            while True:
+                batch.extend(map(to_record, islice(rows, batch_size - len(batch))))
+                if len(batch) < batch_size:
+                    break
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    async def _copy_parallel(self, batches: AsyncIterator[Any],
+                             copy: Callable[[Any, Any], Awaitable[int]], parallel: int) -> int:
+        """COPY порций через parallel соединений пула; очередь ограничена - чтение ждет запись"""
+        queue: asyncio.Queue = asyncio.Queue(maxsize=parallel * 2)
+
+        async def produce():
+            async for batch in batches:
+                await queue.put(batch)
+            for _ in range(parallel):
+                await queue.put(None)
+
+        async def copy_worker() -> int:
+            inserted = 0
+            async with self.pool.acquire() as conn:
+                while True:
+                    batch = await queue.get()
+                    if batch is None:
+                        return inserted
+                    inserted += await copy(conn, batch)
 
+        try:
+            async with asyncio.TaskGroup() as group:
+                group.create_task(produce())
+                workers = [group.create_task(copy_worker()) for _ in range(parallel)]
+        except ExceptionGroup as e:
+            raise e.exceptions[0]
+        return sum(worker.result() for worker in workers)
+
+    def get_table_version(self, table_name: str) -> str:
+        """Текущая версия данных таблицы (меняется после каждой записи в любом процессе)"""
+        return str(self.table_versions.get(table_name, 0))
+
+    async def publish_table_change(self, conn, table_name: str, apply: bool = True,
+                                   horizon: datetime = None) -> int:
+        """Увеличивает версию таблицы и публикует событие изменения (NOTIFY table_changes).
+
+        Вызывается всеми путями записи на соединении записи: внутри транзакции
+        подписчики узнают об изменении только после COMMIT. apply=False - внутри
+        транзакции, локальная версия применяется вызывающим после COMMIT.
+        horizon - строки раньше этого времени удалены (сохраняется вместе с версией).
+        """
+        version = await conn.fetchval('''
+            INSERT INTO table_versions (table_name, version, updated_at, horizon)
+            VALUES ($1, 1, CURRENT_TIMESTAMP, $2::timestamp)
+            ON CONFLICT (table_name)
+            DO UPDATE SET version = table_versions.version + 1, updated_at = CURRENT_TIMESTAMP,
+                          horizon = GREATEST(table_versions.horizon, EXCLUDED.horizon)
+            RETURNING version
+        ''', table_name, horizon)
+        change = {'table': table_name, 'version': version}
+        if horizon is not None:
+            change['horizon'] = horizon.isoformat()
+        await conn.execute('SELECT pg_notify($1, $2)', self.TABLE_CHANGES_CHANNEL, json.dumps(change))
+        if apply:
+            self._apply_table_version(table_name, version, horizon)
+        return version
+
+    async def expire_table_rows(self, table_name: str,
+                                expire: Callable[[Any], Awaitable[Optional[datetime]]]) -> Optional[datetime]:
+        """Удаление старых строк: expire(conn) в транзакции записи возвращает новый горизонт или None.
+
+        Записи в таблицу на время транзакции сериализуются; если строки удалены,
+        публикуется изменение с горизонтом - кеш, копия в памяти и rollup его учитывают.
+        """
         async with self.pool.acquire() as conn:
-            # Создаем таблицу если не существует
-            await self._create_table_if_not_exists(conn, table_name, first_row)
-
-            # Вставляем данные
-            for item in data:
-                values = [item[col] for col in columns]
-                await conn.execute(
-                    f'INSERT INTO {table_name} ({", ".join(columns)}) VALUES ({", ".join(placeholders)})',
-                    *values
-                )
+            async with conn.transaction():
+                await self.lock_table_writes(conn, table_name)
+                horizon = await expire(conn)
+                if horizon is None:
+                    return None
+                version = await self.publish_table_change(conn, table_name, apply=False, horizon=horizon)
+        self._apply_table_version(table_name, version, horizon)
+        return horizon
+
+    def get_table_horizon(self, table_name: str) -> Optional[datetime]:
+        """Время, раньше которого строк таблицы нет (удалены хранением), или None"""
+        return self.table_horizons.get(table_name)
+
+    def add_write_hook(self, table_name: str, hook: Callable[[Any], Awaitable[Any]]):
+        """Хук hook(conn), выполняемый в транзакции каждой записи в таблицу"""
+        self._write_hooks.setdefault(table_name, []).append(hook)
+
+    def add_batch_hook(self, table_name: str, column: str, hook: Callable[[Any, Any, Any], Awaitable[Any]]):
+        """Хук hook(conn, low, high) перед COPY каждой порции: границы значений column в порции.
+
+        Вызывается на соединении, которое пишет порцию. Записи в таблицу с хуками сериализуются.
+        """
+        self._batch_hooks.setdefault(table_name, []).append((column, hook))
+
+    @staticmethod
+    async def lock_table_writes(conn, table_name: str):
+        """Сериализует записи в таблицу до конца транзакции.
+
+        Тогда порядок id совпадает с порядком COMMIT, и инкрементальное
+        обслуживание по watermark id не пропускает строки параллельных транзакций.
+        """
+        await conn.execute('SELECT pg_advisory_xact_lock(hashtext($1))', table_name)
+
+    def on_table_change(self, callback: Callable[[str, int], None]):
+        """Подписка на изменения таблиц: callback(table_name, version)"""
+        self._table_change_callbacks.append(callback)
+
+    def on_schema_change(self, callback: Callable[[str], None]):
+        """Подписка на изменения схемы: callback(table_name) после обновления каталога"""
+        self._schema_change_callbacks.append(callback)
+
+    def _notify_schema_change(self, table_names: Iterable[str]):
+        for table_name in table_names:
+            for callback in self._schema_change_callbacks:
+                try:
+                    callback(table_name)
+                except Exception as e:
+                    print(f"⚠️ Ошибка обработчика изменения схемы {table_name}: {e}")
+
+    async def load_table_versions(self):
+        """Загружает версии всех таблиц (при старте и после переподключения LISTEN)"""
+        async with self.pool.acquire() as conn:
+            rows = await conn.fetch('SELECT table_name, version, horizon FROM table_versions')
+        for row in rows:
+            self._apply_table_version(row['table_name'], row['version'], row['horizon'])
+
+    async def listen_table_changes(self):
+        """Запускает фоновую подписку LISTEN на события изменения таблиц"""
+        if self._listener_task is None:
+            self._listener_task = asyncio.ensure_future(self._listen_loop())
+
+    async def _listen_loop(self):
+        # Отдельное соединение вне пула: LISTEN живет, пока живет соединение
+        while True:
+            conn = None
+            try:
+                conn = await asyncpg.connect(self.db_url)
+                lost = asyncio.get_running_loop().create_future()
+                conn.add_termination_listener(lambda _: lost.done() or lost.set_result(None))
+                await conn.add_listener(self.TABLE_CHANGES_CHANNEL, self._on_table_change_notification)
+                # Изменения данных и схемы, пропущенные пока подписка не работала
+                known_tables = set(self.catalog)
+                await self.load_catalog()
+                self._notify_schema_change(sorted(known_tables | set(self.catalog)))
+                await self.load_table_versions()
+                print(f"👂 Подписка на изменения таблиц (LISTEN {self.TABLE_CHANGES_CHANNEL})")
+                await lost
+                print("⚠️ Соединение LISTEN потеряно, переподключаемся...")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"⚠️ Ошибка подписки на изменения таблиц: {e}")
+            finally:
+                if conn is not None and not conn.is_closed():
+                    await conn.close()
+            await asyncio.sleep(self.LISTEN_RETRY_SECONDS)
+
+    def _on_table_change_notification(self, connection, pid, channel, payload):
+        try:
+            change = json.loads(payload)
+            if change.get('schema'):
+                asyncio.ensure_future(self._apply_schema_change(change['table'], int(change['version'])))
+            else:
+                horizon = datetime.fromisoformat(change['horizon']) if change.get('horizon') else None
+                self._apply_table_version(change['table'], int(change['version']), horizon)
+        except (ValueError, KeyError, TypeError) as e:
+            print(f"⚠️ Некорректное событие изменения таблицы: {payload} ({e})")
+
+    async def _apply_schema_change(self, table_name: str, version: int):
+        """Перечитывает схему таблицы, затем применяет версию: пересчет кеша увидит новые колонки"""
+        try:
+            await self.load_catalog([table_name])
+            print(f"🔄 Схема таблицы {table_name} изменилась, каталог обновлен")
+        except Exception as e:
+            print(f"⚠️ Ошибка обновления каталога для {table_name}: {e}")
+        else:
+            self._notify_schema_change([table_name])
+        self._apply_table_version(table_name, version)
+
+    def _apply_table_version(self, table_name: str, version: int, horizon: datetime = None):
+        """Применяет версию таблицы; подписчики вызываются только если версия выросла.
+
+        Горизонт применяется раньше версии: подписчики видят его вместе с новой версией.
+        """
+        current = self.table_horizons.get(table_name)
+        if horizon is not None and (current is None or horizon > current):
+            self.table_horizons[table_name] = horizon
+        if version <= self.table_versions.get(table_name, 0):
+            return
+        self.table_versions[table_name] = version
+        self._schedule_catalog_refresh()
+        for callback in self._table_change_callbacks:
+            try:
+                callback(table_name, version)
+            except Exception as e:
+                print(f"⚠️ Ошибка обработчика изменения таблицы {table_name}: {e}")
 
     async def _create_table_if_not_exists(self, conn, table_name: str, sample_data: Dict[str, Any]):
         """Создает таблицу на основе структуры данных"""
@@ -296,82 +728,268 @@ class DatabaseManager:
         '''
         await conn.execute(create_table_sql)
 
+    async def load_catalog(self, tables: List[str] = None):
+        """Загружает схему таблиц из каталога PostgreSQL (все таблицы или только tables)"""
+        async with self.pool.acquire() as conn:
+            loaded = await self._fetch_catalog(conn, tables)
+        if tables is None:
+            self.catalog = loaded
+            self._catalog_refreshed_at = time.monotonic()
+            return
+        for table_name in tables:
+            if table_name in loaded:
+                self.catalog[table_name] = loaded[table_name]
+            else:
+                self.catalog.pop(table_name, None)
+
+    @staticmethod
+    async def _fetch_catalog(conn, tables: List[str] = None) -> Dict[str, TableSchema]:
+        return TableSchema.from_rows(await conn.fetch(CATALOG_QUERY, tables))
+
+    def _schedule_catalog_refresh(self):
+        """Фоновое обновление оценок числа строк (не чаще CATALOG_REFRESH_SECONDS)"""
+        if self.pool is None or (self._catalog_task is not None and not self._catalog_task.done()):
+            return
+        if time.monotonic() - self._catalog_refreshed_at < self.CATALOG_REFRESH_SECONDS:
+            return
+        try:
+            self._catalog_task = asyncio.ensure_future(self._refresh_catalog())
+        except RuntimeError:
+            # Вне цикла событий (синхронный вызов) - обновим при следующей записи
+            pass
+
+    async def _refresh_catalog(self):
+        try:
+            await self.load_catalog()
+        except Exception as e:
+            print(f"⚠️ Ошибка обновления каталога схемы: {e}")
+
+    async def get_table_schema(self, table_name: str) -> TableSchema:
+        """Схема таблицы из каталога; таблица не из каталога ищется в БД, неизвестная - ValueError"""
+        schema = self.catalog.get(table_name)
+        if schema is None:
+            await self.load_catalog([table_name])
+            schema = self.catalog.get(table_name)
+            if schema is None:
+                raise ValueError(f"Таблица '{table_name}' не найдена")
+        return schema
+
     async def get_column_names(self, table_name: str) -> List[str]:
         """Получает названия колонок из таблицы"""
-        async with self.pool.acquire() as conn:
-            rows = await conn.fetch(f"""
-                SELECT column_name 
-                FROM information_schema.columns 
-                WHERE table_name = $1 
-                ORDER BY ordinal_position
-            """, table_name)
-            return [row['column_name'] for row in rows if row['column_name'] != 'id']
+        try:
+            return list((await self.get_table_schema(table_name)).data_columns)
+        except ValueError:
+            return []
+
+    async def get_column_types(self, table_name: str) -> Dict[str, str]:
+        """Получает типы колонок таблицы (column_name -> data_type)"""
+        try:
+            return dict((await self.get_table_schema(table_name)).column_types)
+        except ValueError:
+            return {}
 
     async def get_all_data(self, table_name: str, limit: int = None) -> List[Dict[str, Any]]:
         """Получает все данные из таблицы (оптимизированная версия)"""
+        schema = await self.get_table_schema(table_name)
         async with self.pool.acquire() as conn:
-            query = f'SELECT * FROM {table_name}'
-            if limit:
-                query += f' LIMIT {limit}'
-            print(f"preselect : {datetime.now().strftime("%M:%S")}")
+            rows = await conn.fetch(schema.statement('select'), limit or None)
 
-            rows = await conn.fetch(query)
-            print(f"postselect : {datetime.now().strftime("%M:%S")}")
+        # Колонки перечислены в запросе явно (без id) - запись целиком становится dict
+        return [dict(row) for row in rows]
 
-            if not rows:
-                return []
+    async def get_data_snapshot(self, table_name: str, limit: int = None) -> Tuple[List[Dict[str, Any]], int]:
+        """Получает данные вместе с watermark (максимальный id) из одного снимка БД.
 
-            # Получаем названия колонок из первой записи (без отдельного запроса)
-            columns = [col for col in rows[0].keys() if col != 'id']
+        Watermark и данные читаются в одной REPEATABLE READ транзакции, поэтому
+        последующий запрос get_data_since(watermark) не пропустит и не задвоит записи.
+        """
+        schema = await self.get_table_schema(table_name)
+        async with self.pool.acquire() as conn:
+            async with conn.transaction(isolation='repeatable_read', readonly=True):
+                watermark = await conn.fetchval(schema.statement('watermark'))
+                rows = await conn.fetch(schema.statement('select'), limit or None)
+
+        return [dict(row) for row in rows], watermark
+
+    @asynccontextmanager
+    async def compact_snapshot(self, table_name: str, limit: int = None, epoch_dates: bool = False,
+                               chunk_size: int = None) -> AsyncIterator[EncodedRows]:
+        """Строки компактного формата, закодированные в JSON самим PostgreSQL (json_build_array).
+
+        Python не создает dict и не обходит значения: порции по chunk_size строк (keyset по id)
+        приходят готовым текстом и только склеиваются. Словарные колонки выбираются по первым
+        DICTIONARY_PROFILE_ROWS строкам (правило CompactData), поэтому первая порция не ждет
+        прохода по всей выборке; новые значения дальше дописываются в словари порциями.
+        Словари и total окончательны после чтения всех порций - в JSON они идут после строк.
+        Все запросы и watermark - из одного снимка REPEATABLE READ, порции читаются, пока открыт контекст.
+        """
+        chunk_size = max(1, int(chunk_size or self.ENCODED_CHUNK_ROWS))
+        schema = await self.get_table_schema(table_name)
+        async with self.pool.acquire() as conn:
+            async with conn.transaction(isolation='repeatable_read', readonly=True):
+                watermark = await conn.fetchval(schema.statement('watermark'))
+                profile_rows = min(limit, self.DICTIONARY_PROFILE_ROWS) if limit else self.DICTIONARY_PROFILE_ROWS
+                profile = await conn.fetchrow(
+                    schema.statement('compact_profile'), profile_rows, CompactData.DICTIONARY_MAX_VALUES + 1
+                )
+                sampled = profile['total']
+                max_values = min(CompactData.DICTIONARY_MAX_VALUES, sampled * CompactData.DICTIONARY_MAX_RATIO)
+                dictionaries = {
+                    name: list(profile[name]) for name in schema.text_columns
+                    if sampled and len(profile[name]) <= max_values
+                }
+                query = schema.compact_chunk(epoch_dates, list(dictionaries))
+                encoded = EncodedRows(headers=list(schema.data_columns), dictionaries=dictionaries,
+                                      total=0, watermark=watermark, chunks=None)
+
+                async def chunks() -> AsyncIterator[str]:
+                    last_id, remaining = 0, limit
+                    while not limit or remaining > 0:
+                        size = min(chunk_size, remaining) if limit else chunk_size
+                        row = await conn.fetchrow(query, last_id, size, *dictionaries.values())
+                        if not row['row_count']:
+                            return
+                        for index, values in enumerate(dictionaries.values()):
+                            values.extend(row[f'added_{index}'])
+                        encoded.total += row['row_count']
+                        if limit:
+                            remaining -= row['row_count']
+                        last_id = row['last_id']
+                        yield row['rows']
+                        if row['row_count'] < size:
+                            return
+
+                encoded.chunks = chunks()
+                yield encoded
+
+    async def get_data_since(self, table_name: str, since_id: int,
+                             limit: int = None) -> Tuple[List[Dict[str, Any]], int]:
+        """Получает записи новее watermark (id > since_id) и новый watermark"""
+        limit = max(1, min(int(limit or self.MAX_PAGE_SIZE), self.MAX_PAGE_SIZE))
+        schema = await self.get_table_schema(table_name)
 
-            # Оптимизированная конвертация через list comprehension
-            return [
-                {col: row[col] for col in columns}
-                for row in rows
-            ]
+        async with self.pool.acquire() as conn:
+            rows = await conn.fetch(schema.statement('since'), since_id, limit)
+
+        if not rows:
+            return [], since_id
+
+        columns = schema.data_columns
+        return [{col: row[col] for col in columns} for row in rows], rows[-1]['id']
 
     async def get_filtered_data(self, table_name: str, filters: Dict[str, Any] = None,
-                                limit: int = None) -> List[Dict[str, Any]]:
-        """Получает отфильтрованные данные (оптимизированная версия)"""
+                                limit: int = None, where: Tuple[str, List[Any]] = None) -> List[Dict[str, Any]]:
+        """Получает отфильтрованные данные (оптимизированная версия).
+
+        where - готовое условие (WHERE, params), например QueryEngine.compile_filter; иначе filters.
+        """
+        schema = await self.get_table_schema(table_name)
+        if where is not None:
+            where_clause, params = where[0], list(where[1])
+        else:
+            schema.check_columns(filters or {})
+            where_conditions, params = self._build_filter_conditions(filters)
+            where_clause = " AND ".join(where_conditions) if where_conditions else "TRUE"
+
+        params.append(limit or None)
         async with self.pool.acquire() as conn:
-            where_conditions = []
-            params = []
-            param_count = 0
-
-            if filters:
-                for col_name, value in filters.items():
-                    param_count += 1
-                    if isinstance(value, (list, tuple)):
-                        placeholders = ','.join([f"${i}" for i in range(param_count, param_count + len(value))])
-                        where_conditions.append(f"{col_name} IN ({placeholders})")
-                        params.extend(value)
-                        param_count += len(value) - 1
-                    else:
-                        where_conditions.append(f"{col_name} = ${param_count}")
-                        params.append(value)
-
-            where_clause = " AND ".join(where_conditions) if where_conditions else "1=1"
-            query = f"SELECT * FROM {table_name} WHERE {where_clause}"
-
-            if limit:
-                query += f" LIMIT {limit}"
+            rows = await conn.fetch(schema.select_where(where_clause, len(params)), *params)
+
+        return [dict(row) for row in rows]
+
+    async def get_data_page(self, table_name: str, filters: Dict[str, Any] = None,
+                            page_size: int = None, cursor: str = None,
+                            where: Tuple[str, List[Any]] = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """Получает страницу данных с keyset пагинацией по (timestamp, id).
+
+        Возвращает (записи, токен следующей страницы или None, если страница последняя).
+        where - готовое условие (WHERE, params) вместо filters.
+        """
+        page_size = max(1, min(int(page_size or self.DEFAULT_PAGE_SIZE), self.MAX_PAGE_SIZE))
+        schema = await self.get_table_schema(table_name)
+
+        if where is not None:
+            where_conditions, params = [where[0]], list(where[1])
+        else:
+            schema.check_columns(filters or {})
+            where_conditions, params = self._build_filter_conditions(filters)
+
+        if cursor:
+            last_timestamp, last_id = self.decode_page_cursor(cursor)
+            params.extend([last_timestamp, last_id])
+            ts_param, id_param = len(params) - 1, len(params)
+            # Условие "timestamp >= $n" позволяет планировщику использовать idx_timestamp
+            where_conditions.append(
+                f"timestamp >= ${ts_param} AND (timestamp > ${ts_param} OR id > ${id_param})"
+            )
 
+        where_clause = " AND ".join(where_conditions) if where_conditions else "TRUE"
+        # Берем на одну запись больше, чтобы понять, есть ли следующая страница
+        params.append(page_size + 1)
+        query = schema.select_where(where_clause, len(params), with_id=True, order_by='timestamp, id')
+
+        async with self.pool.acquire() as conn:
             rows = await conn.fetch(query, *params)
 
-            if not rows:
-                return []
+        has_more = len(rows) > page_size
+        rows = rows[:page_size]
+        if not rows:
+            return [], None
+
+        next_cursor = None
+        if has_more:
+            next_cursor = self.encode_page_cursor(rows[-1]['timestamp'], rows[-1]['id'])
+
+        columns = schema.data_columns
+        return [{col: row[col] for col in columns} for row in rows], next_cursor
 
-            # Получаем колонки из первой записи (без отдельного запроса)
-            columns = [col for col in rows[0].keys() if col != 'id']
+    @staticmethod
+    def encode_page_cursor(timestamp: datetime, row_id: int) -> str:
+        """Непрозрачный токен продолжения для keyset пагинации"""
+        payload = json.dumps([timestamp.isoformat(), row_id], separators=(',', ':'))
+        return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii')
 
-            # Оптимизированная конвертация
-            return [
-                {col: row[col] for col in columns}
-                for row in rows
-            ]
+    @staticmethod
+    def decode_page_cursor(cursor: str) -> Tuple[datetime, int]:
+        """Разбирает токен продолжения; некорректный токен - ValueError"""
+        try:
+            timestamp, row_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+            return datetime.fromisoformat(timestamp), int(row_id)
+        except Exception:
+            raise ValueError('Некорректный токен страницы')
+
+    @staticmethod
+    def _build_filter_conditions(filters: Dict[str, Any] = None) -> Tuple[List[str], List[Any]]:
+        """Условия WHERE (равенство или = ANY для списков) и параметры для них"""
+        where_conditions = []
+        params = []
+        param_count = 0
+
+        if filters:
+            for col_name, value in filters.items():
+                param_count += 1
+                if isinstance(value, (list, tuple)):
+                    # Один параметр-массив: текст запроса не зависит от длины списка
+                    where_conditions.append(f"{col_name} = ANY(${param_count})")
+                    params.append(list(value))
+                else:
+                    where_conditions.append(f"{col_name} = ${param_count}")
+                    params.append(value)
+
+        return where_conditions, params
 
     async def close(self):
         """Закрывает соединение с базой"""
+        if self._listener_task is not None:
+            self._listener_task.cancel()
+            try:
+                await self._listener_task
+            except asyncio.CancelledError:
+                pass
+            self._listener_task = None
+        if self._catalog_task is not None:
+            self._catalog_task.cancel()
+            self._catalog_task = None
         if self.pool:
             await self.pool.close()
             print("🔌 Соединение с базой данных закрыто")
\ No newline at end of file
@@ -0,0 +1,47 @@
+from typing import List, Sequence, Tuple
+
+
+Point = Tuple[float, float]
+
+
+def lttb(points: Sequence[Point], threshold: int) -> List[Point]:
+    """Largest-Triangle-Three-Buckets: выбирает threshold точек, сохраняющих форму ряда.
+
+    points отсортированы по x. Первая и последняя точки сохраняются всегда,
+    из каждой корзины берется точка с наибольшей площадью треугольника
+    с предыдущей выбранной точкой и средним следующей корзины - пики не теряются.
+    """
+    n = len(points)
+    if threshold >= n or threshold < 3:
+        return list(points)
+
+    sampled = [points[0]]
+    every = (n - 2) / (threshold - 2)
+    a = 0
+
+    for i in range(threshold - 2):
+        # Среднее следующей корзины - третья вершина треугольника
+        avg_start = int((i + 1) * every) + 1
+        avg_end = min(int((i + 2) * every) + 1, n)
+        avg_count = avg_end - avg_start
+        avg_x = sum(points[j][0] for j in range(avg_start, avg_end)) / avg_count
+        avg_y = sum(points[j][1] for j in range(avg_start, avg_end)) / avg_count
+
+        ax, ay = points[a]
+        range_start = int(i * every) + 1
+        range_end = int((i + 1) * every) + 1
+
+        max_area = -1.0
+        next_a = range_start
+        for j in range(range_start, range_end):
+            x, y = points[j]
+            area = abs((ax - avg_x) * (y - ay) - (ax - x) * (avg_y - ay))
+            if area > max_area:
+                max_area = area
+                next_a = j
+
+        sampled.append(points[next_a])
+        a = next_a
+
+    sampled.append(points[-1])
+    return sampled
@@ -1,8 +1,37 @@
+import multiprocessing
 import random
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timedelta
-from typing import List, Dict, Any
+from functools import lru_cache
+from typing import List, Dict, Any, Iterator, Tuple
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from .catalog import ColumnInfo
+from .pgcopy import BinaryCopyEncoder, DictColumn
+
+
+# Строк в одной колоночной порции генератора
+DEFAULT_CHUNK_ROWS = 100_000
+BASE_DATE = datetime(2025, 1, 1)
+
 
 class DataGenerator:
+    # Колонки строки в порядке таблицы server_metrics (без id)
+    COLUMNS = [
+        'timestamp', 'server_name', 'server_ip', 'server_zone', 'server_type', 'service_name',
+        'environment', 'os_type', 'install_date', 'last_update_date', 'next_maintenance_date',
+        'last_backup_date', 'certificate_expiry_date', 'days_since_install', 'days_since_last_update',
+        'days_until_maintenance', 'days_since_last_backup', 'days_until_cert_expiry', 'cpu_usage',
+        'memory_usage', 'disk_usage', 'network_in', 'network_out', 'response_time', 'requests_per_second',
+        'error_rate', 'revenue_impact', 'user_sessions', 'throughput', 'status', 'uptime_days',
+        'last_maintenance',
+    ]
+
     def __init__(self):
         self.services = ['web', 'db', 'cache', 'api', 'storage', 'queue', 'monitoring', 'auth']
         self.zones = ['us-east', 'us-west', 'eu-central', 'eu-west', 'asia-south', 'asia-east']
@@ -14,7 +43,7 @@ class DataGenerator:
     def generate_server_data(self, server_count: int = 1000, days: int = 7, interval_hours: int = 6) -> List[Dict[str, Any]]:
         """Генерация данных по серверам"""
         servers = []
-        base_date = datetime(2025, 1, 1)
+        base_date = BASE_DATE
         server_names = [f"SRV-{i:03d}" for i in range(1, server_count + 1)]
 
         for server_name in server_names:
@@ -65,4 +94,145 @@ class DataGenerator:
                 }
                 servers.append(server_data)
 
-        return servers
\ No newline at end of file
+        return servers
+
+    def chunk_count(self, server_count: int, days: int, interval_hours: int,
+                    chunk_size: int = DEFAULT_CHUNK_ROWS) -> int:
+        total = server_count * len(range(0, 24 * days, interval_hours))
+        return -(-total // chunk_size)
+
+    def generate_chunk(self, index: int, server_count: int = 1000, days: int = 7, interval_hours: int = 6,
+                       chunk_size: int = DEFAULT_CHUNK_ROWS, seed: int = 0) -> Dict[str, Any]:
+        """Колоночная порция index: те же распределения, что в generate_server_data, векторно NumPy.
+
+        Строки идут в том же порядке (сервер, затем время). Случайные значения порции
+        зависят только от (seed, index), поэтому результат воспроизводим при любом
+        разбиении по процессам. Текстовые колонки - DictColumn (коды словаря).
+        """
+        if np is None:
+            raise RuntimeError('Для генерации порциями нужен NumPy (pip install numpy)')
+        steps = len(range(0, 24 * days, interval_hours))
+        start = index * chunk_size
+        row = np.arange(start, min(server_count * steps, start + chunk_size), dtype=np.int64)
+        server = row // steps
+        size = len(row)
+        names, ips, install_days = _server_table(server_count, seed)
+        rng = np.random.default_rng(np.random.SeedSequence(seed, spawn_key=(1, index)))
+
+        def pick(values: List[str]) -> DictColumn:
+            return DictColumn(rng.integers(0, len(values), size), values)
+
+        def days_between(low: int, high: int) -> Any:
+            return rng.integers(low, high + 1, size) * np.timedelta64(1, 'D')
+
+        day = np.timedelta64(1, 'D')
+        base = np.datetime64(BASE_DATE, 'us')
+        timestamp = base + (row % steps) * interval_hours * np.timedelta64(1, 'h')
+        install_date = base - install_days[server] * day
+        last_update = timestamp - days_between(1, 30)
+        next_maintenance = timestamp + days_between(1, 90)
+        last_backup = timestamp - days_between(1, 7)
+        cert_expiry = timestamp + days_between(30, 365)
+
+        return {
+            'timestamp': timestamp,
+            'server_name': DictColumn(server, names),
+            'server_ip': DictColumn(server, ips),
+            'server_zone': pick(self.zones),
+            'server_type': pick(self.server_types),
+            'service_name': pick(self.services),
+            'environment': pick(self.environments),
+            'os_type': pick(self.os_types),
+            'install_date': install_date,
+            'last_update_date': last_update,
+            'next_maintenance_date': next_maintenance,
+            'last_backup_date': last_backup,
+            'certificate_expiry_date': cert_expiry,
+            'days_since_install': (timestamp - install_date) // day,
+            'days_since_last_update': (timestamp - last_update) // day,
+            'days_until_maintenance': (next_maintenance - timestamp) // day,
+            'days_since_last_backup': (timestamp - last_backup) // day,
+            'days_until_cert_expiry': (cert_expiry - timestamp) // day,
+            'cpu_usage': np.round(rng.uniform(5, 95, size), 2),
+            'memory_usage': np.round(rng.uniform(10, 90, size), 2),
+            'disk_usage': np.round(rng.uniform(20, 80, size), 2),
+            'network_in': rng.integers(100, 10001, size),
+            'network_out': rng.integers(100, 10001, size),
+            'response_time': np.round(rng.uniform(10, 500, size), 2),
+            'requests_per_second': rng.integers(100, 5001, size),
+            'error_rate': np.round(rng.uniform(0.1, 5, size), 2),
+            'revenue_impact': np.round(rng.uniform(1000, 50000, size), 2),
+            'user_sessions': rng.integers(1000, 50001, size),
+            'throughput': rng.integers(100, 5001, size),
+            'status': pick(self.statuses),
+            'uptime_days': rng.integers(1, 366, size),
+            'last_maintenance': timestamp - days_between(1, 30),
+        }
+
+    def iter_chunks(self, server_count: int = 1000, days: int = 7, interval_hours: int = 6,
+                    chunk_size: int = DEFAULT_CHUNK_ROWS, seed: int = 0) -> Iterator[Dict[str, Any]]:
+        """Колоночные порции по chunk_size строк (в памяти только текущая порция)"""
+        for index in range(self.chunk_count(server_count, days, interval_hours, chunk_size)):
+            yield self.generate_chunk(index, server_count, days, interval_hours, chunk_size, seed)
+
+    def iter_copy_chunks(self, columns: List[ColumnInfo], server_count: int = 1000, days: int = 7,
+                         interval_hours: int = 6, chunk_size: int = DEFAULT_CHUNK_ROWS, seed: int = 0,
+                         processes: int = 1) -> Iterator[bytes]:
+        """Порции, готовые для DatabaseManager.copy_binary: поток COPY BINARY для колонок columns.
+
+        processes > 1 - порции генерируются и кодируются в пуле процессов; в работе
+        не больше 2 * processes порций, порядок порций сохраняется.
+        """
+        tasks = [
+            (columns, index, server_count, days, interval_hours, chunk_size, seed)
+            for index in range(self.chunk_count(server_count, days, interval_hours, chunk_size))
+        ]
+        if processes <= 1:
+            for task in tasks:
+                yield _encode_chunk(task)
+            return
+
+        # spawn: fork процесса с запущенным циклом событий и потоками небезопасен
+        with ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context('spawn')) as executor:
+            pending = deque()
+            for task in tasks:
+                if len(pending) >= 2 * processes:
+                    yield pending.popleft().result()
+                pending.append(executor.submit(_encode_chunk, task))
+            while pending:
+                yield pending.popleft().result()
+
+    async def seed(self, db_manager, table_name: str = 'server_metrics', server_count: int = 1000,
+                   days: int = 7, interval_hours: int = 6, seed: int = 0, processes: int = 1,
+                   parallel: int = 1, chunk_size: int = DEFAULT_CHUNK_ROWS) -> int:
+        """Заполняет таблицу: порции NumPy -> COPY BINARY; без NumPy - строки generate_server_data"""
+        # Диапазон timestamp всех порций: секции под него создаются до загрузки
+        last_step = len(range(0, 24 * days, interval_hours)) - 1
+        bounds = {'timestamp': (BASE_DATE, BASE_DATE + timedelta(hours=last_step * interval_hours))}
+        if np is None:
+            data = self.generate_server_data(server_count=server_count, days=days, interval_hours=interval_hours)
+            return await db_manager.insert_data(table_name, data, parallel=parallel, bounds=bounds)
+
+        schema = await db_manager.get_table_schema(table_name)
+        columns = [column for column in schema.columns if column.name in self.COLUMNS]
+        chunks = self.iter_copy_chunks(columns, server_count=server_count, days=days, interval_hours=interval_hours,
+                                       chunk_size=chunk_size, seed=seed, processes=processes)
+        return await db_manager.copy_binary(table_name, [column.name for column in columns], chunks,
+                                            parallel=parallel, bounds=bounds)
+
+
+@lru_cache(maxsize=4)
+def _server_table(server_count: int, seed: int) -> Tuple[List[str], List[str], Any]:
+    """Постоянные атрибуты серверов (имя, IP, дней с установки) - общие для всех порций"""
+    rng = np.random.default_rng(np.random.SeedSequence(seed, spawn_key=(0,)))
+    names = [f"SRV-{i:03d}" for i in range(1, server_count + 1)]
+    ips = ['.'.join(map(str, parts)) for parts in rng.integers(1, 256, (server_count, 4)).tolist()]
+    install_days = rng.integers(1, 366, server_count)
+    return names, ips, install_days
+
+
+def _encode_chunk(task: Tuple) -> bytes:
+    """Генерирует и кодирует одну порцию (выполняется и в дочерних процессах)"""
+    columns, index, server_count, days, interval_hours, chunk_size, seed = task
+    chunk = DataGenerator().generate_chunk(index, server_count, days, interval_hours, chunk_size, seed)
+    return BinaryCopyEncoder(columns).encode(chunk)
@@ -0,0 +1,240 @@
+import csv
+from collections import deque
+from dataclasses import dataclass, field
+from decimal import Decimal
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional, Tuple
+
+from . import serialization
+from .catalog import ColumnInfo, TableSchema
+from .query_engine import QueryEngine
+
+
+# Границы целочисленных типов PostgreSQL: значение вне диапазона прервало бы весь COPY
+INTEGER_LIMITS = {'smallint': 2 ** 15, 'integer': 2 ** 31, 'bigint': 2 ** 63}
+
+
+@dataclass
+class IngestResult:
+    accepted: int = 0
+    rejected: int = 0
+    # Первые MAX_ERRORS ошибок: номер строки тела запроса и причина
+    errors: List[Dict[str, Any]] = field(default_factory=list)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {'accepted': self.accepted, 'rejected': self.rejected, 'errors': self.errors}
+
+
+class CsvLines:
+    """Поток строк CSV для одного csv.reader на все тело запроса.
+
+    Пополняется порциями; пустой поток - StopIteration, после пополнения csv.reader
+    продолжает чтение. Перевод строки сохраняется - он нужен полям в кавычках.
+    """
+
+    def __init__(self):
+        self._lines = deque()
+
+    def extend(self, lines: List[bytes]):
+        self._lines.extend(lines)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> str:
+        if not self._lines:
+            raise StopIteration
+        return (self._lines.popleft() + b'\n').decode('utf-8')
+
+
+class RowIngester:
+    """Потоковый разбор тела запроса NDJSON/CSV в кортежи для COPY с проверкой по схеме таблицы.
+
+    Тело читается порциями сетевого потока: пока COPY пишет порцию, следующая не читается,
+    буфер aiohttp заполняется и TCP притормаживает отправителя. Некорректные строки
+    отбрасываются и считаются в result, корректные отдаются в порядке schema.data_columns.
+    """
+
+    FORMATS = ('ndjson', 'csv')
+    CONTENT_TYPES = {
+        'application/x-ndjson': 'ndjson',
+        'application/ndjson': 'ndjson',
+        'application/jsonl': 'ndjson',
+        'text/csv': 'csv',
+    }
+    READ_CHUNK_BYTES = 64 * 1024
+    MAX_LINE_BYTES = 1024 * 1024
+    MAX_ERRORS = 100
+
+    def __init__(self, schema: TableSchema, data_format: str):
+        if data_format not in self.FORMATS:
+            raise ValueError(f"Неподдерживаемый формат: {data_format} (допустимы: {', '.join(self.FORMATS)})")
+        self.schema = schema
+        self.format = data_format
+        self.columns = schema.data_columns
+        data_columns = [column for column in schema.columns if column.name != 'id']
+        self.converters: Dict[str, Callable[[Any], Any]] = {
+            column.name: self._converter(column) for column in data_columns
+        }
+        self.required = {column.name for column in data_columns if not column.nullable}
+        # В CSV пустое поле - NULL (как в COPY CSV), кроме текстовых колонок
+        self.empty_is_null = {
+            column.name for column in data_columns if column.data_type not in QueryEngine.TEXT_TYPES
+        }
+        self.result = IngestResult()
+        self._line = 0
+        self._header: Optional[List[str]] = None
+        # strict: незакрытая кавычка в конце тела - ошибка записи, а не обрезанное поле
+        self._csv_lines = CsvLines()
+        self._csv_reader = csv.reader(self._csv_lines, strict=True)
+
+    @classmethod
+    def detect_format(cls, content_type: str, requested: str = None) -> str:
+        """Формат из параметра format или Content-Type (по умолчанию NDJSON)"""
+        if requested:
+            return requested.lower()
+        return cls.CONTENT_TYPES.get((content_type or '').lower(), 'ndjson')
+
+    async def records(self, stream) -> AsyncIterator[tuple]:
+        """Кортежи значений колонок из потока тела запроса (aiohttp StreamReader)"""
+        parse = self._parse_ndjson if self.format == 'ndjson' else self._parse_csv
+        async for lines in self._iter_lines(stream):
+            for record in parse(lines):
+                yield record
+
+    async def _iter_lines(self, stream) -> AsyncIterator[List[bytes]]:
+        """Полные строки (в CSV - полные записи) из каждой прочитанной порции; незавершенная ждет следующей"""
+        tail = b''
+        line_count = 0
+        async for chunk in stream.iter_chunked(self.READ_CHUNK_BYTES):
+            lines = (tail + chunk).split(b'\n')
+            tail = lines.pop()
+            if self.format == 'csv':
+                lines, tail = self._split_quoted(lines, tail)
+            if len(tail) > self.MAX_LINE_BYTES:
+                raise ValueError(f"Строка {line_count + len(lines) + 1} длиннее {self.MAX_LINE_BYTES} байт")
+            if lines:
+                line_count += len(lines)
+                yield lines
+        if tail.strip():
+            yield tail.rstrip(b'\r\n').split(b'\n')
+
+    @staticmethod
+    def _split_quoted(lines: List[bytes], tail: bytes) -> Tuple[List[bytes], bytes]:
+        """(строки до последней, где закрыты все кавычки CSV, остальное - к незавершенному хвосту).
+
+        Перевод строки внутри поля в кавычках не заканчивает запись; экранированная
+        кавычка ("") не меняет четность. Порция всегда начинается с начала записи.
+        """
+        quotes = 0
+        complete = 0
+        for index, line in enumerate(lines):
+            quotes += line.count(b'"')
+            if not quotes % 2:
+                complete = index + 1
+        if complete == len(lines):
+            return lines, tail
+        return lines[:complete], b'\n'.join(lines[complete:] + [tail])
+
+    def _parse_ndjson(self, lines: List[bytes]) -> Iterator[tuple]:
+        for line in lines:
+            self._line += 1
+            if not line.strip():
+                continue
+            try:
+                row = serialization.loads(line)
+                if not isinstance(row, dict):
+                    raise ValueError('ожидается JSON объект')
+                record = self._record(row)
+            except ValueError as e:
+                self._reject(str(e))
+                continue
+            self.result.accepted += 1
+            yield record
+
+    def _parse_csv(self, lines: List[bytes]) -> Iterator[tuple]:
+        self._csv_lines.extend(lines)
+        while True:
+            try:
+                fields = next(self._csv_reader, None)
+            except (ValueError, csv.Error) as e:
+                self._line = self._csv_reader.line_num
+                self._reject(str(e))
+                continue
+            if fields is None:
+                return
+            # Номер последней строки записи (запись с полями в кавычках может занимать несколько строк)
+            self._line = self._csv_reader.line_num
+            if not fields or (len(fields) == 1 and not fields[0].strip()):
+                continue
+
+            if self._header is None:
+                self._set_header(fields)
+                continue
+
+            try:
+                if len(fields) != len(self._header):
+                    raise ValueError(f"ожидается полей: {len(self._header)}, получено: {len(fields)}")
+                record = self._record({
+                    name: None if value == '' and name in self.empty_is_null else value
+                    for name, value in zip(self._header, fields)
+                })
+            except ValueError as e:
+                self._reject(str(e))
+                continue
+            self.result.accepted += 1
+            yield record
+
+    def _set_header(self, fields: List[str]):
+        """Заголовок CSV проверяется целиком: с неверным заголовком не подойдет ни одна строка"""
+        header = [name.strip() for name in fields]
+        unknown = [name for name in header if name not in self.converters]
+        if unknown:
+            raise ValueError(f"Неизвестные колонки в заголовке CSV: {', '.join(unknown)}")
+        missing = sorted(self.required - set(header))
+        if missing:
+            raise ValueError(f"В заголовке CSV нет обязательных колонок: {', '.join(missing)}")
+        self._header = header
+
+    def _record(self, row: Dict[str, Any]) -> tuple:
+        unknown = row.keys() - self.converters.keys()
+        if unknown:
+            raise ValueError(f"неизвестные колонки: {', '.join(sorted(unknown))}")
+        values = []
+        for name in self.columns:
+            value = row.get(name)
+            if value is None:
+                if name in self.required:
+                    raise ValueError(f"нет значения обязательной колонки '{name}'")
+                values.append(None)
+            else:
+                values.append(self.converters[name](value))
+        return tuple(values)
+
+    def _reject(self, message: str):
+        self.result.rejected += 1
+        if len(self.result.errors) < self.MAX_ERRORS:
+            self.result.errors.append({'line': self._line, 'error': message})
+
+    @staticmethod
+    def _converter(column: ColumnInfo) -> Callable[[Any], Any]:
+        """Приведение к типу колонки и проверка ограничений, которые иначе прервали бы COPY"""
+        name, data_type = column.name, column.data_type
+        integer_limit = INTEGER_LIMITS.get(data_type)
+        numeric_limit = None
+        if data_type == 'numeric' and column.numeric_precision is not None:
+            numeric_limit = Decimal(10) ** (column.numeric_precision - (column.numeric_scale or 0))
+
+        def convert(value: Any) -> Any:
+            value = QueryEngine.coerce_value(value, data_type, name)
+            try:
+                if integer_limit is not None and not -integer_limit <= value < integer_limit:
+                    raise ValueError
+                if numeric_limit is not None and not abs(value) < numeric_limit:
+                    raise ValueError
+            except (ValueError, ArithmeticError):
+                raise ValueError(f"Значение вне диапазона для '{name}' ({data_type}): {value}")
+            if column.max_length is not None and isinstance(value, str) and len(value) > column.max_length:
+                raise ValueError(f"Значение длиннее {column.max_length} символов для '{name}'")
+            return value
+
+        return convert
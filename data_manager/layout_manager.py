@@ -112,6 +112,7 @@ class LayoutManager:
                     SET is_active = false 
                     WHERE dashboard_id = $1 AND name = $2
                 ''', dashboard_id, name)
+                await self.db_manager.publish_table_change(conn, 'dashboard_layouts')
 
                 return {
                     "status": "success",
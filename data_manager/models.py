@@ -1,7 +1,13 @@
-from dataclasses import dataclass
+from array import array
+from dataclasses import dataclass, field
 from datetime import datetime
-from typing import List, Dict, Any
-import json
+from decimal import Decimal
+from typing import List, Dict, Any, AsyncIterator
+import math
+import struct
+import sys
+
+from . import serialization
 
 
 @dataclass
@@ -10,6 +16,13 @@ class CompactData:
     headers: List[str]
     data: List[List[Any]]
     metadata: Dict[str, Any]
+    # Словари строковых колонок: в строках вместо значений - индексы в словаре
+    dictionaries: Dict[str, List[Any]] = field(default_factory=dict)
+
+    # Колонка кодируется словарем, если уникальных значений не больше лимита
+    # и не больше доли от числа строк
+    DICTIONARY_MAX_VALUES = 256
+    DICTIONARY_MAX_RATIO = 0.5
 
     def to_json(self):
         # Максимально компактный формат без пробелов и минимум метаданных
@@ -17,16 +30,165 @@ class CompactData:
             'h': self.headers,  # headers
             'd': self.data      # data rows
         }
+        if self.dictionaries:
+            result['x'] = self.dictionaries  # dictionaries
         # Добавляем только критичные метаданные
         if self.metadata and 'total_records' in self.metadata:
             result['c'] = self.metadata['total_records']  # count
-        return json.dumps(result, separators=(',', ':'), ensure_ascii=False, default=str)
+        if self.metadata and self.metadata.get('next_cursor'):
+            result['n'] = self.metadata['next_cursor']  # next page token
+        if self.metadata and self.metadata.get('watermark') is not None:
+            result['w'] = self.metadata['watermark']  # max id для инкрементальной синхронизации
+        # NUMERIC (Decimal) - JSON числом, не строкой
+        return serialization.dumps(result)
+
+    def encode_dictionaries(self):
+        """Заменяет значения низкокардинальных строковых колонок на коды словаря"""
+        for index in self.detect_dictionary_columns(self.data):
+            codes = {}
+            for row in self.data:
+                row[index] = codes.setdefault(row[index], len(codes))
+            self.dictionaries[self.headers[index]] = list(codes)
+
+    @classmethod
+    def detect_dictionary_columns(cls, rows: List[List[Any]]) -> List[int]:
+        """Определяет по кардинальности, какие строковые колонки выгодно кодировать словарем"""
+        if not rows:
+            return []
+
+        max_values = min(cls.DICTIONARY_MAX_VALUES, len(rows) * cls.DICTIONARY_MAX_RATIO)
+        columns = []
+        for index, value in enumerate(rows[0]):
+            if not isinstance(value, str):
+                continue
+            seen = set()
+            for row in rows:
+                seen.add(row[index])
+                if len(seen) > max_values:
+                    break
+            else:
+                columns.append(index)
+        return columns
+
+    # Короткие ключи метаданных в to_json
+    METADATA_KEYS = {'c': 'total_records', 'n': 'next_cursor', 'w': 'watermark'}
 
     @classmethod
     def from_json(cls, json_str: str):
-        data = json.loads(json_str)
+        data = serialization.loads(json_str)
         return cls(
             headers=data['h'],
             data=data['d'],
-            metadata=data['m']
-        )
\ No newline at end of file
+            metadata={name: data[key] for key, name in cls.METADATA_KEYS.items() if key in data},
+            dictionaries=data.get('x', {})
+        )
+
+
+@dataclass
+class EncodedRows:
+    """Строки компактного формата, уже закодированные в JSON на стороне PostgreSQL.
+
+    chunks - фрагменты массива "d": JSON массивы строк через запятую (без внешних скобок),
+    значения колонок из dictionaries - индексы в словаре. Чтение chunks дописывает в dictionaries
+    новые значения и считает total, поэтому оба окончательны только после последней порции.
+    Собирает APIFormatter.iter_encoded_json.
+    """
+    headers: List[str]
+    dictionaries: Dict[str, List[Any]]
+    total: int
+    watermark: Any
+    chunks: AsyncIterator[str]
+
+
+# Media type колоночного бинарного формата (выбирается по заголовку Accept)
+COLUMNAR_CONTENT_TYPE = 'application/vnd.blinksense.columnar'
+
+
+@dataclass
+class ColumnarData:
+    """Колоночное бинарное представление данных для API.
+
+    Формат (little-endian):
+        b'BSC1' | uint32 длина заголовка | JSON заголовок | выравнивание до 8 байт | буферы колонок
+
+    Заголовок: {"c": число строк, "w": watermark, "cols": [{"n": имя, "t": тип, "o": смещение, "l": длина в байтах, "v": словарь}]}
+    Смещения считаются от начала области буферов, каждый буфер выровнен на 8 байт,
+    поэтому на клиенте колонки читаются напрямую как TypedArray.
+
+    Типы колонок:
+        i32    - Int32Array
+        f64    - Float64Array (null -> NaN)
+        date   - Float64Array, unix timestamp в секундах, TIMESTAMP без пояса - UTC (null -> NaN)
+        bool   - Uint8Array
+        dict8, dict16, dict32 - коды Uint8Array/Uint16Array/Int32Array в словарь "v"
+    """
+    headers: List[str]
+    columns: List[List[Any]]
+    metadata: Dict[str, Any]
+
+    MAGIC = b'BSC1'
+
+    def to_bytes(self) -> bytes:
+        row_count = len(self.columns[0]) if self.columns else 0
+        columns_meta = []
+        buffers = []
+        offset = 0
+
+        for name, values in zip(self.headers, self.columns):
+            column_type, buffer, dictionary = self._encode_column(values)
+            column_meta = {'n': name, 't': column_type, 'o': offset, 'l': len(buffer)}
+            if dictionary is not None:
+                column_meta['v'] = dictionary
+            columns_meta.append(column_meta)
+
+            padding = b'\0' * (-len(buffer) % 8)
+            buffers.append(buffer + padding)
+            offset += len(buffer) + len(padding)
+
+        header_data = {'c': row_count, 'cols': columns_meta}
+        if self.metadata.get('watermark') is not None:
+            header_data['w'] = self.metadata['watermark']
+
+        header = serialization.dumps_bytes(header_data)
+
+        prefix = self.MAGIC + struct.pack('<I', len(header)) + header
+        prefix += b'\0' * (-len(prefix) % 8)
+        return b''.join([prefix] + buffers)
+
+    @staticmethod
+    def _encode_column(values: List[Any]):
+        """Выбирает тип колонки по значениям и возвращает (тип, буфер, словарь)"""
+        sample = next((value for value in values if value is not None), None)
+        has_nulls = any(value is None for value in values)
+
+        if isinstance(sample, bool):
+            column_type, buffer = 'bool', array('B', [1 if value else 0 for value in values])
+        elif isinstance(sample, int) and not has_nulls and -2 ** 31 <= min(values) and max(values) < 2 ** 31:
+            column_type, buffer = 'i32', array('i', values)
+        elif isinstance(sample, datetime):
+            column_type = 'date'
+            buffer = array('d', [
+                serialization.epoch_seconds(value) if value is not None else math.nan for value in values
+            ])
+        elif isinstance(sample, (int, float, Decimal)):
+            column_type = 'f64'
+            buffer = array('d', [float(value) if value is not None else math.nan for value in values])
+        else:
+            # Строки и прочее - словарь уникальных значений + целочисленные коды
+            codes_by_value = {}
+            codes = [codes_by_value.setdefault(value, len(codes_by_value)) for value in values]
+            dictionary = list(codes_by_value)
+            if len(dictionary) <= 0xFF:
+                column_type, typecode = 'dict8', 'B'
+            elif len(dictionary) <= 0xFFFF:
+                column_type, typecode = 'dict16', 'H'
+            else:
+                column_type, typecode = 'dict32', 'i'
+            buffer = array(typecode, codes)
+            if sys.byteorder == 'big':
+                buffer.byteswap()
+            return column_type, buffer.tobytes(), dictionary
+
+        if sys.byteorder == 'big':
+            buffer.byteswap()
+        return column_type, buffer.tobytes(), None
@@ -0,0 +1,333 @@
+import asyncio
+import re
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Optional
+
+import asyncpg
+
+from .catalog import quote_ident
+from .database import DatabaseManager
+
+
+# Границы секции из pg_get_expr(relpartbound): FOR VALUES FROM ('...') TO ('...')
+PARTITION_BOUND = re.compile(r"FROM \('([^']+)'\) TO \('([^']+)'\)")
+PARTITION_INTERVALS = {'day': timedelta(days=1), 'week': timedelta(weeks=1)}
+RETENTION_MODES = ('drop', 'detach')
+
+
+class PartitionManager:
+    """Секции server_metrics по периодам timestamp (день или неделя) и хранение данных.
+
+    - секции создаются заранее на premake периодов вперед, а для строк других периодов -
+      перед COPY (хук порций DatabaseManager), поэтому загрузка не попадает в секцию
+      по умолчанию; запросы с диапазоном времени читают только нужные секции (partition pruning);
+    - строки, все же попавшие в секцию по умолчанию, переносятся в свои секции при старте
+      и обслуживании: DETACH/ATTACH секции по умолчанию блокирует таблицу целиком, в пути записи его нет;
+    - хранение: секции старше retention_days отсоединяются (DETACH) и удаляются (drop)
+      или остаются отдельными таблицами (detach) - O(1) без DELETE; rollup за тот же период
+      удаляются, а горизонт публикуется вместе с версией таблицы (кеш, копия в памяти);
+    - несекционированная таблица прежних версий переносится в секции один раз при старте.
+    """
+
+    TABLE = 'server_metrics'
+    TIME_FIELD = 'timestamp'
+    # Порция с разбросом времени больше стольких периодов не создает секции (ошибочные даты)
+    MAX_NEW_PARTITIONS = 400
+
+    def __init__(self, db_manager: DatabaseManager, interval: str = 'day', premake: int = 7,
+                 retention_days: int = 0, retention_mode: str = 'drop', rollups=None,
+                 maintenance_interval: float = 3600):
+        if interval not in PARTITION_INTERVALS:
+            raise ValueError(f"Неизвестный период секций: {interval} (допустимы: {', '.join(PARTITION_INTERVALS)})")
+        if retention_mode not in RETENTION_MODES:
+            raise ValueError(f"Неизвестный режим хранения: {retention_mode} (допустимы: {', '.join(RETENTION_MODES)})")
+        self.db_manager = db_manager
+        self.interval = interval
+        self.step = PARTITION_INTERVALS[interval]
+        self.premake = premake
+        self.retention_days = retention_days
+        self.retention_mode = retention_mode
+        self.rollups = rollups
+        self.maintenance_interval = maintenance_interval
+        self.default_partition = f"{self.TABLE}_default"
+        # Начала периодов созданных секций (в этом процессе и прочитанные из каталога)
+        self.partitions: Dict[datetime, str] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._stats = {'created': 0, 'expired': 0, 'moved_from_default': 0, 'runs': 0,
+                       'errors': 0, 'last_run_seconds': None}
+
+    async def initialize(self):
+        """Переносит несекционированную таблицу, создает секции вперед и подключает хук порций"""
+        async with self.db_manager.pool.acquire() as conn:
+            relkind = await conn.fetchval('SELECT relkind FROM pg_class WHERE oid = to_regclass($1)', self.TABLE)
+            if relkind == 'r':
+                await self._migrate_heap(conn)
+            elif relkind != 'p':
+                print(f"⚠️ Таблица {self.TABLE} не найдена, секционирование отключено")
+                return
+            await self._load_partitions(conn)
+            await self._premake(conn)
+
+        self.db_manager.add_batch_hook(self.TABLE, self.TIME_FIELD, self.ensure_range)
+        print(f"✅ Секции {self.TABLE} готовы: {len(self.partitions)} (период {self.interval}, "
+              f"хранение {f'{self.retention_days} дн., {self.retention_mode}' if self.retention_days else 'без ограничения'})")
+
+    async def start(self, app=None):
+        """Запускает обслуживание секций (подходит как обработчик app.on_startup)"""
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self, app=None):
+        """Останавливает обслуживание секций (подходит как обработчик app.on_cleanup)"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            started = time.monotonic()
+            try:
+                async with self.db_manager.pool.acquire() as conn:
+                    await self._premake(conn)
+                await self.apply_retention()
+                self._stats['runs'] += 1
+                self._stats['last_run_seconds'] = round(time.monotonic() - started, 3)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self._stats['errors'] += 1
+                print(f"⚠️ Ошибка обслуживания секций {self.TABLE}: {e}")
+            await asyncio.sleep(self.maintenance_interval)
+
+    def period_start(self, value: datetime) -> datetime:
+        """Начало периода секции (неделя - с понедельника, как date_trunc('week'))"""
+        if value.tzinfo is not None:
+            value = value.astimezone(timezone.utc).replace(tzinfo=None)
+        day = value.replace(hour=0, minute=0, second=0, microsecond=0)
+        if self.interval == 'week':
+            day -= timedelta(days=day.weekday())
+        return day
+
+    def partition_name(self, start: datetime) -> str:
+        return f"{self.TABLE}_p{start:%Y%m%d}"
+
+    async def ensure_range(self, conn, low: Any, high: Any, limit: Optional[int] = MAX_NEW_PARTITIONS,
+                           rescue: bool = False) -> int:
+        """Создает секции периодов [low, high], которых еще нет; возвращает число созданных.
+
+        Хук порций: вызывается до COPY, один раз на загрузку, если ее границы известны заранее.
+        limit - наибольший разброс периодов (None - без ограничения). Период, строки которого
+        уже в секции по умолчанию, без rescue пропускается - их перенесет обслуживание.
+        """
+        if isinstance(low, str):
+            low, high = datetime.fromisoformat(low), datetime.fromisoformat(high)
+        if not isinstance(low, datetime) or not isinstance(high, datetime):
+            return 0
+        first, last = self.period_start(low), self.period_start(high)
+        if limit is not None and (last - first) // self.step >= limit:
+            print(f"⚠️ Разброс времени порции {low} - {high} слишком большой, "
+                  f"строки без секции попадут в {self.default_partition}")
+            return 0
+
+        starts = []
+        start = first
+        while start <= last:
+            if start not in self.partitions:
+                starts.append(start)
+            start += self.step
+        if not starts:
+            return 0
+
+        await self._load_partitions(conn)
+        created = 0
+        for start in starts:
+            if start not in self.partitions:
+                created += await self._create_partition(conn, start, rescue)
+        return created
+
+    async def _premake(self, conn):
+        """Секции текущего периода и premake периодов вперед, перенос строк из секции по умолчанию"""
+        async with conn.transaction():
+            await self.db_manager.lock_table_writes(conn, self.TABLE)
+            now = datetime.now(timezone.utc).replace(tzinfo=None)
+            created = await self.ensure_range(conn, now, now + self.step * self.premake, rescue=True)
+            created += await self._rescue_default(conn)
+        if created:
+            print(f"🧩 Созданы секции {self.TABLE}: {created}")
+
+    async def _rescue_default(self, conn) -> int:
+        """Секции для периодов, строки которых лежат в секции по умолчанию (с переносом строк)"""
+        time_column = quote_ident(self.TIME_FIELD)
+        rows = await conn.fetch(
+            f"SELECT DISTINCT date_trunc('{self.interval}', {time_column}) AS start "
+            f"FROM {quote_ident(self.default_partition)} WHERE {time_column} IS NOT NULL "
+            f"ORDER BY 1 DESC LIMIT $1",
+            self.MAX_NEW_PARTITIONS
+        )
+        if rows:
+            await self._load_partitions(conn)
+        created = 0
+        for row in rows:
+            if row['start'] not in self.partitions:
+                created += await self._create_partition(conn, row['start'], rescue=True)
+        return created
+
+    async def _load_partitions(self, conn):
+        rows = await conn.fetch('''
+            SELECT child.relname AS name, pg_get_expr(child.relpartbound, child.oid) AS bound
+            FROM pg_inherits inh
+            JOIN pg_class child ON child.oid = inh.inhrelid
+            WHERE inh.inhparent = to_regclass($1)
+        ''', self.TABLE)
+        partitions = {}
+        for row in rows:
+            match = PARTITION_BOUND.search(row['bound'] or '')
+            if match:
+                partitions[datetime.fromisoformat(match.group(1))] = row['name']
+        self.partitions = partitions
+
+    async def _create_partition(self, conn, start: datetime, rescue: bool = False) -> int:
+        name = quote_ident(self.partition_name(start))
+        table = quote_ident(self.TABLE)
+        default = quote_ident(self.default_partition)
+        time_column = quote_ident(self.TIME_FIELD)
+        end = start + self.step
+        bounds = f"FOR VALUES FROM ('{start.isoformat(' ')}') TO ('{end.isoformat(' ')}')"
+
+        has_default_rows = await conn.fetchval(
+            f'SELECT EXISTS (SELECT 1 FROM {default} WHERE {time_column} >= $1 AND {time_column} < $2)',
+            start, end
+        )
+        if has_default_rows and not rescue:
+            # CREATE ... PARTITION OF не пройдет проверку секции по умолчанию, перенос - при обслуживании
+            return 0
+        try:
+            if has_default_rows:
+                # Строки периода уже в секции по умолчанию: без нее создаем секцию и переносим их
+                async with conn.transaction():
+                    await conn.execute(f'ALTER TABLE {table} DETACH PARTITION {default}')
+                    await conn.execute(f'CREATE TABLE {name} PARTITION OF {table} {bounds}')
+                    moved = await conn.execute(f'''
+                        WITH moved AS (
+                            DELETE FROM {default} WHERE {time_column} >= $1 AND {time_column} < $2 RETURNING *
+                        )
+                        INSERT INTO {table} SELECT * FROM moved
+                    ''', start, end)
+                    await conn.execute(f'ALTER TABLE {table} ATTACH PARTITION {default} DEFAULT')
+                self._stats['moved_from_default'] += int(moved.split()[-1])
+            else:
+                async with conn.transaction():
+                    await conn.execute(f'CREATE TABLE IF NOT EXISTS {name} PARTITION OF {table} {bounds}')
+        except (asyncpg.DuplicateTableError, asyncpg.UniqueViolationError):
+            # Секцию одновременно создало другое соединение этой же загрузки
+            self.partitions[start] = self.partition_name(start)
+            return 0
+        self.partitions[start] = self.partition_name(start)
+        self._stats['created'] += 1
+        return 1
+
+    async def apply_retention(self) -> Optional[datetime]:
+        """Отсоединяет (и удаляет) секции старше retention_days; возвращает новый горизонт"""
+        if not self.retention_days:
+            return None
+        horizon = await self.db_manager.expire_table_rows(self.TABLE, self._expire)
+        if horizon is not None:
+            print(f"🧹 Хранение {self.TABLE}: удалены данные раньше {horizon}")
+        return horizon
+
+    async def _expire(self, conn) -> Optional[datetime]:
+        """Секции, целиком старше срока хранения; вызывается в транзакции записи"""
+        await self._load_partitions(conn)
+        cutoff = datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(days=self.retention_days)
+        expired = [start for start in sorted(self.partitions) if start + self.step <= cutoff]
+        if not expired:
+            return None
+
+        table = quote_ident(self.TABLE)
+        for start in expired:
+            name = self.partitions.pop(start)
+            await conn.execute(f'ALTER TABLE {table} DETACH PARTITION {quote_ident(name)}')
+            if self.retention_mode == 'drop':
+                await conn.execute(f'DROP TABLE {quote_ident(name)}')
+            else:
+                # Имя освобождается: новая секция того же периода не должна совпасть с архивной таблицей
+                await conn.execute(f'ALTER TABLE {quote_ident(name)} RENAME TO {quote_ident(name + "_archive")}')
+        horizon = expired[-1] + self.step
+
+        # Строки того же возраста в секции по умолчанию и rollup за удаленные периоды
+        await conn.execute(
+            f'DELETE FROM {quote_ident(self.default_partition)} WHERE {quote_ident(self.TIME_FIELD)} < $1',
+            horizon
+        )
+        if self.rollups is not None:
+            await self.rollups.drop_before(conn, horizon)
+        self._stats['expired'] += len(expired)
+        return horizon
+
+    async def _migrate_heap(self, conn):
+        """Однократный перенос несекционированной таблицы в секции (id сохраняются)"""
+        print(f"🔄 Переносим {self.TABLE} в секционированную таблицу...")
+        started = time.monotonic()
+        heap = f"{self.TABLE}_heap"
+        schema = await self.db_manager.get_table_schema(self.TABLE)
+        columns = ', '.join(quote_ident(column.name) for column in schema.columns)
+
+        async with conn.transaction():
+            await self.db_manager.lock_table_writes(conn, self.TABLE)
+            await conn.execute(f'ALTER TABLE {quote_ident(self.TABLE)} RENAME TO {quote_ident(heap)}')
+            # Имена индексов и ограничений общие для схемы - освобождаем их для новой таблицы
+            constraints = await conn.fetch(
+                'SELECT conname FROM pg_constraint WHERE conrelid = to_regclass($1)', heap
+            )
+            for row in constraints:
+                await conn.execute(
+                    f'ALTER TABLE {quote_ident(heap)} RENAME CONSTRAINT {quote_ident(row["conname"])} '
+                    f'TO {quote_ident(heap + "_" + row["conname"])}'
+                )
+            indexes = await conn.fetch('''
+                SELECT idx.relname FROM pg_index ind JOIN pg_class idx ON idx.oid = ind.indexrelid
+                WHERE ind.indrelid = to_regclass($1)
+                  AND NOT EXISTS (SELECT 1 FROM pg_constraint con WHERE con.conindid = ind.indexrelid)
+            ''', heap)
+            for row in indexes:
+                await conn.execute(f'DROP INDEX {quote_ident(row["relname"])}')
+
+            await self.db_manager.create_data_table(conn)
+            low, high = await conn.fetchrow(
+                f'SELECT MIN({quote_ident(self.TIME_FIELD)}), MAX({quote_ident(self.TIME_FIELD)}) FROM {quote_ident(heap)}'
+            )
+            if low is not None:
+                await self.ensure_range(conn, low, high, limit=None)
+            moved = await conn.execute(
+                f'INSERT INTO {quote_ident(self.TABLE)} ({columns}) SELECT {columns} FROM {quote_ident(heap)}'
+            )
+            await conn.execute(f'''
+                SELECT setval(pg_get_serial_sequence($1, 'id'), COALESCE(MAX(id), 0) + 1, false)
+                FROM {quote_ident(self.TABLE)}
+            ''', self.TABLE)
+            await conn.execute(f'DROP TABLE {quote_ident(heap)}')
+            await self.db_manager.publish_table_change(conn, self.TABLE, apply=False)
+
+        await self.db_manager.load_catalog([self.TABLE])
+        await self.db_manager.load_table_versions()
+        print(f"✅ {self.TABLE} перенесена в секции: {int(moved.split()[-1])} строк, "
+              f"{time.monotonic() - started:.1f} с")
+
+    def stats(self) -> Dict[str, Any]:
+        horizon = self.db_manager.get_table_horizon(self.TABLE)
+        return {
+            **self._stats,
+            'table': self.TABLE,
+            'interval': self.interval,
+            'partitions': len(self.partitions),
+            'first': min(self.partitions).isoformat() if self.partitions else None,
+            'last': max(self.partitions).isoformat() if self.partitions else None,
+            'retention_days': self.retention_days,
+            'retention_mode': self.retention_mode,
+            'horizon': horizon.isoformat() if horizon else None,
+        }
@@ -0,0 +1,971 @@
+import hashlib
+import json
+from datetime import datetime, timezone
+from decimal import Decimal
+from typing import List, Dict, Any, Tuple, Optional
+from . import serialization
+from .database import DatabaseManager
+from .columnar import ColumnarStore
+from .downsampling import lttb
+from .rollups import Rollup, RollupManager
+
+
+class QueryEngine:
+    """Выполняет агрегацию панелей на стороне PostgreSQL (GROUP BY вместо сырых строк)"""
+
+    # Агрегации, поддерживаемые конфигурацией мер панели
+    AGGREGATIONS = {'count', 'count_distinct', 'sum', 'avg', 'min', 'max'}
+
+    # Гранулярность для размерностей типа date (на клиенте группировка по дню)
+    DATE_GRANULARITIES = {'minute', 'hour', 'day', 'week', 'month', 'year'}
+
+    NUMERIC_TYPES = {'integer', 'bigint', 'smallint', 'numeric', 'real', 'double precision'}
+    DATE_TYPES = {'timestamp without time zone', 'timestamp with time zone', 'date'}
+
+    DEFAULT_LIMIT = 5000
+    MAX_LIMIT = 50000
+
+    # GROUPING() в PostgreSQL принимает не более 32 аргументов
+    MAX_GROUPING_COLUMNS = 31
+
+    # Даунсэмплинг временных рядов: lttb - точки формы ряда, minmax - min/max/avg по корзинам
+    DOWNSAMPLE_METHODS = {'lttb', 'minmax'}
+    DEFAULT_DOWNSAMPLE_POINTS = 1000
+    MAX_DOWNSAMPLE_POINTS = 5000
+    MAX_DOWNSAMPLE_SERIES = 50
+    # Для LTTB SQL предварительно оставляет min и max точки из points * ratio / 2 корзин
+    LTTB_PRESELECT_RATIO = 4
+    # Значения фильтров: top-K по числу строк для высококардинальных колонок
+    DEFAULT_FACET_VALUES = 50
+    MAX_FACET_VALUES = 1000
+    MAX_FACET_COLUMNS = 20
+
+    # Язык фильтров: листья {"field", "op", ...} и группы {"and": [...]}/{"or": [...]}
+    FILTER_OPS = {'eq', 'in', 'range', 'prefix', 'null'}
+    RANGE_OPERATORS = {'gt': '>', 'gte': '>=', 'lt': '<', 'lte': '<='}
+    TEXT_TYPES = {'character varying', 'text', 'character'}
+    MAX_FILTER_CONDITIONS = 100
+    MAX_FILTER_DEPTH = 8
+    MAX_IN_VALUES = 1000
+
+    def __init__(self, db_manager: DatabaseManager, rollups: RollupManager = None,
+                 columnar: ColumnarStore = None):
+        self.db_manager = db_manager
+        # Агрегаты, на которые точно отвечают rollup, читаются из предагрегированных таблиц
+        self.rollups = rollups
+        # Актуальная копия таблицы в памяти отвечает без запросов к БД
+        self.columnar = columnar
+
+    async def get_column_types(self, table_name: str) -> Dict[str, str]:
+        """Возвращает типы колонок таблицы из каталога схемы (без запроса к БД)"""
+        return (await self.db_manager.get_table_schema(table_name)).column_types
+
+    async def aggregate(self, table_name: str, config: Dict[str, Any],
+                        filters: Dict[str, Any] = None, limit: int = None,
+                        date_range: Dict[str, Any] = None) -> List[Dict[str, Any]]:
+        """Агрегирует данные по конфигурации панели и возвращает только итоговые ячейки"""
+        column_types = await self.get_column_types(table_name)
+        if self.in_memory(table_name, config, filters, date_range):
+            return self._aggregate_in_memory(config, column_types, filters, limit, date_range)
+
+        rollup = self.route(table_name, config, filters, date_range)
+        query, params, _ = self.build_aggregate_query(
+            table_name, config, column_types, filters, limit, date_range, rollup=rollup
+        )
+
+        async with self.db_manager.pool.acquire() as conn:
+            rows = await conn.fetch(query, *params)
+
+        return [dict(row) for row in rows]
+
+    async def evaluate_layout(self, layout: Dict[str, Any], filters: Dict[str, Any] = None,
+                              limit: int = None, date_range: Dict[str, Any] = None) -> Dict[str, Any]:
+        """Считает все панели layout.
+
+        Панели с одинаковой таблицей, фильтрами и временным диапазоном
+        объединяются в один запрос с GROUPING SETS — один проход по таблице.
+        """
+        results = {}
+        batches: Dict[str, Dict[str, Any]] = {}
+
+        for panel in layout.get('panels') or []:
+            panel_id = panel.get('id')
+            config = panel.get('config') or {}
+            table_name = config.get('table', 'server_metrics')
+            panel_filters = {**(filters or {}), **(config.get('filters') or {})}
+            panel_range = config.get('dateRange') or date_range
+
+            # Графики временных рядов считаются отдельным даунсэмплингом, а не GROUP BY
+            if config.get('downsample'):
+                try:
+                    results[panel_id] = await self.downsample(
+                        table_name, config['downsample'], panel_filters, panel_range
+                    )
+                except ValueError as e:
+                    results[panel_id] = {'error': str(e)}
+                continue
+
+            try:
+                column_types = await self.get_column_types(table_name)
+                if self.in_memory(table_name, config, panel_filters, panel_range):
+                    rows = self._aggregate_in_memory(config, column_types, panel_filters,
+                                                     config.get('limit') or limit, panel_range)
+                    headers = self._compile_panel(config, column_types)['headers']
+                    results[panel_id] = {
+                        'h': headers,
+                        'd': [[row[header] for header in headers] for row in rows],
+                        'c': len(rows),
+                        'src': 'memory'
+                    }
+                    continue
+                rollup = self.route(table_name, config, panel_filters, panel_range)
+                compiled = self._compile_panel(config, column_types, rollup)
+            except ValueError as e:
+                results[panel_id] = {'error': str(e)}
+                continue
+
+            # Панели из одного rollup объединяются так же, как панели одной таблицы
+            source = rollup.name if rollup else table_name
+            batch_key = json.dumps([source, panel_filters, panel_range], sort_keys=True, default=str)
+            batch = batches.setdefault(batch_key, {
+                'table': table_name,
+                'rollup': rollup,
+                'filters': panel_filters,
+                'date_range': panel_range,
+                'panels': []
+            })
+            batch['panels'].append((panel_id, config, compiled))
+
+        scans = 0
+        for batch in batches.values():
+            column_types = await self.get_column_types(batch['table'])
+            for chunk in self._split_by_grouping_limit(batch['panels']):
+                try:
+                    query, params, layout_sets = self.build_grouping_sets_query(
+                        batch['table'], [compiled for _, _, compiled in chunk], column_types,
+                        batch['filters'], batch['date_range'], rollup=batch['rollup']
+                    )
+                except ValueError as e:
+                    for panel_id, _, _ in chunk:
+                        results[panel_id] = {'error': str(e)}
+                    continue
+
+                async with self.db_manager.pool.acquire() as conn:
+                    rows = await conn.fetch(query, *params)
+                scans += 1
+
+                for (panel_id, config, compiled), panel_set in zip(chunk, layout_sets):
+                    panel_rows = self._extract_panel_rows(rows, compiled, panel_set)
+                    panel_rows = self._sort_rows(panel_rows, compiled['order'])
+                    panel_rows = panel_rows[:min(int(config.get('limit') or limit or self.DEFAULT_LIMIT),
+                                                 self.MAX_LIMIT)]
+                    results[panel_id] = {
+                        'h': compiled['headers'],
+                        'd': [[row[header] for header in compiled['headers']] for row in panel_rows],
+                        'c': len(panel_rows),
+                        'src': batch['rollup'].name if batch['rollup'] else batch['table']
+                    }
+
+        return {'panels': results, 'scans': scans}
+
+    def in_memory(self, table_name: str, config: Dict[str, Any], filters: Dict[str, Any] = None,
+                  date_range: Dict[str, Any] = None) -> bool:
+        """Панель можно посчитать по колоночной копии таблицы в памяти"""
+        return self.columnar is not None and self.columnar.can_answer(
+            table_name, ColumnarStore.config_fields(config), filters, date_range
+        )
+
+    def _aggregate_in_memory(self, config: Dict[str, Any], column_types: Dict[str, str],
+                             filters: Dict[str, Any] = None, limit: int = None,
+                             date_range: Dict[str, Any] = None) -> List[Dict[str, Any]]:
+        compiled = self._compile_panel(config, column_types)
+        rows = self.columnar.aggregate(config, compiled, filters, date_range, self.parse_datetime)
+        rows = self._sort_rows(rows, compiled['order'])
+        return rows[:min(int(limit or self.DEFAULT_LIMIT), self.MAX_LIMIT)]
+
+    def route(self, table_name: str, config: Dict[str, Any], filters: Dict[str, Any] = None,
+              date_range: Dict[str, Any] = None) -> Optional[Rollup]:
+        """Rollup, который точно отвечает на панель, или None (читаем сырую таблицу)"""
+        if self.rollups is None:
+            return None
+        return self.rollups.route(table_name, config, filters, date_range, self.parse_datetime)
+
+    async def downsample(self, table_name: str, spec: Dict[str, Any], filters: Dict[str, Any] = None,
+                         date_range: Dict[str, Any] = None) -> Dict[str, Any]:
+        """Даунсэмплинг временного ряда до spec['points'] точек на серию.
+
+        spec: timeField, measure, seriesField (необязательно), points, method (lttb|minmax).
+        Возвращает {'h', 'd', 'c'} как панели layout.
+        """
+        column_types = await self.get_column_types(table_name)
+        query, params, plan = self.build_downsample_query(table_name, spec, column_types, filters, date_range)
+
+        fields = {plan['time_field'], plan['measure']} | ({plan['series_field']} if plan['series_field'] else set())
+        if self.columnar is not None and self.columnar.can_answer(table_name, fields, filters, date_range):
+            rows = self.columnar.downsample_rows(plan, filters, date_range, self.parse_datetime)
+        else:
+            async with self.db_manager.pool.acquire() as conn:
+                if plan['series_query'] is not None:
+                    # Число серий проверяется до выборки точек: высококардинальная серия не тянет всю таблицу
+                    series_query, series_params = plan['series_query']
+                    self._check_series_count(await conn.fetchval(series_query, *series_params))
+                rows = await conn.fetch(query, *params)
+
+        series_rows: Dict[Any, List] = {}
+        for row in rows:
+            series_rows.setdefault(row['s'], []).append(row)
+        self._check_series_count(len(series_rows))
+
+        epoch_time = column_types[plan['time_field']] in self.DATE_TYPES
+        data = []
+        for series, series_points in series_rows.items():
+            prefix = [series] if plan['series_field'] else []
+            if plan['method'] == 'minmax':
+                for row in series_points:
+                    t = int(row['t']) if epoch_time else row['t']
+                    data.append(prefix + [t, row['vmin'], row['vmax'], row['vavg'], row['cnt']])
+            else:
+                for t, v in lttb([(row['t'], row['v']) for row in series_points], plan['points']):
+                    data.append(prefix + [int(t) if epoch_time else t, v])
+
+        return {'h': plan['headers'], 'd': data, 'c': len(data)}
+
+    async def render_layout(self, dashboard_id: str, name: str, layout: Dict[str, Any],
+                            limit: int = None) -> str:
+        """JSON ответа /api/layout/data для сохраненного layout (без дополнительных фильтров)"""
+        result = await self.evaluate_layout(layout, limit=limit)
+        result['dashboard_id'] = dashboard_id
+        result['name'] = name
+        return serialization.dumps(result)
+
+    async def facets(self, table_name: str, columns: List[str], filters: Dict[str, Any] = None,
+                     prefix: str = None, limit: int = None,
+                     date_range: Dict[str, Any] = None) -> Dict[str, Any]:
+        """Значения колонок и число строк каждого под текущими фильтрами (для списков фильтров).
+
+        Фильтр по самой колонке к ее значениям не применяется - в списке остаются альтернативы.
+        prefix - поиск по началу значения без учета регистра, limit - top-K по числу строк.
+        """
+        column_types = await self.get_column_types(table_name)
+        if not columns:
+            raise ValueError('Не указаны колонки')
+        if len(columns) > self.MAX_FACET_COLUMNS:
+            raise ValueError(f"Слишком много колонок (> {self.MAX_FACET_COLUMNS})")
+        try:
+            limit = max(1, min(int(limit or self.DEFAULT_FACET_VALUES), self.MAX_FACET_VALUES))
+        except (TypeError, ValueError):
+            raise ValueError(f"Некорректный лимит: {limit}")
+
+        result = {}
+        for column in columns:
+            self._check_column(column, column_types)
+            column_filters = {name: value for name, value in (filters or {}).items() if name != column}
+
+            if self.columnar is not None and self.columnar.can_answer(table_name, {column}, column_filters, date_range) \
+                    and self.columnar.kinds[column] == 'category':
+                counts = self.columnar.facet_counts(column, column_filters, date_range, self.parse_datetime)
+                result[column] = self._top_facets(counts, prefix, limit)
+                continue
+
+            query, params = self.build_facet_query(table_name, column, column_types, column_filters,
+                                                   prefix, limit, date_range)
+            async with self.db_manager.pool.acquire() as conn:
+                rows = await conn.fetch(query, *params)
+            distinct = rows[0]['distinct_values'] if rows else 0
+            result[column] = {
+                'values': [[row['value'], row['count']] for row in rows],
+                'distinct': distinct,
+                'truncated': distinct > len(rows)
+            }
+
+        return {'table': table_name, 'facets': result}
+
+    @staticmethod
+    def _top_facets(counts: Dict[Any, int], prefix: str = None, limit: int = DEFAULT_FACET_VALUES) -> Dict[str, Any]:
+        """Top-K значений по числу строк (при равенстве - по значению), с фильтром по префиксу"""
+        prefix = (prefix or '').lower()
+        matched = [
+            (value, count) for value, count in counts.items()
+            if value is not None and str(value).lower().startswith(prefix)
+        ]
+        matched.sort(key=lambda item: (-item[1], str(item[0])))
+        return {
+            'values': [[value, count] for value, count in matched[:limit]],
+            'distinct': len(matched),
+            'truncated': len(matched) > limit
+        }
+
+    @classmethod
+    def build_facet_query(cls, table_name: str, column: str, column_types: Dict[str, str],
+                          filters: Dict[str, Any] = None, prefix: str = None, limit: int = None,
+                          date_range: Dict[str, Any] = None) -> Tuple[str, List[Any]]:
+        """GROUP BY колонки с top-K по числу строк; distinct_values - число значений до LIMIT"""
+        column_sql = cls.quote_ident(cls._check_column(column, column_types))
+        where_clause, params = cls.build_where(filters, column_types, date_range=date_range)
+        where_clause += f" AND {column_sql} IS NOT NULL"
+
+        if prefix:
+            params.append(cls.escape_like(prefix) + '%')
+            where_clause += f" AND {column_sql}::text ILIKE ${len(params)}"
+
+        params.append(int(limit or cls.DEFAULT_FACET_VALUES))
+        query = (
+            f"SELECT {column_sql} AS value, COUNT(*) AS count, COUNT(*) OVER () AS distinct_values "
+            f"FROM {cls.quote_ident(table_name)} WHERE {where_clause} "
+            f"GROUP BY 1 ORDER BY 2 DESC, 1 LIMIT ${len(params)}"
+        )
+        return query, params
+
+    @staticmethod
+    def layout_tables(layout: Dict[str, Any]) -> Tuple[str, ...]:
+        """Таблицы, которые читают панели layout"""
+        tables = {
+            (panel.get('config') or {}).get('table', 'server_metrics')
+            for panel in layout.get('panels') or []
+        }
+        return tuple(sorted(tables))
+
+    @staticmethod
+    def layout_cache_key(dashboard_id: str, name: str, layout: Dict[str, Any], limit: int = None) -> str:
+        """Ключ кеша результата layout: меняется при сохранении новой конфигурации панелей"""
+        panels_hash = hashlib.md5(
+            json.dumps(layout.get('panels') or [], sort_keys=True, default=str).encode('utf-8')
+        ).hexdigest()[:12]
+        return f"layout_{dashboard_id}_{name}_{limit}_{panels_hash}"
+
+    @classmethod
+    def build_downsample_query(cls, table_name: str, spec: Dict[str, Any], column_types: Dict[str, str],
+                               filters: Dict[str, Any] = None,
+                               date_range: Dict[str, Any] = None) -> Tuple[str, List[Any], Dict[str, Any]]:
+        """Компилирует даунсэмплинг в один проход по таблице.
+
+        Ось времени делится на равные корзины (width_bucket). minmax возвращает
+        min/max/avg/count каждой корзины; lttb - по две точки (min и max) из более
+        мелких корзин, окончательный выбор точек делает LTTB (MinMax-предвыборка).
+        Возвращает (sql, params, plan).
+        """
+        method = spec.get('method', 'lttb')
+        if method not in cls.DOWNSAMPLE_METHODS:
+            raise ValueError(f"Неизвестный метод даунсэмплинга: {method}")
+
+        time_field = cls._check_column(spec.get('timeField', 'timestamp'), column_types)
+        if column_types[time_field] in cls.DATE_TYPES:
+            time_expression = f"EXTRACT(EPOCH FROM {cls.quote_ident(time_field)})::double precision"
+        elif column_types[time_field] in cls.NUMERIC_TYPES:
+            time_expression = f"{cls.quote_ident(time_field)}::double precision"
+        else:
+            raise ValueError(f"Колонка времени должна быть датой или числом: {time_field}")
+
+        measure = cls._check_column(spec.get('measure'), column_types)
+        if column_types[measure] not in cls.NUMERIC_TYPES:
+            raise ValueError(f"Мера должна быть числовой колонкой: {measure}")
+
+        series_field = spec.get('seriesField')
+        if series_field:
+            cls._check_column(series_field, column_types)
+
+        try:
+            points = int(spec.get('points') or cls.DEFAULT_DOWNSAMPLE_POINTS)
+        except (TypeError, ValueError):
+            raise ValueError(f"Некорректное число точек: {spec.get('points')}")
+        points = max(3, min(points, cls.MAX_DOWNSAMPLE_POINTS))
+
+        where_clause, params = cls.build_where(filters, column_types, date_range=date_range)
+        buckets = points if method == 'minmax' else points * cls.LTTB_PRESELECT_RATIO // 2
+        params.append(buckets)
+
+        series_expression = cls.quote_ident(series_field) if series_field else 'NULL'
+        measure_column = cls.quote_ident(measure)
+        points_where = (
+            f"{where_clause} AND {measure_column} IS NOT NULL AND {cls.quote_ident(time_field)} IS NOT NULL"
+        )
+
+        series_query = None
+        if series_field:
+            # Различных серий не больше лимита + 1: этого достаточно, чтобы отказать
+            series_params = params[:-1] + [cls.MAX_DOWNSAMPLE_SERIES + 1]
+            series_query = (
+                f"SELECT count(*) FROM (SELECT DISTINCT {series_expression} FROM {cls.quote_ident(table_name)}"
+                f" WHERE {points_where} LIMIT ${len(series_params)}) series",
+                series_params
+            )
+
+        query = f"""
+            WITH points AS (
+                SELECT {series_expression} AS s, {time_expression} AS t, {measure_column}::double precision AS v
+                FROM {cls.quote_ident(table_name)}
+                WHERE {points_where}
+            ),
+            bucketed AS (
+                SELECT s, t, v, width_bucket(t, bounds.lo, bounds.hi, ${len(params)}::int) AS bucket
+                FROM points
+                CROSS JOIN (SELECT min(t) AS lo, GREATEST(max(t), min(t) + 1) AS hi FROM points) bounds
+            )
+        """
+
+        if method == 'minmax':
+            query += """
+                SELECT s, min(t) AS t, min(v) AS vmin, max(v) AS vmax, avg(v) AS vavg, count(*) AS cnt
+                FROM bucketed
+                GROUP BY s, bucket
+                ORDER BY s, t
+            """
+            value_headers = [time_field, f"{measure}_min", f"{measure}_max", f"{measure}_avg", 'count']
+        else:
+            query += """
+                SELECT s, t, v FROM (
+                    SELECT s, t, v,
+                           row_number() OVER (PARTITION BY s, bucket ORDER BY v, t) AS rn_min,
+                           row_number() OVER (PARTITION BY s, bucket ORDER BY v DESC, t) AS rn_max
+                    FROM bucketed
+                ) ranked
+                WHERE rn_min = 1 OR rn_max = 1
+                ORDER BY s, t
+            """
+            value_headers = [time_field, measure]
+
+        plan = {
+            'method': method,
+            'points': points,
+            'time_field': time_field,
+            'measure': measure,
+            'buckets': buckets,
+            'series_field': series_field,
+            'series_query': series_query,
+            'max_series': cls.MAX_DOWNSAMPLE_SERIES,
+            'headers': ([series_field] if series_field else []) + value_headers
+        }
+        return query, params, plan
+
+    @classmethod
+    def build_aggregate_query(cls, table_name: str, config: Dict[str, Any], column_types: Dict[str, str],
+                              filters: Dict[str, Any] = None, limit: int = None,
+                              date_range: Dict[str, Any] = None,
+                              rollup: Rollup = None) -> Tuple[str, List[Any], List[str]]:
+        """Компилирует конфигурацию панели в параметризованный GROUP BY запрос.
+
+        Возвращает (sql, params, headers). Колонки результата названы как headers:
+        поля размерностей, затем categoryField (для стекированных мер), затем ключи мер.
+        С rollup запрос читает предагрегированную таблицу вместо table_name.
+        """
+        compiled = cls._compile_panel(config, column_types, rollup)
+
+        select_parts = [f"{expression} AS {cls.quote_ident(name)}" for name, expression in compiled['groups']]
+        select_parts += [f"{expression} AS {cls.quote_ident(key)}" for key, expression in compiled['measures']]
+
+        source, where_clause, params = cls._build_source(table_name, column_types, filters, date_range, rollup)
+
+        query = f"SELECT {', '.join(select_parts)} FROM {source} WHERE {where_clause}"
+        if compiled['groups']:
+            query += f" GROUP BY {', '.join(str(i + 1) for i in range(len(compiled['groups'])))}"
+
+        if compiled['order']:
+            query += " ORDER BY " + ', '.join(
+                f"{cls.quote_ident(key)} {'DESC' if desc else 'ASC'}" for key, desc in compiled['order']
+            )
+
+        limit = min(int(limit or cls.DEFAULT_LIMIT), cls.MAX_LIMIT)
+        params.append(limit)
+        query += f" LIMIT ${len(params)}"
+
+        return query, params, compiled['headers']
+
+    @classmethod
+    def build_grouping_sets_query(cls, table_name: str, panels: List[Dict[str, Any]], column_types: Dict[str, str],
+                                  filters: Dict[str, Any] = None, date_range: Dict[str, Any] = None,
+                                  rollup: Rollup = None) -> Tuple[str, List[Any], List[Dict[str, Any]]]:
+        """Один запрос с GROUPING SETS для нескольких скомпилированных панелей.
+
+        Возвращает (sql, params, panel_sets). Для каждой панели panel_set содержит
+        маску GROUPING() её набора и алиасы колонок групп и мер в результате.
+        """
+        group_aliases: Dict[str, str] = {}
+        measure_aliases: Dict[str, str] = {}
+
+        for compiled in panels:
+            for _, expression in compiled['groups']:
+                group_aliases.setdefault(expression, f"g{len(group_aliases)}")
+            for _, expression in compiled['measures']:
+                measure_aliases.setdefault(expression, f"m{len(measure_aliases)}")
+
+        if len(group_aliases) > cls.MAX_GROUPING_COLUMNS:
+            raise ValueError('Слишком много различных размерностей для одного запроса')
+
+        group_expressions = list(group_aliases)
+        panel_sets = []
+        # Маска однозначно задает набор независимо от порядка размерностей панели:
+        # одинаковый набор дважды в GROUPING SETS удвоил бы строки каждой его панели
+        grouping_sets: Dict[int, str] = {}
+
+        for compiled in panels:
+            expressions = [expression for _, expression in compiled['groups']]
+            # Бит в GROUPING() равен 1, если колонка не входит в текущий набор
+            mask = sum(
+                1 << (len(group_expressions) - 1 - i)
+                for i, expression in enumerate(group_expressions)
+                if expression not in expressions
+            )
+            grouping_sets.setdefault(mask, '(' + ', '.join(expressions) + ')')
+            panel_sets.append({
+                'mask': mask,
+                'groups': {name: group_aliases[expression] for name, expression in compiled['groups']},
+                'measures': {key: measure_aliases[expression] for key, expression in compiled['measures']}
+            })
+
+        select_parts = [f"{expression} AS {alias}" for expression, alias in group_aliases.items()]
+        if group_expressions:
+            select_parts.append(f"GROUPING({', '.join(group_expressions)}) AS grouping_mask")
+        else:
+            select_parts.append("0 AS grouping_mask")
+        select_parts += [f"{expression} AS {alias}" for expression, alias in measure_aliases.items()]
+
+        source, where_clause, params = cls._build_source(table_name, column_types, filters, date_range, rollup)
+
+        query = (
+            f"SELECT {', '.join(select_parts)} FROM {source} WHERE {where_clause}"
+            f" GROUP BY GROUPING SETS ({', '.join(grouping_sets.values())})"
+        )
+        return query, params, panel_sets
+
+    @classmethod
+    def _build_source(cls, table_name: str, column_types: Dict[str, str], filters: Dict[str, Any] = None,
+                      date_range: Dict[str, Any] = None, rollup: Rollup = None) -> Tuple[str, str, List[Any]]:
+        """(FROM-источник, WHERE, params): сырая таблица или rollup с сырыми краями диапазона"""
+        if rollup is None:
+            where_clause, params = cls.build_where(filters, column_types, date_range=date_range)
+            return cls.quote_ident(table_name), where_clause, params
+
+        # Диапазон дат уже учтен в источнике rollup, фильтры - только по его измерениям
+        start, end = RollupManager.parse_range(date_range, cls.parse_datetime)
+        source, params = rollup.source(start, end)
+        where_clause, filter_params = cls.build_where(filters, rollup.column_types, start_index=len(params) + 1)
+        return source, where_clause, params + filter_params
+
+    @classmethod
+    def build_where(cls, filters: Dict[str, Any], column_types: Dict[str, str], start_index: int = 1,
+                    date_range: Dict[str, Any] = None) -> Tuple[str, List[Any]]:
+        """Строит WHERE из словаря фильтров (равенство или IN для списков) и временного диапазона.
+
+        Значения приводятся к типам колонок: некорректное значение - ValueError (400), а не DataError asyncpg.
+        """
+        conditions = []
+        params = []
+
+        for col_name, value in (filters or {}).items():
+            field = cls._check_column(col_name, column_types)
+            column = cls.quote_ident(field)
+            if isinstance(value, (list, tuple)):
+                params.append([cls.coerce_value(item, column_types[field], field) for item in value if item is not None])
+                conditions.append(f"{column} = ANY(${start_index + len(params) - 1})")
+            elif value is None:
+                conditions.append(f"{column} IS NULL")
+            else:
+                params.append(cls.coerce_value(value, column_types[field], field))
+                conditions.append(f"{column} = ${start_index + len(params) - 1}")
+
+        if date_range:
+            column = cls.quote_ident(cls._check_column(date_range.get('field', 'timestamp'), column_types))
+            if date_range.get('start'):
+                params.append(cls.parse_datetime(date_range['start']))
+                conditions.append(f"{column} >= ${start_index + len(params) - 1}")
+            if date_range.get('end'):
+                params.append(cls.parse_datetime(date_range['end']))
+                conditions.append(f"{column} <= ${start_index + len(params) - 1}")
+
+        return (" AND ".join(conditions) if conditions else "1=1"), params
+
+    async def compile_filter(self, table_name: str, spec: Any) -> Tuple[str, List[Any]]:
+        """Проверяет фильтр по схеме таблицы и компилирует его в (WHERE, params)"""
+        column_types = await self.get_column_types(table_name)
+        if not spec:
+            return '1=1', []
+        return self.build_filter(spec, column_types)
+
+    @classmethod
+    def build_filter(cls, spec: Any, column_types: Dict[str, str],
+                     start_index: int = 1) -> Tuple[str, List[Any]]:
+        """Компилирует фильтр в параметризованное условие с типизированными параметрами.
+
+        Лист: {"field": колонка, "op": eq|in|range|prefix|null, ...}
+          eq - "value"; in - "values"; range - любые из gt/gte/lt/lte; prefix - "value"
+          (начало строки); null - "value": true (IS NULL) или false (IS NOT NULL).
+        Группа: {"and": [...]} или {"or": [...]}. Краткая форма {"колонка": значение или список} -
+        AND равенств. Условия - простые сравнения колонок, чтобы планировщик использовал индексы.
+        """
+        params: List[Any] = []
+        conditions = [0]
+        sql = cls._compile_filter_node(spec, column_types, params, start_index, conditions, 0)
+        return sql, params
+
+    @classmethod
+    def _compile_filter_node(cls, node: Any, column_types: Dict[str, str], params: List[Any],
+                             start_index: int, conditions: List[int], depth: int) -> str:
+        if depth > cls.MAX_FILTER_DEPTH:
+            raise ValueError(f"Слишком глубокая вложенность фильтра (> {cls.MAX_FILTER_DEPTH})")
+        if not isinstance(node, dict) or not node:
+            raise ValueError(f"Некорректный узел фильтра: {node!r}")
+
+        groups = [key for key in ('and', 'or') if key in node]
+        if groups:
+            if len(node) != 1:
+                raise ValueError('Группа фильтра должна содержать только "and" или "or"')
+            children = node[groups[0]]
+            if not isinstance(children, list) or not children:
+                raise ValueError(f'"{groups[0]}" должен быть непустым списком условий')
+            parts = [
+                cls._compile_filter_node(child, column_types, params, start_index, conditions, depth + 1)
+                for child in children
+            ]
+            return parts[0] if len(parts) == 1 else '(' + f" {groups[0].upper()} ".join(parts) + ')'
+
+        if 'field' not in node:
+            # Краткая форма: {"колонка": значение} / {"колонка": [значения]}
+            leaves = [
+                {'field': name, 'op': 'in', 'values': list(value)} if isinstance(value, (list, tuple))
+                else {'field': name, 'op': 'eq', 'value': value}
+                for name, value in node.items()
+            ]
+            return cls._compile_filter_node({'and': leaves}, column_types, params, start_index, conditions, depth)
+
+        conditions[0] += 1
+        if conditions[0] > cls.MAX_FILTER_CONDITIONS:
+            raise ValueError(f"Слишком много условий в фильтре (> {cls.MAX_FILTER_CONDITIONS})")
+        return cls._compile_filter_leaf(node, column_types, params, start_index)
+
+    @classmethod
+    def _compile_filter_leaf(cls, node: Dict[str, Any], column_types: Dict[str, str],
+                             params: List[Any], start_index: int) -> str:
+        field = cls._check_column(node.get('field'), column_types)
+        column = cls.quote_ident(field)
+        data_type = column_types[field]
+        op = node.get('op', 'eq')
+        if op not in cls.FILTER_OPS:
+            raise ValueError(f"Неизвестный оператор фильтра: {op}")
+
+        def param(value: Any) -> str:
+            params.append(value)
+            return f"${start_index + len(params) - 1}"
+
+        if op == 'eq':
+            if 'value' not in node:
+                raise ValueError(f"Для eq по '{field}' нужен value")
+            if node['value'] is None:
+                return f"{column} IS NULL"
+            return f"{column} = {param(cls.coerce_value(node['value'], data_type, field))}"
+
+        if op == 'in':
+            values = node.get('values')
+            if not isinstance(values, list) or not values:
+                raise ValueError(f"Для in по '{field}' нужен непустой список values")
+            if len(values) > cls.MAX_IN_VALUES:
+                raise ValueError(f"Слишком много значений в in (> {cls.MAX_IN_VALUES})")
+            coerced = [cls.coerce_value(value, data_type, field) for value in values if value is not None]
+            condition = f"{column} = ANY({param(coerced)})" if coerced else None
+            if len(coerced) < len(values):
+                null_condition = f"{column} IS NULL"
+                return f"({condition} OR {null_condition})" if condition else null_condition
+            return condition
+
+        if op == 'range':
+            bounds = [key for key in cls.RANGE_OPERATORS if node.get(key) is not None]
+            if not bounds:
+                raise ValueError(f"Для range по '{field}' нужна хотя бы одна граница (gt/gte/lt/lte)")
+            if {'gt', 'gte'} <= set(bounds) or {'lt', 'lte'} <= set(bounds):
+                raise ValueError(f"Две нижние или две верхние границы в range по '{field}'")
+            parts = [
+                f"{column} {cls.RANGE_OPERATORS[key]} {param(cls.coerce_value(node[key], data_type, field))}"
+                for key in bounds
+            ]
+            return parts[0] if len(parts) == 1 else '(' + ' AND '.join(parts) + ')'
+
+        if op == 'prefix':
+            prefix = node.get('value')
+            if data_type not in cls.TEXT_TYPES:
+                raise ValueError(f"prefix применим только к строковым колонкам: '{field}'")
+            if not isinstance(prefix, str) or not prefix:
+                raise ValueError(f"Для prefix по '{field}' нужна непустая строка value")
+            parts = [f"{column} LIKE {param(cls.escape_like(prefix) + '%')}"]
+            # Побайтовый диапазон [prefix, следующий prefix) использует индекс text_pattern_ops
+            # и в общем (generic) плане подготовленного запроса, где LIKE с параметром не может
+            parts.append(f"{column} ~>=~ {param(prefix)}")
+            if ord(prefix[-1]) < 0x10FFFF:
+                parts.append(f"{column} ~<~ {param(prefix[:-1] + chr(ord(prefix[-1]) + 1))}")
+            return '(' + ' AND '.join(parts) + ')'
+
+        is_null = node.get('value', True)
+        if not isinstance(is_null, bool):
+            raise ValueError(f"Для null по '{field}' value должен быть true или false")
+        return f"{column} IS NULL" if is_null else f"{column} IS NOT NULL"
+
+    @classmethod
+    def coerce_value(cls, value: Any, data_type: str, field: str) -> Any:
+        """Приводит значение фильтра к типу колонки (параметры asyncpg должны быть типизированы)"""
+        try:
+            if isinstance(value, (dict, list)):
+                raise TypeError
+            if data_type in ('integer', 'bigint', 'smallint'):
+                if isinstance(value, bool) or (isinstance(value, float) and not value.is_integer()):
+                    raise ValueError
+                return int(value)
+            if data_type == 'numeric':
+                if isinstance(value, bool):
+                    raise ValueError
+                return Decimal(str(value))
+            if data_type in ('real', 'double precision'):
+                if isinstance(value, bool):
+                    raise ValueError
+                return float(value)
+            if data_type in cls.DATE_TYPES:
+                parsed = cls.parse_datetime(value)
+                return parsed.date() if data_type == 'date' else parsed
+            if data_type == 'boolean':
+                if isinstance(value, bool):
+                    return value
+                if str(value).lower() in ('true', 'false'):
+                    return str(value).lower() == 'true'
+                raise ValueError
+            return str(value)
+        except (TypeError, ValueError, ArithmeticError):
+            raise ValueError(f"Некорректное значение для '{field}' ({data_type}): {value!r}")
+
+    @classmethod
+    def simple_filters(cls, spec: Any) -> Optional[Dict[str, Any]]:
+        """Фильтр как словарь равенств/IN (AND), если он такой, иначе None"""
+        if not spec:
+            return {}
+        if not isinstance(spec, dict):
+            return None
+        if 'field' not in spec and not {'and', 'or'} & set(spec):
+            return spec
+        leaves = spec.get('and') if list(spec) == ['and'] else [spec]
+        filters = {}
+        for leaf in leaves or []:
+            if not isinstance(leaf, dict) or leaf.get('field') in filters:
+                return None
+            if leaf.get('op', 'eq') == 'eq' and 'value' in leaf and leaf['value'] is not None:
+                filters[leaf['field']] = leaf['value']
+            elif leaf.get('op') == 'in' and isinstance(leaf.get('values'), list) and None not in leaf['values']:
+                filters[leaf['field']] = leaf['values']
+            else:
+                return None
+        return filters
+
+    @classmethod
+    def _check_series_count(cls, count: int):
+        if count > cls.MAX_DOWNSAMPLE_SERIES:
+            raise ValueError(f"Слишком много серий (> {cls.MAX_DOWNSAMPLE_SERIES}), добавьте фильтры")
+
+    @staticmethod
+    def escape_like(value: str) -> str:
+        """Экранирует спецсимволы LIKE: значение ищется буквально"""
+        return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+    @staticmethod
+    def parse_datetime(value: Any) -> datetime:
+        """Epoch (секунды) или ISO строка -> datetime в UTC без часового пояса.
+
+        Колонки TIMESTAMP хранятся без пояса и считаются UTC: смещение строки переводится в UTC.
+        """
+        if isinstance(value, bool):
+            raise ValueError(f"Некорректная дата: {value}")
+        if isinstance(value, (int, float)):
+            try:
+                return datetime.fromtimestamp(value, timezone.utc).replace(tzinfo=None)
+            except (OverflowError, OSError, ValueError):
+                raise ValueError(f"Некорректная дата: {value}")
+        if isinstance(value, datetime):
+            parsed = value
+        else:
+            try:
+                parsed = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+            except ValueError:
+                raise ValueError(f"Некорректная дата: {value}")
+        if parsed.tzinfo is not None:
+            parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+        return parsed
+
+    @classmethod
+    def _compile_panel(cls, config: Dict[str, Any], column_types: Dict[str, str],
+                       rollup: Rollup = None) -> Dict[str, Any]:
+        """Разбирает конфигурацию панели в SQL выражения групп и мер.
+
+        groups/measures — списки (имя колонки результата, SQL выражение),
+        order — список (имя колонки результата, desc).
+        """
+        if rollup is not None:
+            # Группы и фильтры rollup - его время и измерения
+            column_types = rollup.column_types
+        dimensions = config.get('dimensions') or []
+        measures = config.get('measures') or []
+        if not measures:
+            raise ValueError('В конфигурации панели нет мер')
+
+        groups = []
+        for dimension in dimensions:
+            field = cls._check_column(dimension.get('field'), column_types)
+            column = cls.quote_ident(field)
+            if dimension.get('type') == 'date' or column_types[field] in cls.DATE_TYPES:
+                granularity = dimension.get('granularity', 'day')
+                if granularity not in cls.DATE_GRANULARITIES:
+                    raise ValueError(f"Неизвестная гранулярность: {granularity}")
+                expression = f"EXTRACT(EPOCH FROM date_trunc('{granularity}', {column}))::bigint"
+            else:
+                expression = column
+            groups.append((field, expression))
+
+        headers = [name for name, _ in groups]
+
+        category_field = cls._get_category_field(measures, column_types)
+        if category_field and category_field not in headers:
+            groups.append((category_field, cls.quote_ident(category_field)))
+            headers.append(category_field)
+
+        compiled_measures = []
+        for measure in measures:
+            # count без поля и имени называется по агрегации
+            key = measure.get('field') or measure.get('name') or measure.get('aggregation', 'count')
+            if key in headers:
+                key = f"{measure.get('aggregation', 'count')}_{key}"
+            compiled_measures.append((key, cls._measure_expression(measure, column_types, rollup)))
+            headers.append(key)
+
+        return {
+            'groups': groups,
+            'measures': compiled_measures,
+            'headers': headers,
+            'order': cls._build_order(config, dimensions, measures, [key for key, _ in compiled_measures],
+                                      [name for name, _ in groups])
+        }
+
+    @classmethod
+    def _measure_expression(cls, measure: Dict[str, Any], column_types: Dict[str, str],
+                            rollup: Rollup = None) -> str:
+        """SQL выражение для одной меры"""
+        if measure.get('expression'):
+            raise ValueError(f"Пользовательские выражения не поддерживаются на сервере: {measure['expression']}")
+
+        aggregation = measure.get('aggregation', 'count')
+        if aggregation not in cls.AGGREGATIONS:
+            raise ValueError(f"Неизвестная агрегация: {aggregation}")
+
+        if rollup is not None:
+            # Маршрутизатор уже проверил, что rollup хранит состояние для этой меры
+            return rollup.measure_expression(measure)
+
+        # count на клиенте считает все записи группы, независимо от поля
+        if aggregation == 'count':
+            return 'COUNT(*)'
+
+        field = cls._check_column(measure.get('field'), column_types)
+        column = cls.quote_ident(field)
+        column_type = column_types[field]
+
+        if aggregation == 'count_distinct':
+            return f"COUNT(DISTINCT {column})"
+
+        if column_type in cls.NUMERIC_TYPES:
+            # DECIMAL/NUMERIC приводим к float, чтобы в JSON уходили числа, а не строки
+            return f"{aggregation.upper()}({column})::double precision"
+
+        if aggregation in ('min', 'max'):
+            if column_type in cls.DATE_TYPES:
+                return f"EXTRACT(EPOCH FROM {aggregation.upper()}({column}))::bigint"
+            return f"{aggregation.upper()}({column})"
+
+        raise ValueError(f"Агрегация {aggregation} недоступна для нечислового поля '{field}'")
+
+    @classmethod
+    def _get_category_field(cls, measures: List[Dict[str, Any]], column_types: Dict[str, str]) -> Optional[str]:
+        """Поле разбивки стекированных мер (одно на панель)"""
+        category_fields = {
+            measure['categoryField'] for measure in measures
+            if measure.get('isStacked') and measure.get('categoryField')
+        }
+        if len(category_fields) > 1:
+            raise ValueError('Стекированные меры панели должны использовать одно поле категорий')
+        if not category_fields:
+            return None
+        return cls._check_column(category_fields.pop(), column_types)
+
+    @classmethod
+    def _build_order(cls, config: Dict[str, Any], dimensions: List[Dict[str, Any]],
+                     measures: List[Dict[str, Any]], measure_keys: List[str],
+                     group_headers: List[str]) -> List[Tuple[str, bool]]:
+        """Порядок строк: сначала явная сортировка из config.sorting, затем порядок размерностей"""
+        sorting = config.get('sorting') or {}
+        order = []
+        used = set()
+
+        for item in sorting.get('measures') or []:
+            for measure, key in zip(measures, measure_keys):
+                if item.get('field') in (measure.get('field'), measure.get('name')) and key not in used:
+                    order.append((key, cls._is_desc(item.get('order'))))
+                    used.add(key)
+                    break
+
+        for item in sorting.get('dimensions') or []:
+            field = item.get('field')
+            if field in group_headers and field not in used:
+                order.append((field, cls._is_desc(item.get('order'))))
+                used.add(field)
+
+        for dimension in dimensions:
+            field = dimension.get('field')
+            if field not in used:
+                order.append((field, cls._is_desc(dimension.get('sortOrder'))))
+                used.add(field)
+
+        return order
+
+    @classmethod
+    def _split_by_grouping_limit(cls, panels: List[Tuple]) -> List[List[Tuple]]:
+        """Делит панели на группы, укладывающиеся в лимит аргументов GROUPING()"""
+        chunks = []
+        current = []
+        expressions = set()
+
+        for panel in panels:
+            panel_expressions = {expression for _, expression in panel[2]['groups']}
+            if current and len(expressions | panel_expressions) > cls.MAX_GROUPING_COLUMNS:
+                chunks.append(current)
+                current = []
+                expressions = set()
+            current.append(panel)
+            expressions |= panel_expressions
+
+        if current:
+            chunks.append(current)
+        return chunks
+
+    @staticmethod
+    def _extract_panel_rows(rows: List[Any], compiled: Dict[str, Any],
+                            panel_set: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Выбирает строки набора панели из общего результата GROUPING SETS"""
+        columns = {**panel_set['groups'], **panel_set['measures']}
+        return [
+            {name: row[alias] for name, alias in columns.items()}
+            for row in rows
+            if row['grouping_mask'] == panel_set['mask']
+        ]
+
+    @staticmethod
+    def _sort_rows(rows: List[Dict[str, Any]], order: List[Tuple[str, bool]]) -> List[Dict[str, Any]]:
+        """Сортирует строки панели (стабильная сортировка от последнего ключа к первому)"""
+        for key, desc in reversed(order):
+            rows.sort(key=lambda row: (row[key] is None, row[key]), reverse=desc)
+        return rows
+
+    @staticmethod
+    def _is_desc(order: Optional[str]) -> bool:
+        return str(order).lower() == 'desc'
+
+    @staticmethod
+    def _check_column(field: Optional[str], column_types: Dict[str, str]) -> str:
+        if not field or field not in column_types:
+            raise ValueError(f"Неизвестная колонка: {field}")
+        return field
+
+    @staticmethod
+    def quote_ident(name: str) -> str:
+        """Экранирует идентификатор PostgreSQL"""
+        return '"' + name.replace('"', '""') + '"'
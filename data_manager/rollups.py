@@ -0,0 +1,448 @@
+import asyncio
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+import asyncpg
+
+from .catalog import TableSchema, quote_ident
+from .database import DatabaseManager
+
+
+# Порядок гранулярностей времени: rollup с зерном grain отвечает на группировки не мельче grain
+GRANULARITY_RANK = {'minute': 0, 'hour': 1, 'day': 2, 'week': 3, 'month': 4, 'year': 5}
+
+
+@dataclass
+class Rollup:
+    """Предагрегированная таблица: строки source_table, сгруппированные по (зерно времени × dimensions).
+
+    Для каждой меры хранятся сумма, минимум и максимум (NUMERIC - без потери точности),
+    плюс общее число строк - все состояния сливаются (sum/min/max/count), поэтому
+    COUNT, SUM, AVG, MIN и MAX любых более крупных групп считаются по rollup точно.
+    """
+    name: str
+    source_table: str
+    grain: str
+    dimensions: List[str]
+    measures: List[str] = field(default_factory=list)
+    time_field: str = 'timestamp'
+    ready: bool = False
+    # Схема источника разошлась с rollup: запись его пропускает, пока он не перестроен
+    stale: bool = False
+
+    @property
+    def column_types(self) -> Dict[str, str]:
+        """Колонки rollup, доступные для групп и фильтров (как column_types исходной таблицы)"""
+        return {
+            self.time_field: 'timestamp without time zone',
+            **{dimension: 'character varying' for dimension in self.dimensions}
+        }
+
+    @property
+    def state_columns(self) -> List[str]:
+        columns = ['row_count']
+        for measure in self.measures:
+            columns += [f"{measure}_sum", f"{measure}_min", f"{measure}_max"]
+        return columns
+
+    def can_answer(self, config: Dict[str, Any], filters: Dict[str, Any] = None,
+                   date_range: Dict[str, Any] = None) -> bool:
+        """Может ли rollup точно ответить на конфигурацию панели"""
+        for dimension in config.get('dimensions') or []:
+            field_name = dimension.get('field')
+            if field_name == self.time_field:
+                granularity = dimension.get('granularity', 'day')
+                if GRANULARITY_RANK.get(granularity, -1) < GRANULARITY_RANK[self.grain]:
+                    return False
+            elif field_name not in self.dimensions or dimension.get('type') == 'date':
+                return False
+
+        measures = config.get('measures') or []
+        if not measures:
+            return False
+        for measure in measures:
+            if measure.get('expression'):
+                return False
+            if measure.get('isStacked') and measure.get('categoryField') \
+                    and measure['categoryField'] not in self.dimensions:
+                return False
+
+            aggregation = measure.get('aggregation', 'count')
+            field_name = measure.get('field')
+            if aggregation == 'count':
+                continue
+            if aggregation in ('count_distinct', 'min', 'max') and field_name in self.dimensions:
+                continue
+            if aggregation in ('sum', 'avg', 'min', 'max') and field_name in self.measures:
+                continue
+            return False
+
+        if any(column not in self.dimensions for column in filters or {}):
+            return False
+        if date_range and date_range.get('field', self.time_field) != self.time_field:
+            return False
+        return True
+
+    def is_aligned(self, value: Optional[datetime]) -> bool:
+        """Граница диапазона совпадает с границей корзины rollup"""
+        return value is None or value == self.truncate(value)
+
+    def truncate(self, value: datetime) -> datetime:
+        if self.grain == 'hour':
+            return value.replace(minute=0, second=0, microsecond=0)
+        return value.replace(hour=0, minute=0, second=0, microsecond=0)
+
+    @property
+    def step(self) -> timedelta:
+        return timedelta(hours=1) if self.grain == 'hour' else timedelta(days=1)
+
+    def measure_expression(self, measure: Dict[str, Any]) -> str:
+        """SQL выражение меры поверх строк rollup (слияние состояний)"""
+        aggregation = measure.get('aggregation', 'count')
+        if aggregation == 'count':
+            return 'SUM("row_count")::bigint'
+
+        field_name = measure.get('field')
+        if field_name in self.dimensions:
+            column = quote_ident(field_name)
+            if aggregation == 'count_distinct':
+                return f"COUNT(DISTINCT {column})"
+            return f"{aggregation.upper()}({column})"
+
+        if aggregation == 'sum':
+            return f"SUM({quote_ident(field_name + '_sum')})::double precision"
+        if aggregation == 'avg':
+            return (f"(SUM({quote_ident(field_name + '_sum')}) / NULLIF(SUM(\"row_count\"), 0))"
+                    f"::double precision")
+        if aggregation == 'min':
+            return f"MIN({quote_ident(field_name + '_min')})::double precision"
+        return f"MAX({quote_ident(field_name + '_max')})::double precision"
+
+    def source(self, start: Optional[datetime], end: Optional[datetime],
+               start_index: int = 1) -> Tuple[str, List[Any]]:
+        """FROM-источник для диапазона [start, end]: целые корзины из rollup, края - из сырой таблицы.
+
+        Неполные корзины на границах диапазона агрегируются из исходной таблицы
+        в то же представление (зерно, измерения, состояния) и добавляются через UNION ALL.
+        """
+        if start is None and end is None:
+            return quote_ident(self.name), []
+
+        params: List[Any] = []
+
+        def param(value) -> str:
+            params.append(value)
+            return f"${start_index + len(params) - 1}"
+
+        full_start = start if start is None or self.is_aligned(start) else self.truncate(start) + self.step
+        full_end = self.truncate(end) if end is not None else None
+
+        parts = []
+        if full_start is not None and full_end is not None and full_start > full_end:
+            # Весь диапазон внутри одной корзины - только сырые строки
+            parts.append(self._raw_part(f">= {param(start)}", f"<= {param(end)}"))
+        else:
+            conditions = []
+            if full_start is not None:
+                conditions.append(f"{quote_ident(self.time_field)} >= {param(full_start)}")
+            if full_end is not None:
+                conditions.append(f"{quote_ident(self.time_field)} < {param(full_end)}")
+            parts.append(
+                f"SELECT {', '.join(self.columns())} FROM {quote_ident(self.name)} "
+                f"WHERE {' AND '.join(conditions)}"
+            )
+            if start is not None and start < full_start:
+                parts.append(self._raw_part(f">= {param(start)}", f"< {param(full_start)}"))
+            if end is not None:
+                parts.append(self._raw_part(f">= {param(full_end)}", f"<= {param(end)}"))
+
+        return f"({' UNION ALL '.join(parts)}) AS rollup_source", params
+
+    def columns(self) -> List[str]:
+        return [quote_ident(column) for column in [self.time_field, *self.dimensions, *self.state_columns]]
+
+    def _raw_part(self, lower: str, upper: str) -> str:
+        time_column = quote_ident(self.time_field)
+        select_parts = [f"date_trunc('{self.grain}', {time_column}) AS {time_column}"]
+        select_parts += [quote_ident(dimension) for dimension in self.dimensions]
+        select_parts.append('1::bigint AS "row_count"')
+        for measure in self.measures:
+            for suffix in ('sum', 'min', 'max'):
+                select_parts.append(f"{quote_ident(measure)}::numeric AS {quote_ident(f'{measure}_{suffix}')}")
+        return (
+            f"SELECT {', '.join(select_parts)} FROM {quote_ident(self.source_table)} "
+            f"WHERE {time_column} {lower} AND {time_column} {upper}"
+        )
+
+
+class RollupManager:
+    """Поддерживает часовые и дневные rollup таблицы server_metrics и выбирает rollup для запросов.
+
+    Rollup обновляются инкрементально в транзакции insert_data (хук записи):
+    строки с id больше сохраненного watermark сливаются в rollup через UPSERT.
+    После изменения схемы источника (мера удалена или переименована) rollup
+    отключается и перестраивается в фоне - запись в источник не падает.
+    """
+
+    SOURCE_TABLE = 'server_metrics'
+    # Измерения, по которым группирует большинство панелей (низкая кардинальность)
+    DIMENSIONS = ['server_zone', 'service_name', 'environment', 'status']
+    # От мелкого зерна к крупному
+    GRAINS = ['hour', 'day']
+    NUMERIC_TYPES = {'integer', 'bigint', 'smallint', 'numeric', 'real', 'double precision'}
+    # Ошибки слияния, означающие, что схема источника уже не совпадает с rollup
+    SCHEMA_ERRORS = (asyncpg.UndefinedColumnError, asyncpg.UndefinedTableError, asyncpg.DatatypeMismatchError)
+
+    def __init__(self, db_manager: DatabaseManager):
+        self.db_manager = db_manager
+        self.rollups: List[Rollup] = [
+            Rollup(name=f"{self.SOURCE_TABLE}_rollup_{grain}", source_table=self.SOURCE_TABLE,
+                   grain=grain, dimensions=list(self.DIMENSIONS))
+            for grain in self.GRAINS
+        ]
+        self._initialized = False
+        self._rebuild_task: Optional[asyncio.Task] = None
+        self._rebuild_pending = False
+
+    async def initialize(self):
+        """Создает rollup таблицы, догоняет их до текущих данных и подключает хук записи"""
+        print("🔧 Инициализация rollup таблиц...")
+        async with self.db_manager.pool.acquire() as conn:
+            measures = await self._source_measures()
+            if not measures:
+                print(f"⚠️ Таблица {self.SOURCE_TABLE} не найдена, rollup отключены")
+                return
+
+            for rollup in self.rollups:
+                rollup.measures = measures
+                await self._ensure_rollup_table(conn, rollup)
+            await conn.execute('''
+                CREATE TABLE IF NOT EXISTS rollup_state (
+                    rollup_table VARCHAR(100) PRIMARY KEY,
+                    last_id BIGINT NOT NULL DEFAULT 0,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+
+            async with conn.transaction():
+                await self.db_manager.lock_table_writes(conn, self.SOURCE_TABLE)
+                merged = await self.apply_new_rows(conn)
+
+        self.db_manager.add_write_hook(self.SOURCE_TABLE, self.apply_new_rows)
+        self.db_manager.on_schema_change(self.on_schema_change)
+        self._initialized = True
+        for rollup in self.rollups:
+            rollup.ready = True
+        print(f"✅ Rollup таблицы готовы (обновлено строк rollup: {merged})")
+
+    async def apply_new_rows(self, conn) -> int:
+        """Сливает в rollup строки источника, появившиеся после watermark (в транзакции записи).
+
+        Каждый rollup сливается в своей точке сохранения: если схема источника изменилась
+        раньше, чем пришло событие, rollup отключается, а запись продолжается.
+        """
+        max_id = await conn.fetchval(f'SELECT COALESCE(MAX(id), 0) FROM {quote_ident(self.SOURCE_TABLE)}')
+        merged = 0
+
+        for rollup in self.rollups:
+            if rollup.stale:
+                continue
+            try:
+                async with conn.transaction():
+                    merged = max(merged, await self._catch_up(conn, rollup, max_id))
+            except self.SCHEMA_ERRORS as e:
+                self._mark_stale([rollup], str(e))
+
+        return merged
+
+    def on_schema_change(self, table_name: str):
+        """Событие изменения схемы: rollup с другим набором мер перестраиваются в фоне"""
+        if table_name != self.SOURCE_TABLE or not self._initialized:
+            return
+        schema = self.db_manager.catalog.get(self.SOURCE_TABLE)
+        measures = self._measures_of(schema) if schema is not None else None
+        changed = [rollup for rollup in self.rollups if not rollup.stale and rollup.measures != measures]
+        if changed:
+            self._mark_stale(changed, f"схема {self.SOURCE_TABLE} изменилась")
+
+    def _mark_stale(self, rollups: List[Rollup], reason: str):
+        for rollup in rollups:
+            rollup.ready = False
+            rollup.stale = True
+        print(f"⚠️ Rollup {', '.join(rollup.name for rollup in rollups)} отключены ({reason}), перестраиваем...")
+        if self._rebuild_task is None or self._rebuild_task.done():
+            self._rebuild_task = asyncio.ensure_future(self._run_rebuilds())
+        else:
+            self._rebuild_pending = True
+
+    async def _run_rebuilds(self):
+        # События схемы во время перестроения - еще один проход с актуальным каталогом
+        while True:
+            self._rebuild_pending = False
+            try:
+                await self._rebuild()
+            except Exception as e:
+                print(f"⚠️ Ошибка перестроения rollup (остаются отключены): {e}")
+            if not self._rebuild_pending:
+                return
+
+    async def _rebuild(self):
+        """Пересоздает отключенные rollup по текущей схеме источника и догоняет их до данных"""
+        stale = [rollup for rollup in self.rollups if rollup.stale]
+        try:
+            schema = await self.db_manager.get_table_schema(self.SOURCE_TABLE)
+        except ValueError:
+            print(f"⚠️ Таблица {self.SOURCE_TABLE} не найдена, rollup остаются отключены")
+            return
+        missing = [dimension for dimension in self.DIMENSIONS if dimension not in schema.column_types]
+        measures = self._measures_of(schema)
+        if missing or not stale:
+            if missing:
+                print(f"⚠️ В {self.SOURCE_TABLE} нет измерений rollup ({', '.join(missing)}), rollup отключены")
+            return
+
+        async with self.db_manager.pool.acquire() as conn:
+            async with conn.transaction():
+                await self.db_manager.lock_table_writes(conn, self.SOURCE_TABLE)
+                max_id = await conn.fetchval(f'SELECT COALESCE(MAX(id), 0) FROM {quote_ident(self.SOURCE_TABLE)}')
+                for rollup in stale:
+                    await conn.execute(f'DROP TABLE IF EXISTS {quote_ident(rollup.name)}')
+                    rollup.measures = measures
+                    await self._ensure_rollup_table(conn, rollup)
+                    await conn.execute(
+                        'UPDATE rollup_state SET last_id = 0, updated_at = CURRENT_TIMESTAMP WHERE rollup_table = $1',
+                        rollup.name
+                    )
+                    await self._catch_up(conn, rollup, max_id)
+
+        # Схема могла измениться еще раз, пока шло перестроение: такой rollup ждет следующего прохода
+        current = self.db_manager.catalog.get(self.SOURCE_TABLE)
+        for rollup in stale:
+            if current is not None and self._measures_of(current) == rollup.measures:
+                rollup.stale = False
+                rollup.ready = True
+        print(f"✅ Rollup перестроены по новой схеме: {', '.join(rollup.name for rollup in stale)}")
+
+    async def _catch_up(self, conn, rollup: Rollup, max_id: int) -> int:
+        """Сливает строки источника от watermark rollup до max_id и сдвигает watermark"""
+        last_id = await conn.fetchval('''
+            INSERT INTO rollup_state (rollup_table, last_id) VALUES ($1, 0)
+            ON CONFLICT (rollup_table) DO UPDATE SET rollup_table = EXCLUDED.rollup_table
+            RETURNING last_id
+        ''', rollup.name)
+        if last_id >= max_id:
+            return 0
+
+        merged = await self._merge_range(conn, rollup, last_id, max_id)
+        await conn.execute('''
+            UPDATE rollup_state SET last_id = $2, updated_at = CURRENT_TIMESTAMP
+            WHERE rollup_table = $1
+        ''', rollup.name, max_id)
+        return merged
+
+    async def drop_before(self, conn, horizon: datetime):
+        """Удаляет корзины rollup раньше horizon (хранение: исходные строки этого периода удалены).
+
+        horizon - граница секции (начало дня или недели), поэтому совпадает с границей корзин.
+        """
+        for rollup in self.rollups:
+            if rollup.ready:
+                await conn.execute(
+                    f'DELETE FROM {quote_ident(rollup.name)} WHERE {quote_ident(rollup.time_field)} < $1', horizon
+                )
+
+    def route(self, table_name: str, config: Dict[str, Any], filters: Dict[str, Any] = None,
+              date_range: Dict[str, Any] = None, parse_datetime=None) -> Optional[Rollup]:
+        """Самый крупный rollup, который точно отвечает на запрос, или None (сырая таблица).
+
+        Предпочитается rollup, к зерну которого выровнены границы диапазона дат -
+        тогда из сырой таблицы читаются только строки ровно на границе.
+        """
+        candidates = [
+            rollup for rollup in reversed(self.rollups)
+            if rollup.ready and rollup.source_table == table_name and rollup.can_answer(config, filters, date_range)
+        ]
+        if not candidates:
+            return None
+
+        start, end = self.parse_range(date_range, parse_datetime)
+        for rollup in candidates:
+            if rollup.is_aligned(start) and rollup.is_aligned(end):
+                return rollup
+        # Границы не выровнены ни к одному зерну - меньше всего сырых строк у самого мелкого
+        return candidates[-1]
+
+    @staticmethod
+    def parse_range(date_range: Dict[str, Any] = None, parse_datetime=None) -> Tuple[Optional[datetime], Optional[datetime]]:
+        if not date_range:
+            return None, None
+        start = parse_datetime(date_range['start']) if date_range.get('start') else None
+        end = parse_datetime(date_range['end']) if date_range.get('end') else None
+        return start, end
+
+    async def _merge_range(self, conn, rollup: Rollup, from_id: int, to_id: int) -> int:
+        time_column = quote_ident(rollup.time_field)
+        dimensions = [quote_ident(dimension) for dimension in rollup.dimensions]
+        key_columns = [time_column, *dimensions]
+
+        select_parts = [f"date_trunc('{rollup.grain}', {time_column})", *dimensions, 'COUNT(*)']
+        updates = ['"row_count" = target."row_count" + EXCLUDED."row_count"']
+        for measure in rollup.measures:
+            column = quote_ident(measure)
+            select_parts += [f"SUM({column})::numeric", f"MIN({column})::numeric", f"MAX({column})::numeric"]
+            sum_column = quote_ident(f"{measure}_sum")
+            min_column = quote_ident(f"{measure}_min")
+            max_column = quote_ident(f"{measure}_max")
+            updates += [
+                f"{sum_column} = target.{sum_column} + EXCLUDED.{sum_column}",
+                f"{min_column} = LEAST(target.{min_column}, EXCLUDED.{min_column})",
+                f"{max_column} = GREATEST(target.{max_column}, EXCLUDED.{max_column})",
+            ]
+
+        result = await conn.execute(f'''
+            INSERT INTO {quote_ident(rollup.name)} AS target ({', '.join(rollup.columns())})
+            SELECT {', '.join(select_parts)}
+            FROM {quote_ident(rollup.source_table)}
+            WHERE id > $1 AND id <= $2
+            GROUP BY {', '.join(str(i + 1) for i in range(len(key_columns)))}
+            ON CONFLICT ({', '.join(key_columns)}) DO UPDATE SET {', '.join(updates)}
+        ''', from_id, to_id)
+        # "INSERT 0 N" - число затронутых строк rollup
+        return int(result.split()[-1])
+
+    async def _ensure_rollup_table(self, conn, rollup: Rollup):
+        columns = [f"{quote_ident(rollup.time_field)} TIMESTAMP NOT NULL"]
+        columns += [f"{quote_ident(dimension)} VARCHAR(100) NOT NULL" for dimension in rollup.dimensions]
+        columns.append('"row_count" BIGINT NOT NULL')
+        columns += [f"{quote_ident(column)} NUMERIC" for column in rollup.state_columns[1:]]
+        key_columns = [quote_ident(rollup.time_field), *[quote_ident(d) for d in rollup.dimensions]]
+
+        await conn.execute(f'''
+            CREATE TABLE IF NOT EXISTS {quote_ident(rollup.name)} (
+                {', '.join(columns)},
+                PRIMARY KEY ({', '.join(key_columns)})
+            )
+        ''')
+
+    async def _source_measures(self) -> List[str]:
+        try:
+            schema = await self.db_manager.get_table_schema(self.SOURCE_TABLE)
+        except ValueError:
+            return []
+        return self._measures_of(schema)
+
+    @classmethod
+    def _measures_of(cls, schema: TableSchema) -> List[str]:
+        """Числовые NOT NULL колонки источника: для них AVG = SUM / COUNT(*) точно"""
+        return [
+            column.name for column in schema.columns
+            if column.data_type in cls.NUMERIC_TYPES and not column.nullable and column.name != 'id'
+        ]
+
+    def stats(self) -> List[Dict[str, Any]]:
+        return [
+            {'name': rollup.name, 'grain': rollup.grain, 'dimensions': rollup.dimensions,
+             'measures': len(rollup.measures), 'ready': rollup.ready, 'stale': rollup.stale}
+            for rollup in self.rollups
+        ]
@@ -0,0 +1,111 @@
+import json
+import math
+from datetime import datetime, timezone
+from decimal import Decimal
+from typing import Any, Callable, Dict, Optional
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def encode_default(value: Any) -> Any:
+    """Значения, которых нет в JSON: Decimal (NUMERIC) - число, даты - ISO 8601, скаляры NumPy - число"""
+    if isinstance(value, Decimal):
+        # NaN/Infinity в JSON нет - как и для float, отдаем null (и для Decimal вне диапазона float)
+        number = float(value)
+        return number if math.isfinite(number) else None
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    if hasattr(value, 'item'):
+        value = value.item()
+        return None if isinstance(value, float) and not math.isfinite(value) else value
+    return str(value)
+
+
+def epoch_seconds(value: datetime) -> float:
+    """Unix timestamp; TIMESTAMP без часового пояса - это UTC, как EXTRACT(EPOCH FROM ...) в PostgreSQL"""
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+
+def _stdlib_dumps(value: Any) -> bytes:
+    return _stdlib_dumps_str(value).encode('utf-8')
+
+
+def _stdlib_dumps_str(value: Any) -> str:
+    try:
+        return json.dumps(value, separators=(',', ':'), ensure_ascii=False, default=encode_default,
+                          allow_nan=False)
+    except ValueError:
+        # В значении есть NaN/Infinity: повтор с null вместо них - те же байты, что у orjson
+        return json.dumps(_finite(value), separators=(',', ':'), ensure_ascii=False, default=encode_default,
+                          allow_nan=False)
+
+
+def _finite(value: Any) -> Any:
+    """Копия значения, в которой float NaN/Infinity заменены на None"""
+    if isinstance(value, float):
+        return value if math.isfinite(value) else None
+    if isinstance(value, dict):
+        return {key: _finite(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_finite(item) for item in value]
+    return value
+
+
+if orjson is not None:
+    ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+    def _orjson_dumps(value: Any) -> bytes:
+        return orjson.dumps(value, default=encode_default, option=ORJSON_OPTIONS)
+
+
+# Кодировщики JSON -> bytes: компактный вывод без пробелов, UTF-8 без \u экранирования
+ENCODERS: Dict[str, Callable[[Any], bytes]] = {
+    'json': _stdlib_dumps,
+}
+if orjson is not None:
+    ENCODERS['orjson'] = _orjson_dumps
+
+# Порядок предпочтения при JSON_ENCODER=auto
+ENCODER_PREFERENCE = ['orjson', 'json']
+
+_encoder_name = next(name for name in ENCODER_PREFERENCE if name in ENCODERS)
+_encoder = ENCODERS[_encoder_name]
+
+
+def use_encoder(name: Optional[str] = 'auto') -> str:
+    """Выбирает кодировщик по имени (auto - самый быстрый из установленных), возвращает выбранный"""
+    global _encoder_name, _encoder
+    if not name or name == 'auto':
+        name = next(name for name in ENCODER_PREFERENCE if name in ENCODERS)
+    if name not in ENCODERS:
+        raise ValueError(f"Кодировщик JSON '{name}' недоступен (доступны: {', '.join(ENCODERS)})")
+    _encoder_name, _encoder = name, ENCODERS[name]
+    return name
+
+
+def encoder_name() -> str:
+    return _encoder_name
+
+
+def dumps_bytes(value: Any) -> bytes:
+    """JSON в UTF-8 текущим кодировщиком"""
+    return _encoder(value)
+
+
+def dumps(value: Any) -> str:
+    """JSON строкой текущим кодировщиком"""
+    if _encoder is _stdlib_dumps:
+        return _stdlib_dumps_str(value)
+    return _encoder(value).decode('utf-8')
+
+
+def loads(data: Any) -> Any:
+    """Разбор JSON из str/bytes (orjson, если установлен)"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
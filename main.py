@@ -3,30 +3,41 @@ import aiohttp_jinja2
 import jinja2
 from pathlib import Path
 from aiohttp import web
-from aiohttp_compress import compress_middleware
 import asyncio
+import time
 from datetime import datetime, timedelta
 
 from routes import setup_routes
+from data_manager import serialization
+from middlewares import etag_middleware, compress_middleware
+from data_manager.cache import DataCache
+from data_manager.cache_warmer import CacheWarmer
+from data_manager.columnar import ColumnarStore
 from data_manager.database import DatabaseManager
 from data_manager.generator import DataGenerator
 from data_manager.layout_manager import LayoutManager
+from data_manager.partitions import PartitionManager
+from data_manager.query_engine import QueryEngine
+from data_manager.rollups import RollupManager
 from config import config
 
 
 async def create_app() -> web.Application:
-    # Добавляем gzip компрессию для всех ответов
-    app = web.Application(middlewares=[compress_middleware])
+    # ETag/304 по версии данных таблиц и gzip компрессия (кроме заранее сжатых тел из кеша)
+    app = web.Application(middlewares=[etag_middleware, compress_middleware])
+
+    # Сериализатор JSON ответов (orjson, если установлен, иначе стандартный json)
+    print(f"🧾 Кодировщик JSON: {serialization.use_encoder(config.JSON_ENCODER)}")
 
     template_dir = Path(__file__).parent / 'templates'
     aiohttp_jinja2.setup(app, loader=jinja2.FileSystemLoader(str(template_dir)))
 
-    # Инициализация кеша для API данных
-    app['data_cache'] = {
-        'data': None,
-        'timestamp': None,
-        'ttl': 300  # 5 минут TTL
-    }
+    # Инициализация кеша для API данных (LRU с бюджетом памяти, сброс по изменениям таблиц, stale-while-revalidate)
+    app['data_cache'] = DataCache(
+        max_bytes=config.DATA_CACHE_MAX_BYTES,
+        ttl=config.DATA_CACHE_TTL,
+        stale_ttl=config.DATA_CACHE_STALE_TTL
+    )
 
     # Инициализация менеджера базы данных
     app['db_manager'] = DatabaseManager(config.DATABASE_URL)
@@ -36,12 +47,56 @@ async def create_app() -> web.Application:
     app['layout_manager'] = LayoutManager(app['db_manager'])
     await app['layout_manager'].initialize()
 
+    # Серверная агрегация панелей (агрегаты по часам/дням читаются из rollup таблиц)
+    app['rollup_manager'] = RollupManager(app['db_manager'])
+    # Колоночная копия server_metrics в памяти (если установлен NumPy): фильтры и GROUP BY без БД
+    app['columnar_store'] = ColumnarStore(app['db_manager']) if config.COLUMNAR_STORE_ENABLED else None
+    app['query_engine'] = QueryEngine(
+        app['db_manager'],
+        rollups=app['rollup_manager'],
+        columnar=app['columnar_store']
+    )
+
+    # Секции server_metrics по времени: создаются вперед и перед загрузкой, старые удаляет хранение
+    app['partition_manager'] = PartitionManager(
+        app['db_manager'],
+        interval=config.PARTITION_INTERVAL,
+        premake=config.PARTITION_PREMAKE,
+        retention_days=config.RETENTION_DAYS,
+        retention_mode=config.RETENTION_MODE,
+        rollups=app['rollup_manager'],
+        maintenance_interval=config.PARTITION_MAINTENANCE_INTERVAL
+    )
+    await app['partition_manager'].initialize()
+
     # Инициализация генератора данных
     app['data_generator'] = DataGenerator()
 
     # Проверяем и генерируем данные если база пуста
     await _ensure_initial_data(app['db_manager'], app['data_generator'])
 
+    # Rollup догоняют существующие данные и дальше обновляются при каждой вставке
+    await app['rollup_manager'].initialize()
+
+    # Хранение применяется после инициализации rollup: вместе с секциями удаляются их корзины
+    app.on_startup.append(app['partition_manager'].start)
+    app.on_cleanup.append(app['partition_manager'].stop)
+
+    # Загрузка в память идет в фоне: пока она не закончена, запросы отвечает БД
+    if app['columnar_store'] is not None:
+        app.on_startup.append(app['columnar_store'].start)
+        app.on_cleanup.append(app['columnar_store'].stop)
+
+    # Фоновый прогрев кеша по сохраненным layout: открытие дашборда не ждет пересчета
+    app['cache_warmer'] = CacheWarmer(
+        app['data_cache'],
+        app['db_manager'],
+        app['query_engine'],
+        interval=config.CACHE_WARM_INTERVAL
+    )
+    app.on_startup.append(app['cache_warmer'].start)
+    app.on_cleanup.append(app['cache_warmer'].stop)
+
     setup_routes(app)
     return app
 
@@ -53,9 +108,14 @@ async def _ensure_initial_data(db_manager: DatabaseManager, data_generator: Data
         existing_data = await db_manager.get_all_data('server_metrics', limit=1)
         if not existing_data:
             print("🔄 База данных пуста, генерируем начальные данные...")
-            data = data_generator.generate_server_data(server_count=30000, days=7, interval_hours=6)
-            await db_manager.insert_data('server_metrics', data)
-            print(f"✅ Сгенерировано и сохранено {len(data)} записей")
+            started = time.perf_counter()
+            inserted = await data_generator.seed(
+                db_manager, 'server_metrics', server_count=30000, days=7, interval_hours=6,
+                seed=config.GENERATOR_SEED, processes=config.GENERATOR_PROCESSES, parallel=config.COPY_PARALLEL
+            )
+            elapsed = time.perf_counter() - started
+            print(f"✅ Сгенерировано и сохранено {inserted} записей "
+                  f"({elapsed:.1f} с, {inserted / max(elapsed, 1e-6):,.0f} строк/с)")
         else:
             print(f"✅ В базе уже есть данные ({len(existing_data)}+ записей)")
     except Exception as e:
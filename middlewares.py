@@ -0,0 +1,85 @@
+import hashlib
+from aiohttp import web, hdrs
+from aiohttp.web import ContentCoding
+
+from data_manager.compression import ON_THE_FLY_ENCODINGS, negotiate_encoding
+
+
+# GET эндпоинты, ответы которых зависят только от данных таблицы и параметров запроса
+ETAG_PATHS = {
+    '/api/data',
+    '/api/data/compact',
+    '/api/data/ultra',
+    '/api/data/filtered',
+    '/api/metadata',
+}
+
+
+def build_etag(request: web.Request, table_version: str) -> str:
+    """Строгий ETag: версия данных таблицы + хеш представления (запрос, формат, сжатие)"""
+    # Accept-Encoding целиком: кешированные ответы выбирают br/zstd/gzip по q-значениям
+    accept_encoding = request.headers.get(hdrs.ACCEPT_ENCODING, '').lower().replace(' ', '')
+    variant = '|'.join([
+        request.path,
+        '&'.join(f"{key}={value}" for key, value in sorted(request.query.items())),
+        request.headers.get(hdrs.ACCEPT, ''),
+        accept_encoding
+    ])
+    variant_hash = hashlib.md5(variant.encode('utf-8')).hexdigest()[:12]
+    return f'"{table_version}-{variant_hash}"'
+
+
+def etag_matches(request: web.Request, etag: str) -> bool:
+    """Проверяет If-None-Match (слабое сравнение, как требует RFC 9110)"""
+    if_none_match = request.headers.get(hdrs.IF_NONE_MATCH)
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    candidates = [tag.strip().removeprefix('W/') for tag in if_none_match.split(',')]
+    return etag in candidates
+
+
+@web.middleware
+async def etag_middleware(request: web.Request, handler):
+    """Условные GET для данных: 304 по версии таблицы без обращения к PostgreSQL"""
+    if request.method != 'GET' or request.path not in ETAG_PATHS:
+        return await handler(request)
+
+    db_manager = request.app['db_manager']
+    table_name = request.query.get('table', 'server_metrics')
+    etag = build_etag(request, db_manager.get_table_version(table_name))
+
+    if etag_matches(request, etag):
+        return web.Response(status=304, headers={
+            hdrs.ETAG: etag,
+            hdrs.CACHE_CONTROL: 'no-cache',
+            hdrs.VARY: 'Accept, Accept-Encoding'
+        })
+
+    # Потоковые ответы отправляют заголовки сами - ETag берут из запроса
+    request['etag'] = etag
+    response = await handler(request)
+
+    if response.status == 200 and not response.prepared:
+        response.headers[hdrs.ETAG] = etag
+        response.headers[hdrs.CACHE_CONTROL] = 'no-cache'
+    return response
+
+
+@web.middleware
+async def compress_middleware(request: web.Request, handler):
+    """gzip/deflate сжатие ответов; уже сжатые тела (готовые варианты из кеша) не трогает"""
+    # q-значения как у кешированных вариантов: gzip;q=0 - отказ от gzip, а не согласие
+    encoding = negotiate_encoding(request.headers.get(hdrs.ACCEPT_ENCODING, ''),
+                                  ON_THE_FLY_ENCODINGS, ON_THE_FLY_ENCODINGS)
+    if encoding is None:
+        return await handler(request)
+
+    response = await handler(request)
+    # Потоковые ответы включают сжатие сами до отправки заголовков
+    if response.prepared or hdrs.CONTENT_ENCODING in response.headers or response.status in (204, 304):
+        return response
+
+    response.enable_compression(ContentCoding(encoding))
+    return response
@@ -1,8 +1,14 @@
 from aiohttp import web
 import aiohttp_jinja2
+import hashlib
 import json
 from datetime import datetime
 from data_manager.api_formatter import APIFormatter
+from data_manager import serialization
+from data_manager.compression import ON_THE_FLY_ENCODINGS, StreamCompressor, negotiate_encoding, precompress
+from data_manager.ingest import RowIngester
+from data_manager.models import COLUMNAR_CONTENT_TYPE
+from config import config
 
 
 def setup_routes(app: web.Application):
@@ -15,6 +21,13 @@ def setup_routes(app: web.Application):
     app.router.add_get('/api/data/ultra', api_data_ultra_compact)
     app.router.add_get('/api/data/filtered', api_data_filtered)
     app.router.add_get('/api/metadata', api_metadata)
+    app.router.add_post('/api/ingest', api_ingest)
+    app.router.add_post('/api/aggregate', api_aggregate)
+    app.router.add_post('/api/downsample', api_downsample)
+    app.router.add_get('/api/facets', api_facets)
+    app.router.add_post('/api/facets', api_facets)
+    app.router.add_get('/api/layout/data', api_layout_data)
+    app.router.add_post('/api/layout/data', api_layout_data)
 
     # API для layout (новые эндпоинты с dashboard_id)
     app.router.add_get('/api/layout', api_get_layout)
@@ -29,6 +42,24 @@ def setup_routes(app: web.Application):
     app.router.add_get('/api/cache/stats', api_cache_stats)
 
 
+def json_response(data, status: int = 200) -> web.Response:
+    """JSON ответ общим сериализатором (orjson, если установлен; NUMERIC - числом)"""
+    return web.Response(body=serialization.dumps_bytes(data), status=status, content_type='application/json')
+
+
+async def read_json_object(request: web.Request, optional: bool = False) -> dict:
+    """Тело запроса - JSON объект; другой JSON (массив, строка, число) - ValueError (ответ 400).
+
+    optional - запрос без тела (GET) дает пустой объект.
+    """
+    if optional and not request.can_read_body:
+        return {}
+    body = await request.json()
+    if not isinstance(body, dict):
+        raise ValueError('Тело запроса должно быть JSON объектом')
+    return body
+
+
 @aiohttp_jinja2.template('dashboard.html')
 async def dashboard_view(request: web.Request):
     import time
@@ -48,9 +79,9 @@ async def api_data(request: web.Request):
 
     try:
         data = await db_manager.get_all_data(table_name, limit=limit)
-        return web.json_response(data)
+        return json_response(data)
     except Exception as e:
-        return web.json_response(
+        return json_response(
             {'error': f'Ошибка получения данных: {str(e)}'},
             status=500
         )
@@ -59,57 +90,41 @@ async def api_data(request: web.Request):
 async def api_data_compact(request: web.Request):
     """API для получения данных в компактном формате с кешированием"""
     db_manager = request.app['db_manager']
-    cache = request.app['data_cache']
 
     # Параметры запроса
     limit = int(request.query.get('limit', 100000))  # Увеличен лимит по умолчанию
     table_name = request.query.get('table', 'server_metrics')
     use_cache = request.query.get('cache', 'true').lower() == 'true'
+    stream = request.query.get('stream', 'false').lower() == 'true'
 
     cache_key = f"{table_name}_{limit}"
 
     try:
-        # Проверяем кеш
-        if use_cache and cache_key in cache:
-            cached_data = cache[cache_key]
-            if cached_data['timestamp']:
-                cache_age = (datetime.now() - cached_data['timestamp']).total_seconds()
-                if cache_age < cached_data['ttl']:
-                    # Возвращаем из кеша
-                    return web.Response(
-                        text=cached_data['data'],
-                        content_type='application/json',
-                        headers={'X-Cache': 'HIT', 'X-Cache-Age': str(int(cache_age))}
-                    )
-
-        # Кеш промах - загружаем из БД
-        data = await db_manager.get_all_data(table_name, limit=limit)
+        # Инкрементальная синхронизация: только записи новее watermark клиента
+        if 'since_id' in request.query:
+            return await _delta_response(request, table_name, epoch_dates=False)
 
-        # Метаданные для ответа
-        metadata = {
-            'table': table_name,
-            'total_records': len(data),
-            'timestamp': datetime.now().isoformat(),
-            'format': 'compact'
-        }
+        # Колоночный бинарный формат, если клиент его принимает
+        if _accepts_columnar(request):
+            return await _columnar_response(request, table_name, limit, use_cache)
 
-        # Конвертируем в компактный формат
-        compact_json = APIFormatter.to_json(data, metadata)
+        # Потоковый режим: читаем курсором и пишем ответ порциями, без кеша
+        if stream:
+            return await _stream_compact_response(request, table_name, limit, epoch_dates=False)
 
-        # Сохраняем в кеш
-        if use_cache:
-            if cache_key not in cache:
-                cache[cache_key] = {'data': None, 'timestamp': None, 'ttl': 300}
-            cache[cache_key]['data'] = compact_json
-            cache[cache_key]['timestamp'] = datetime.now()
+        # Постраничная загрузка по (timestamp, id)
+        if _is_paged(request):
+            return await _paged_compact_response(request, table_name, filters=None, epoch_dates=False)
 
-        return web.Response(
-            text=compact_json,
-            content_type='application/json',
-            headers={'X-Cache': 'MISS'}
-        )
+        async def build_response():
+            # Кеш промах - строки кодирует в JSON PostgreSQL, Python только склеивает порции
+            async with db_manager.compact_snapshot(table_name, limit=limit) as rows:
+                return await APIFormatter.encoded_to_json(rows)
+
+        return await _cached_response(request, cache_key, (table_name,), use_cache, build_response,
+                                      content_type='application/json', charset='utf-8')
     except Exception as e:
-        return web.json_response(
+        return json_response(
             {'error': f'Ошибка получения данных: {str(e)}'},
             status=500
         )
@@ -118,98 +133,280 @@ async def api_data_compact(request: web.Request):
 async def api_data_ultra_compact(request: web.Request):
     """API для получения данных в ультра-компактном формате (только числовые данные)"""
     db_manager = request.app['db_manager']
-    cache = request.app['data_cache']
 
     limit = int(request.query.get('limit', 100000))
     table_name = request.query.get('table', 'server_metrics')
     use_cache = request.query.get('cache', 'true').lower() == 'true'
+    stream = request.query.get('stream', 'false').lower() == 'true'
 
     cache_key = f"{table_name}_{limit}_ultra"
     print(f"start : {datetime.now().strftime("%M:%S")}")
 
     try:
-        # Проверяем кеш
-        if use_cache and cache_key in cache:
-            cached_data = cache[cache_key]
-            if cached_data['timestamp']:
-                cache_age = (datetime.now() - cached_data['timestamp']).total_seconds()
-                if cache_age < cached_data['ttl']:
-                    return web.Response(
-                        text=cached_data['data'],
-                        content_type='application/json',
-                        headers={'X-Cache': 'HIT', 'X-Cache-Age': str(int(cache_age))}
-                    )
-        print(f"after check cache : {datetime.now().strftime("%M:%S")}")
-
-        # Загружаем данные
-        data = await db_manager.get_all_data(table_name, limit=limit)
-        print(f"data : {datetime.now().strftime("%M:%S")}")
+        if 'since_id' in request.query:
+            return await _delta_response(request, table_name, epoch_dates=True)
 
-        # Оптимизация: конвертируем datetime в timestamp (числа короче строк)
-        for row in data:
-            for key, value in row.items():
-                if isinstance(value, datetime):
-                    row[key] = int(value.timestamp())
+        if _accepts_columnar(request):
+            return await _columnar_response(request, table_name, limit, use_cache)
 
-        # Минимальные метаданные
-        metadata = {'total_records': len(data)}
-        print(f"metadata : {datetime.now().strftime("%M:%S")}")
-        # Конвертируем в компактный формат
-        compact_json = APIFormatter.to_json(data, metadata)
-        print(f"compact : {datetime.now().strftime("%M:%S")}")
-        # Сохраняем в кеш
-        if use_cache:
-            if cache_key not in cache:
-                cache[cache_key] = {'data': None, 'timestamp': None, 'ttl': 300}
-            cache[cache_key]['data'] = compact_json
-            cache[cache_key]['timestamp'] = datetime.now()
+        if stream:
+            return await _stream_compact_response(request, table_name, limit, epoch_dates=True)
+
+        if _is_paged(request):
+            return await _paged_compact_response(request, table_name, filters=None, epoch_dates=True)
+
+        async def build_response():
+            print(f"after check cache : {datetime.now().strftime("%M:%S")}")
+
+            # Даты как unix timestamp (extract(epoch) в PostgreSQL) - числа короче строк
+            async with db_manager.compact_snapshot(table_name, limit=limit, epoch_dates=True) as rows:
+                compact_json = await APIFormatter.encoded_to_json(rows)
+            print(f"compact : {datetime.now().strftime("%M:%S")}")
+            return compact_json
+
+        response = await _cached_response(request, cache_key, (table_name,), use_cache, build_response,
+                                          content_type='application/json', charset='utf-8')
         print(f"cache : {datetime.now().strftime("%M:%S")}")
-        return web.Response(
-            text=compact_json,
-            content_type='application/json',
-            headers={'X-Cache': 'MISS'}
-        )
+        return response
     except Exception as e:
-        return web.json_response(
+        return json_response(
             {'error': f'Ошибка получения данных: {str(e)}'},
             status=500
         )
 
 
-async def api_data_filtered(request: web.Request):
-    """API для получения отфильтрованных данных в компактном формате"""
+async def _delta_response(request: web.Request, table_name: str, epoch_dates: bool) -> web.Response:
+    """Отдает записи с id больше since_id и новый watermark (без кеша - дельта мала)"""
     db_manager = request.app['db_manager']
 
-    # Параметры запроса
-    limit = int(request.query.get('limit', 1000))
-    table_name = request.query.get('table', 'server_metrics')
+    try:
+        since_id = int(request.query['since_id'])
+        limit = request.query.get('limit')
+        data, watermark = await db_manager.get_data_since(table_name, since_id, limit=limit)
+    except ValueError as e:
+        return json_response(
+            {'error': f'Некорректный watermark: {str(e)}'},
+            status=400
+        )
+
+    metadata = {'total_records': len(data), 'watermark': watermark}
+    headers = {'X-Cache': 'BYPASS', 'X-Watermark': str(watermark), 'Vary': 'Accept'}
+
+    if _accepts_columnar(request):
+        return web.Response(
+            body=APIFormatter.to_columnar(data, metadata),
+            content_type=COLUMNAR_CONTENT_TYPE,
+            headers=headers
+        )
+
+    if epoch_dates:
+        for row in data:
+            for key, value in row.items():
+                if isinstance(value, datetime):
+                    row[key] = int(serialization.epoch_seconds(value))
+
+    return web.Response(
+        text=APIFormatter.to_json(data, metadata),
+        content_type='application/json',
+        headers=headers
+    )
+
+
+def _is_paged(request: web.Request) -> bool:
+    """Клиент запросил постраничную загрузку"""
+    return 'cursor' in request.query or 'page_size' in request.query
 
-    # Парсим фильтры из query параметров
-    filters = {}
-    for key, value in request.query.items():
-        if key not in ['limit', 'table']:
-            # Пытаемся преобразовать значения
-            if value.lower() in ['true', 'false']:
-                filters[key] = value.lower() == 'true'
-            elif value.isdigit():
-                filters[key] = int(value)
-            elif value.replace('.', '').isdigit():
-                filters[key] = float(value)
-            else:
-                filters[key] = value
+
+async def _paged_compact_response(request: web.Request, table_name: str, filters: dict,
+                                  epoch_dates: bool, where: tuple = None) -> web.Response:
+    """Отдает одну страницу данных (keyset по timestamp, id) с токеном следующей страницы"""
+    db_manager = request.app['db_manager']
 
     try:
-        data = await db_manager.get_filtered_data(
+        data, next_cursor = await db_manager.get_data_page(
             table_name,
-            filters=filters if filters else None,
-            limit=limit
+            filters=filters,
+            page_size=request.query.get('page_size'),
+            cursor=request.query.get('cursor'),
+            where=where
+        )
+    except ValueError as e:
+        return json_response(
+            {'error': f'Некорректные параметры страницы: {str(e)}'},
+            status=400
+        )
+
+    if epoch_dates:
+        for row in data:
+            for key, value in row.items():
+                if isinstance(value, datetime):
+                    row[key] = int(serialization.epoch_seconds(value))
+
+    metadata = {'total_records': len(data), 'next_cursor': next_cursor}
+    compact_json = APIFormatter.to_json(data, metadata)
+
+    headers = {'X-Cache': 'BYPASS'}
+    if next_cursor:
+        headers['X-Next-Cursor'] = next_cursor
+
+    return web.Response(
+        text=compact_json,
+        content_type='application/json',
+        headers=headers
+    )
+
+
+def _accepts_columnar(request: web.Request) -> bool:
+    """Клиент запросил колоночный бинарный формат через Accept"""
+    return COLUMNAR_CONTENT_TYPE in request.headers.get('Accept', '')
+
+
+async def _columnar_response(request: web.Request, table_name: str, limit: int,
+                             use_cache: bool) -> web.Response:
+    """Отдает данные в колоночном бинарном формате (типизированные буферы колонок)"""
+    db_manager = request.app['db_manager']
+
+    cache_key = f"{table_name}_{limit}_columnar"
+
+    async def build_response():
+        data, watermark = await db_manager.get_data_snapshot(table_name, limit=limit)
+        return APIFormatter.to_columnar(data, {'total_records': len(data), 'watermark': watermark})
+
+    return await _cached_response(request, cache_key, (table_name,), use_cache, build_response,
+                                  content_type=COLUMNAR_CONTENT_TYPE)
+
+
+async def _cached_response(request: web.Request, cache_key: str, tables: tuple, use_cache: bool, build,
+                           content_type: str, charset: str = None) -> web.Response:
+    """Ответ из кеша данных или build().
+
+    В кеше хранится тело вместе с заранее сжатыми вариантами (gzip, br/zstd если доступны):
+    попадание отдает готовые байты под Accept-Encoding клиента без повторного сжатия.
+    Запись помнит build и таблицы - фоновый прогрев пересчитывает ее до истечения TTL.
+    """
+    db_manager = request.app['db_manager']
+    headers = {'Vary': 'Accept, Accept-Encoding'}
+
+    if not use_cache:
+        # Без кеша сжимать заранее незачем - это сделает compress_middleware
+        body = await build()
+        headers['X-Cache'] = 'BYPASS'
+        return web.Response(
+            body=body.encode('utf-8') if isinstance(body, str) else body,
+            content_type=content_type,
+            charset=charset,
+            headers=headers
+        )
+
+    async def fill():
+        return await precompress(await build())
+
+    def version_fn():
+        return tuple(db_manager.get_table_version(table) for table in tables)
+
+    entry, status = await request.app['data_cache'].get_or_compute(
+        cache_key, fill, version_fn=version_fn, tables=tables
+    )
+    headers['X-Cache'] = status
+    if status in ('HIT', 'STALE'):
+        headers['X-Cache-Age'] = str(int(entry.age))
+
+    encoding, body = entry.value.select(request.headers.get('Accept-Encoding', ''))
+    if encoding:
+        headers['Content-Encoding'] = encoding
+
+    return web.Response(body=body, content_type=content_type, charset=charset, headers=headers)
+
+
+async def _stream_compact_response(request: web.Request, table_name: str, limit: int,
+                                   epoch_dates: bool) -> web.StreamResponse:
+    """Отдает компактный JSON потоком: порции строк, закодированные PostgreSQL -> StreamResponse"""
+    db_manager = request.app['db_manager']
+
+    # Снимок и выбор словарей по началу выборки (ограниченный запрос) - до отправки заголовков,
+    # чтобы ошибки БД вернулись как 500; словари и число строк идут в конце JSON
+    async with db_manager.compact_snapshot(table_name, limit=limit, epoch_dates=epoch_dates) as rows:
+        response = web.StreamResponse(headers={'X-Cache': 'BYPASS', 'Vary': 'Accept, Accept-Encoding',
+                                               'X-Watermark': str(rows.watermark)})
+        if 'etag' in request:
+            response.headers['ETag'] = request['etag']
+            response.headers['Cache-Control'] = 'no-cache'
+        response.content_type = 'application/json'
+        # compress_middleware включает сжатие после обработчика, а заголовки потока уже отправлены;
+        # сжимаем сами со сбросом после каждой порции, чтобы строки уходили клиенту сразу
+        encoding = negotiate_encoding(request.headers.get('Accept-Encoding', ''),
+                                      ON_THE_FLY_ENCODINGS, ON_THE_FLY_ENCODINGS)
+        compressor = StreamCompressor(encoding) if encoding else None
+        if compressor is not None:
+            response.headers['Content-Encoding'] = encoding
+        await response.prepare(request)
+
+        pieces = APIFormatter.iter_encoded_json(rows)
+        try:
+            async for piece in pieces:
+                data = piece.encode('utf-8')
+                await response.write(compressor.compress(data) if compressor is not None else data)
+            await response.write_eof(compressor.finish() if compressor is not None else b'')
+        except Exception as e:
+            # Заголовки уже отправлены - вернуть JSON с ошибкой нельзя, просто обрываем поток
+            print(f"❌ Ошибка потоковой отдачи данных: {e}")
+        finally:
+            await pieces.aclose()
+
+    return response
+
+
+async def api_data_filtered(request: web.Request):
+    """API для получения отфильтрованных данных в компактном формате.
+
+    Фильтр - JSON в параметре filter (GET) или в поле filter тела (POST), например:
+    {"and": [{"field": "timestamp", "op": "range", "gte": "2025-01-01", "lt": "2025-01-02"},
+             {"field": "environment", "op": "in", "values": ["production", "staging"]},
+             {"or": [{"field": "cpu_usage", "op": "range", "gt": 90},
+                     {"field": "status", "op": "eq", "value": "critical"}]}]}
+    Параметры ?колонка=значение - краткая форма равенств. Колонки и типы значений
+    проверяются по схеме таблицы, неизвестные колонки - ошибка 400.
+    """
+    db_manager = request.app['db_manager']
+    query_engine = request.app['query_engine']
+
+    reserved = {'limit', 'table', 'cursor', 'page_size', 'filter'}
+    try:
+        body = await read_json_object(request, optional=True)
+        limit = int(request.query.get('limit', body.get('limit', 1000)))
+        table_name = request.query.get('table', body.get('table', 'server_metrics'))
+
+        if 'filter' in request.query:
+            spec = json.loads(request.query['filter'])
+        elif 'filter' in body:
+            spec = body['filter']
+        else:
+            spec = {key: value for key, value in request.query.items() if key not in reserved}
+
+        where = await query_engine.compile_filter(table_name, spec)
+    except (ValueError, TypeError) as e:
+        return json_response(
+            {'error': f'Некорректный фильтр: {str(e)}'},
+            status=400
         )
 
+    try:
+        if _is_paged(request):
+            return await _paged_compact_response(request, table_name, filters=None, epoch_dates=False, where=where)
+
+        columnar = request.app.get('columnar_store')
+        simple = query_engine.simple_filters(spec)
+        if columnar is not None and simple is not None and columnar.can_answer(table_name, set(), simple):
+            # Актуальная копия таблицы в памяти - без запроса к БД
+            data = columnar.select(simple or None, limit, query_engine.parse_datetime)
+        else:
+            data = await db_manager.get_filtered_data(table_name, limit=limit, where=where)
+
         # Метаданные для ответа
         metadata = {
             'table': table_name,
             'total_records': len(data),
-            'filters_applied': filters,
+            'filters_applied': spec,
             'timestamp': datetime.now().isoformat(),
             'format': 'compact'
         }
@@ -222,34 +419,226 @@ async def api_data_filtered(request: web.Request):
             content_type='application/json'
         )
     except Exception as e:
-        return web.json_response(
+        return json_response(
             {'error': f'Ошибка фильтрации данных: {str(e)}'},
             status=500
         )
 
 
-async def api_metadata(request: web.Request):
-    """API для получения метаданных о таблицах и колонках"""
+async def api_aggregate(request: web.Request):
+    """API для серверной агрегации панели (GROUP BY в PostgreSQL)"""
+    query_engine = request.app['query_engine']
+
+    try:
+        body = await read_json_object(request)
+        config = body.get('config') or {}
+        table_name = body.get('table', 'server_metrics')
+
+        data = await query_engine.aggregate(
+            table_name,
+            config,
+            filters=body.get('filters'),
+            limit=body.get('limit'),
+            date_range=body.get('date_range')
+        )
+
+        metadata = {'total_records': len(data)}
+        compact_json = APIFormatter.to_json(data, metadata)
+
+        return web.Response(
+            text=compact_json,
+            content_type='application/json'
+        )
+    except ValueError as e:
+        return json_response(
+            {'error': f'Некорректная конфигурация панели: {str(e)}'},
+            status=400
+        )
+    except Exception as e:
+        return json_response(
+            {'error': f'Ошибка агрегации данных: {str(e)}'},
+            status=500
+        )
+
+
+async def api_downsample(request: web.Request):
+    """API для даунсэмплинга временного ряда (LTTB или min/max по корзинам) для графиков"""
+    query_engine = request.app['query_engine']
+
+    try:
+        body = await read_json_object(request)
+        table_name = body.get('table', 'server_metrics')
+
+        result = await query_engine.downsample(
+            table_name,
+            body,
+            filters=body.get('filters'),
+            date_range=body.get('date_range')
+        )
+
+        return json_response(result)
+    except ValueError as e:
+        return json_response(
+            {'error': f'Некорректные параметры даунсэмплинга: {str(e)}'},
+            status=400
+        )
+    except Exception as e:
+        return json_response(
+            {'error': f'Ошибка даунсэмплинга данных: {str(e)}'},
+            status=500
+        )
+
+
+async def api_facets(request: web.Request):
+    """API значений фильтров: distinct значения колонок с числом строк под текущими фильтрами.
+
+    GET: ?columns=server_zone,status&prefix=eu&limit=20&filters={"environment":"production"}
+    POST: {"columns": [...], "filters": {...}, "prefix": ..., "limit": ..., "date_range": {...}}
+    """
+    query_engine = request.app['query_engine']
+
+    try:
+        body = await read_json_object(request, optional=True)
+        table_name = request.query.get('table', body.get('table', 'server_metrics'))
+        columns = body.get('columns')
+        if 'columns' in request.query:
+            columns = [column for column in request.query['columns'].split(',') if column]
+        filters = json.loads(request.query['filters']) if 'filters' in request.query else body.get('filters')
+        prefix = request.query.get('prefix', body.get('prefix'))
+        limit = request.query.get('limit', body.get('limit'))
+        date_range = body.get('date_range')
+        use_cache = request.query.get('cache', 'true').lower() == 'true'
+
+        params = {'columns': columns, 'filters': filters, 'prefix': prefix, 'limit': limit, 'date_range': date_range}
+        params_hash = hashlib.md5(json.dumps(params, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+        cache_key = f"facets_{table_name}_{params_hash}"
+
+        async def build_response():
+            result = await query_engine.facets(
+                table_name, columns, filters=filters, prefix=prefix, limit=limit, date_range=date_range
+            )
+            return serialization.dumps_bytes(result)
+
+        return await _cached_response(request, cache_key, (table_name,), use_cache, build_response,
+                                      content_type='application/json', charset='utf-8')
+    except (ValueError, TypeError) as e:
+        return json_response(
+            {'error': f'Некорректный запрос значений фильтров: {str(e)}'},
+            status=400
+        )
+    except Exception as e:
+        return json_response(
+            {'error': f'Ошибка получения значений фильтров: {str(e)}'},
+            status=500
+        )
+
+
+async def api_layout_data(request: web.Request):
+    """API для расчета всех панелей layout одним ответом (общие проходы по таблице)"""
+    layout_manager = request.app['layout_manager']
+    query_engine = request.app['query_engine']
+
+    try:
+        body = await read_json_object(request, optional=True)
+
+        dashboard_id = request.query.get('dashboard_id', body.get('dashboard_id', 'default'))
+        layout_name = request.query.get('name', body.get('name', 'default'))
+        limit = request.query.get('limit', body.get('limit'))
+
+        limit = int(limit) if limit else None
+
+        layout_config = await layout_manager.load_layout_config(dashboard_id, layout_name)
+        if isinstance(layout_config, str):
+            layout_config = json.loads(layout_config)
+
+        # Сохраненный layout без доп. фильтров кешируется и прогревается в фоне
+        if not body.get('filters') and not body.get('date_range'):
+            cache_key = query_engine.layout_cache_key(dashboard_id, layout_name, layout_config, limit)
+
+            async def build_response():
+                return await query_engine.render_layout(dashboard_id, layout_name, layout_config, limit)
+
+            return await _cached_response(request, cache_key, query_engine.layout_tables(layout_config),
+                                          True, build_response,
+                                          content_type='application/json', charset='utf-8')
+
+        result = await query_engine.evaluate_layout(
+            layout_config,
+            filters=body.get('filters'),
+            limit=limit,
+            date_range=body.get('date_range')
+        )
+        result['dashboard_id'] = dashboard_id
+        result['name'] = layout_name
+
+        return json_response(result)
+    except ValueError as e:
+        return json_response(
+            {'error': f'Некорректный запрос: {str(e)}'},
+            status=400
+        )
+    except Exception as e:
+        return json_response(
+            {'error': f'Ошибка расчета панелей: {str(e)}'},
+            status=500
+        )
+
+
+async def api_ingest(request: web.Request):
+    """Потоковая загрузка строк NDJSON/CSV в таблицу.
+
+    Тело читается по мере записи: строки проверяются по схеме таблицы и пишутся COPY
+    порциями, память не зависит от размера загрузки. Загрузка - одна транзакция;
+    некорректные строки пропускаются и возвращаются в счетчике rejected.
+    """
     db_manager = request.app['db_manager']
     table_name = request.query.get('table', 'server_metrics')
 
+    if table_name not in config.INGEST_TABLES:
+        return json_response(
+            {'error': f'Загрузка в таблицу {table_name} запрещена'},
+            status=403
+        )
+
     try:
-        # Получаем названия колонок
-        columns = await db_manager.get_column_names(table_name)
+        schema = await db_manager.get_table_schema(table_name)
+        data_format = RowIngester.detect_format(request.content_type, request.query.get('format'))
+        ingester = RowIngester(schema, data_format)
+        await db_manager.insert_data(table_name, ingester.records(request.content), columns=ingester.columns)
 
-        # Получаем пример данных для определения типов
-        sample_data = await db_manager.get_all_data(table_name, limit=1)
+        return json_response({
+            'table': table_name,
+            **ingester.result.to_dict(),
+            'version': db_manager.get_table_version(table_name)
+        })
+    except ValueError as e:
+        return json_response(
+            {'error': f'Некорректный запрос: {str(e)}'},
+            status=400
+        )
+    except Exception as e:
+        return json_response(
+            {'error': f'Ошибка загрузки данных: {str(e)}'},
+            status=500
+        )
 
-        metadata = {
-            'table_name': table_name,
-            'columns': columns,
-            'sample_record': sample_data[0] if sample_data else {},
-            'total_columns': len(columns)
-        }
 
-        return web.json_response(metadata)
+async def api_metadata(request: web.Request):
+    """API для получения метаданных о таблицах и колонках"""
+    db_manager = request.app['db_manager']
+    table_name = request.query.get('table', 'server_metrics')
+
+    try:
+        # Колонки, типы, NULL и оценка числа строк - из каталога схемы, без запросов к БД
+        schema = await db_manager.get_table_schema(table_name)
+        return json_response(schema.describe())
+    except ValueError as e:
+        return json_response(
+            {'error': f'Некорректный запрос: {str(e)}'},
+            status=400
+        )
     except Exception as e:
-        return web.json_response(
+        return json_response(
             {'error': f'Ошибка получения метаданных: {str(e)}'},
             status=500
         )
@@ -265,9 +654,9 @@ async def api_get_layout(request: web.Request):
 
     try:
         layout_config = await layout_manager.load_layout_config(dashboard_id, layout_name)
-        return web.json_response(layout_config)
+        return json_response(layout_config)
     except Exception as e:
-        return web.json_response(
+        return json_response(
             {'error': f'Ошибка загрузки layout: {str(e)}'},
             status=500
         )
@@ -282,7 +671,7 @@ async def api_save_layout(request: web.Request):
 
         # Валидация данных
         if not layout_manager.validate_layout_config(data):
-            return web.json_response(
+            return json_response(
                 {'error': 'Некорректный формат конфигурации'},
                 status=400
             )
@@ -294,12 +683,12 @@ async def api_save_layout(request: web.Request):
         result = await layout_manager.save_layout_config(dashboard_id, layout_name, data)
 
         if result['status'] == 'success':
-            return web.json_response(result)
+            return json_response(result)
         else:
-            return web.json_response(result, status=500)
+            return json_response(result, status=500)
 
     except Exception as e:
-        return web.json_response(
+        return json_response(
             {'error': f'Ошибка сохранения layout: {str(e)}'},
             status=500
         )
@@ -312,9 +701,9 @@ async def api_get_dashboard_layouts(request: web.Request):
 
     try:
         result = await layout_manager.load_dashboard_layouts(dashboard_id)
-        return web.json_response(result)
+        return json_response(result)
     except Exception as e:
-        return web.json_response(
+        return json_response(
             {'error': f'Ошибка загрузки layouts: {str(e)}'},
             status=500
         )
@@ -325,9 +714,9 @@ async def api_get_all_dashboards(request: web.Request):
 
     try:
         result = await layout_manager.load_all_dashboards()
-        return web.json_response(result)
+        return json_response(result)
     except Exception as e:
-        return web.json_response(
+        return json_response(
             {'error': f'Ошибка загрузки дашбордов: {str(e)}'},
             status=500
         )
@@ -343,12 +732,12 @@ async def api_delete_layout(request: web.Request):
         result = await layout_manager.delete_layout(dashboard_id, layout_name)
 
         if result['status'] == 'success':
-            return web.json_response(result)
+            return json_response(result)
         else:
-            return web.json_response(result, status=500)
+            return json_response(result, status=500)
 
     except Exception as e:
-        return web.json_response(
+        return json_response(
             {'error': f'Ошибка удаления layout: {str(e)}'},
             status=500
         )
@@ -370,12 +759,12 @@ async def api_duplicate_layout(request: web.Request):
         )
 
         if result['status'] == 'success':
-            return web.json_response(result)
+            return json_response(result)
         else:
-            return web.json_response(result, status=500)
+            return json_response(result, status=500)
 
     except Exception as e:
-        return web.json_response(
+        return json_response(
             {'error': f'Ошибка копирования layout: {str(e)}'},
             status=500
         )
@@ -386,55 +775,37 @@ async def api_clear_cache(request: web.Request):
     cache = request.app['data_cache']
 
     try:
-        # Получаем список ключей для очистки
-        cache_keys = [k for k in cache.keys() if k not in ['ttl']]
-
-        # Очищаем кеш
-        for key in cache_keys:
-            if key not in ['ttl']:
-                cache.pop(key, None)
+        cache_keys = cache.clear()
 
-        return web.json_response({
+        return json_response({
             'status': 'success',
             'message': f'Кеш очищен. Удалено записей: {len(cache_keys)}',
             'cleared_keys': cache_keys
         })
     except Exception as e:
-        return web.json_response(
+        return json_response(
             {'error': f'Ошибка очистки кеша: {str(e)}'},
             status=500
         )
 
 
 async def api_cache_stats(request: web.Request):
-    """Статистика кеша"""
+    """Статистика кеша: попадания, промахи, вытеснения и занятый объем"""
     cache = request.app['data_cache']
 
     try:
-        stats = {
-            'total_entries': len([k for k in cache.keys() if k not in ['ttl']]),
-            'entries': []
-        }
-
-        for key, value in cache.items():
-            if key == 'ttl':
-                continue
-
-            if isinstance(value, dict) and 'timestamp' in value:
-                age = (datetime.now() - value['timestamp']).total_seconds() if value['timestamp'] else None
-                size = len(value['data']) if value.get('data') else 0
-
-                stats['entries'].append({
-                    'key': key,
-                    'age_seconds': age,
-                    'ttl': value.get('ttl', 0),
-                    'size_bytes': size,
-                    'expired': age > value.get('ttl', 0) if age else False
-                })
-
-        return web.json_response(stats)
+        stats = cache.stats()
+        if 'cache_warmer' in request.app:
+            stats['warmer'] = request.app['cache_warmer'].stats()
+        if 'rollup_manager' in request.app:
+            stats['rollups'] = request.app['rollup_manager'].stats()
+        if request.app.get('columnar_store') is not None:
+            stats['columnar'] = request.app['columnar_store'].stats()
+        if 'partition_manager' in request.app:
+            stats['partitions'] = request.app['partition_manager'].stats()
+        return json_response(stats)
     except Exception as e:
-        return web.json_response(
+        return json_response(
             {'error': f'Ошибка получения статистики: {str(e)}'},
             status=500
-        )
\ No newline at end of file
+        )
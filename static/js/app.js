@@ -1,7 +1,14 @@
+// Media type колоночного бинарного формата (см. COLUMNAR_CONTENT_TYPE в data_manager/models.py)
+const COLUMNAR_CONTENT_TYPE = 'application/vnd.blinksense.columnar';
+
+// Максимум записей в одном ответе инкрементальной синхронизации (MAX_PAGE_SIZE на сервере)
+const DELTA_PAGE_SIZE = 20000;
+
 class App {
     constructor() {
         this.data = [];
         this.filteredData = [];
+        this.watermark = null;  // max id загруженных записей для инкрементальной синхронизации
         this.cache = new ClientCache();
         this.gridManager = new GridManager();
         this.panelManager = new PanelManager(this.gridManager);
@@ -31,6 +38,9 @@ class App {
         console.log('📈 [App] Шаг 4: Обновление информационной панели');
         this.updateInfoPanel();
 
+        // Периодически догружаем только новые записи (по истечении TTL клиентского кэша)
+        setInterval(() => this.refreshData(), this.cache.ttl);
+
         console.log('✅ [App] Инициализация завершена');
     }
 
@@ -41,34 +51,20 @@ class App {
 
             if (cached) {
                 this.data = cached.data;
+                this.watermark = cached.watermark;
                 this.downloadedSize = cached.downloadedSize || 0;
                 console.log('📦 Данные загружены из кэша');
+            } else if (this.watermark !== null && this.data.length > 0) {
+                // Кэш истек, но данные уже есть - догружаем только новые записи
+                await this.refreshData();
             } else {
                 // Используем ультра-компактный формат (даты как timestamps)
-                const response = await fetch('/api/data/ultra?limit=40000');
-
-                // Получаем размер загруженных данных из заголовков
-                const contentLength = response.headers.get('content-length');
-                const contentEncoding = response.headers.get('content-encoding');
+                const result = await this._fetchDataset('/api/data/ultra?limit=40000');
 
-                const compactDataText = await response.text();
-                const compactData = JSON.parse(compactDataText);
-
-                // Сохраняем реальный размер загруженных данных
-                this.downloadedSize = compactDataText.length;
-
-                // Конвертируем компактный формат в обычный
-                this.data = this._expandCompactFormat(compactData);
-                this.cache.set('all_data', {
-                    data: this.data,
-                    downloadedSize: this.downloadedSize
-                });
-
-                console.log(`📥 Данные загружены: ${(this.downloadedSize / 1024 / 1024).toFixed(2)} MB`);
-                console.log(`🗜️ Compression: ${contentEncoding || 'none'}`);
-                if (contentLength) {
-                    console.log(`📦 Content-Length: ${(parseInt(contentLength) / 1024 / 1024).toFixed(2)} MB`);
-                }
+                this.data = result.data;
+                this.watermark = result.watermark;
+                this.downloadedSize = result.size;
+                this._saveDataToCache();
             }
 
             const loadTime = performance.now() - startTime;
@@ -104,6 +100,9 @@ class App {
         const { h: headers, d: dataRows } = compactData;
         const expandedData = [];
 
+        // Словари строковых колонок: в строках лежат индексы значений
+        const dictionaries = headers.map(header => (compactData.x && compactData.x[header]) || null);
+
         // Определяем индексы колонок с датами для конвертации timestamp обратно
         const dateColumns = [
             'timestamp', 'install_date', 'last_update_date',
@@ -118,7 +117,7 @@ class App {
             const item = {};
             for (let i = 0; i < headers.length; i++) {
                 if (i < row.length) {
-                    let value = row[i];
+                    let value = dictionaries[i] ? dictionaries[i][row[i]] : row[i];
                     // Конвертируем timestamp обратно в дату для колонок с датами
                     if (dateIndices.includes(i) && typeof value === 'number') {
                         value = new Date(value * 1000).toISOString();
@@ -133,6 +132,155 @@ class App {
         return expandedData;
     }
 
+    /**
+     * Загружает набор данных: колоночный бинарный формат, если сервер его отдает, иначе компактный JSON.
+     * Возвращает { data, watermark, size }.
+     */
+    async _fetchDataset(url) {
+        const response = await fetch(url, {
+            headers: { 'Accept': `${COLUMNAR_CONTENT_TYPE}, application/json` }
+        });
+
+        // Получаем размер загруженных данных из заголовков
+        const contentLength = response.headers.get('content-length');
+        const contentEncoding = response.headers.get('content-encoding');
+        const contentType = response.headers.get('content-type') || '';
+
+        let result;
+        if (contentType.includes(COLUMNAR_CONTENT_TYPE)) {
+            const buffer = await response.arrayBuffer();
+            const decoded = this._decodeColumnarFormat(buffer);
+            result = { data: decoded.data, watermark: decoded.watermark, size: buffer.byteLength };
+        } else {
+            const compactDataText = await response.text();
+            const compactData = JSON.parse(compactDataText);
+            if (compactData.error) {
+                throw new Error(compactData.error);
+            }
+
+            // Конвертируем компактный формат в обычный
+            result = {
+                data: this._expandCompactFormat(compactData),
+                watermark: compactData.w ?? null,
+                size: compactDataText.length
+            };
+        }
+
+        console.log(`📥 Данные загружены: ${(result.size / 1024 / 1024).toFixed(2)} MB`);
+        console.log(`🗜️ Compression: ${contentEncoding || 'none'}`);
+        if (contentLength) {
+            console.log(`📦 Content-Length: ${(parseInt(contentLength) / 1024 / 1024).toFixed(2)} MB`);
+        }
+        return result;
+    }
+
+    /**
+     * Инкрементальная синхронизация: запрашивает записи новее watermark и дописывает их к данным
+     */
+    async refreshData() {
+        if (this.watermark === null) {
+            return;
+        }
+
+        try {
+            let received = 0;
+            let total = 0;
+            do {
+                const result = await this._fetchDataset(
+                    `/api/data/ultra?since_id=${this.watermark}&limit=${DELTA_PAGE_SIZE}`
+                );
+                received = result.data.length;
+                for (const item of result.data) {
+                    this.data.push(item);
+                }
+                this.watermark = result.watermark;
+                this.downloadedSize = (this.downloadedSize || 0) + result.size;
+                total += received;
+            } while (received === DELTA_PAGE_SIZE);
+
+            this._saveDataToCache();
+
+            if (total > 0) {
+                console.log(`🔄 Догружено новых записей: ${total}`);
+                this.gridManager.analyzeData(this.data);
+                this.gridManager.refreshAllPanels();
+                this.updateInfoPanel();
+            }
+        } catch (error) {
+            console.error('❌ Ошибка инкрементальной синхронизации:', error);
+        }
+    }
+
+    _saveDataToCache() {
+        this.cache.set('all_data', {
+            data: this.data,
+            watermark: this.watermark,
+            downloadedSize: this.downloadedSize
+        });
+    }
+
+    /**
+     * Декодирует колоночный бинарный формат (см. ColumnarData в data_manager/models.py).
+     * Числовые колонки читаются напрямую как TypedArray без парсинга текста.
+     * Возвращает { data, watermark }.
+     */
+    _decodeColumnarFormat(buffer) {
+        const magic = String.fromCharCode(...new Uint8Array(buffer, 0, 4));
+        if (magic !== 'BSC1') {
+            console.warn('⚠️ Некорректный колоночный формат данных');
+            return { data: [], watermark: null };
+        }
+
+        const headerLength = new DataView(buffer).getUint32(4, true);
+        const header = JSON.parse(new TextDecoder().decode(new Uint8Array(buffer, 8, headerLength)));
+        const bodyOffset = Math.ceil((8 + headerLength) / 8) * 8;
+
+        // Для каждой колонки - функция чтения значения по номеру строки
+        const readers = header.cols.map(col => {
+            const offset = bodyOffset + col.o;
+            switch (col.t) {
+                case 'i32': {
+                    const values = new Int32Array(buffer, offset, col.l / 4);
+                    return i => values[i];
+                }
+                case 'f64': {
+                    const values = new Float64Array(buffer, offset, col.l / 8);
+                    return i => (Number.isNaN(values[i]) ? null : values[i]);
+                }
+                case 'date': {
+                    const values = new Float64Array(buffer, offset, col.l / 8);
+                    return i => (Number.isNaN(values[i]) ? null : new Date(values[i] * 1000).toISOString());
+                }
+                case 'bool': {
+                    const values = new Uint8Array(buffer, offset, col.l);
+                    return i => values[i] === 1;
+                }
+                case 'dict8':
+                case 'dict16':
+                case 'dict32': {
+                    const ArrayType = { dict8: Uint8Array, dict16: Uint16Array, dict32: Int32Array }[col.t];
+                    const codes = new ArrayType(buffer, offset, col.l / ArrayType.BYTES_PER_ELEMENT);
+                    return i => col.v[codes[i]];
+                }
+                default:
+                    console.warn(`⚠️ Неизвестный тип колонки: ${col.t}`);
+                    return () => null;
+            }
+        });
+
+        const expandedData = new Array(header.c);
+        for (let i = 0; i < header.c; i++) {
+            const item = {};
+            for (let j = 0; j < readers.length; j++) {
+                item[header.cols[j].n] = readers[j](i);
+            }
+            expandedData[i] = item;
+        }
+
+        console.log(`🔄 Декодировано ${expandedData.length} записей из колоночного формата`);
+        return { data: expandedData, watermark: header.w ?? null };
+    }
+
     /**
      * Загружает данные с фильтрацией (использует компактный формат)
      */
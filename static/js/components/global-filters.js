@@ -5,6 +5,10 @@ class GlobalFilters {
             dateRange: null,
             customFilters: []
         };
+        // Значения для списков фильтров с сервера (/api/facets): ключ -> { values, loadedAt }
+        this.facetCache = new Map();
+        this.facetRequests = new Map();
+        this.facetTtlMs = 60000;
         this.init();
     }
 
@@ -292,8 +296,8 @@ class GlobalFilters {
                 return `
                     <select class="form-control filter-value" data-filter-id="${filter.id}" multiple>
                         ${uniqueValues.map(val => `
-                            <option value="${val}" ${(filter.value || []).includes(val) ? 'selected' : ''}>
-                                ${val}
+                            <option value="${this.escapeHtml(val)}" ${(filter.value || []).includes(val) ? 'selected' : ''}>
+                                ${this.escapeHtml(val)}
                             </option>
                         `).join('')}
                     </select>
@@ -304,9 +308,9 @@ class GlobalFilters {
                 return `
                     <div class="position-relative">
                         <input type="text" class="form-control filter-value" data-filter-id="${filter.id}" 
-                               value="${filter.value || ''}" placeholder="Введите значение" list="values-${filter.id}">
+                               value="${this.escapeHtml(filter.value || '')}" placeholder="Введите значение" list="values-${filter.id}">
                         <datalist id="values-${filter.id}">
-                            ${uniqueValues.map(val => `<option value="${val}"></option>`).join('')}
+                            ${uniqueValues.map(val => `<option value="${this.escapeHtml(val)}"></option>`).join('')}
                         </datalist>
                     </div>
                 `;
@@ -315,19 +319,108 @@ class GlobalFilters {
     }
 
     getUniqueValues(fieldId) {
-        if (!this.gridManager.sampleData || !this.gridManager.sampleData.length) {
-            return [];
+        // Значения считает сервер по всей таблице; пока они грузятся, список пуст
+        const key = this.getFacetKey(fieldId);
+        const cached = this.facetCache.get(key);
+        if (cached && performance.now() - cached.loadedAt < this.facetTtlMs) {
+            return cached.values;
         }
 
-        const uniqueValues = new Set();
-        this.gridManager.sampleData.forEach(record => {
-            const value = record[fieldId];
-            if (value !== null && value !== undefined && value !== '') {
-                uniqueValues.add(String(value));
+        this.loadFacetValues(fieldId, key);
+        return cached ? cached.values : [];
+    }
+
+    getFacetKey(fieldId) {
+        return JSON.stringify([fieldId, this.getFacetFilters(fieldId)]);
+    }
+
+    /**
+     * Фильтры "равно"/"в списке" по другим категориальным полям - значения поля считаются под ними
+     */
+    getFacetFilters(fieldId) {
+        const fields = this.getAvailableFields();
+        const filters = {};
+
+        this.filters.customFilters.forEach(filter => {
+            if (!filter.field || filter.field === fieldId) return;
+            const field = fields.find(f => f.id === filter.field);
+            if (!field || field.type === 'date' || field.type === 'number') return;
+
+            if (filter.operator === 'equals' && filter.value) {
+                filters[filter.field] = filter.value;
+            } else if (filter.operator === 'in' && Array.isArray(filter.value) && filter.value.length) {
+                filters[filter.field] = filter.value;
             }
         });
 
-        return Array.from(uniqueValues).sort().slice(0, 50); // Ограничиваем 50 значениями
+        return filters;
+    }
+
+    loadFacetValues(fieldId, key) {
+        if (this.facetRequests.has(key)) return;
+
+        const params = new URLSearchParams({ columns: fieldId, limit: '50' });
+        const filters = this.getFacetFilters(fieldId);
+        if (Object.keys(filters).length) {
+            params.append('filters', JSON.stringify(filters));
+        }
+
+        const request = fetch(`/api/facets?${params}`)
+            .then(response => response.json())
+            .then(result => {
+                const facet = result.facets && result.facets[fieldId];
+                if (!facet) {
+                    throw new Error(result.error || 'Пустой ответ');
+                }
+                // Top-K по числу строк, в списке - по алфавиту
+                const values = facet.values.map(([value]) => String(value)).sort();
+                this.facetCache.set(key, { values, loadedAt: performance.now() });
+                this.updateValueOptions(fieldId, values);
+            })
+            .catch(error => console.error(`❌ Ошибка загрузки значений фильтра ${fieldId}:`, error))
+            .finally(() => this.facetRequests.delete(key));
+
+        this.facetRequests.set(key, request);
+    }
+
+    /**
+     * Подставляет загруженные значения в уже отрисованные списки, не сбрасывая ввод пользователя
+     */
+    updateValueOptions(fieldId, values) {
+        this.filters.customFilters
+            .filter(filter => filter.field === fieldId)
+            .forEach(filter => {
+                const datalist = document.getElementById(`values-${filter.id}`);
+                if (datalist) {
+                    datalist.replaceChildren(...values.map(val => this.createOption(val, false)));
+                }
+
+                const select = document.querySelector(`select.filter-value[data-filter-id="${filter.id}"]`);
+                if (select) {
+                    const selected = filter.value || [];
+                    select.replaceChildren(...values.map(val => this.createOption(val, selected.includes(val))));
+                }
+            });
+    }
+
+    /**
+     * <option> для значения из БД: текст и value задаются как свойства, а не разметкой
+     */
+    createOption(value, selected) {
+        const option = document.createElement('option');
+        option.value = value ?? '';
+        option.textContent = value ?? '';
+        option.selected = selected;
+        return option;
+    }
+
+    /**
+     * Экранирует значение для вставки в HTML шаблон (значения фильтров приходят из БД)
+     */
+    escapeHtml(value) {
+        return String(value ?? '').replace(/[&<>"']/g, char => ({
+            '&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;', "'": '&#39;'
+        })[char]);
     }
 
     setupAdvancedFilterEvents(container) {
@@ -7,11 +7,51 @@ import time
 import sys
 from data_manager.database import DatabaseManager
 from data_manager.api_formatter import APIFormatter
+from data_manager import serialization
 from datetime import datetime
 from config import config
 
 
-async def test_endpoints():
+def benchmark_json_encoders(data, repeats: int = 3):
+    """Сборка и сериализация компактного формата: прежний путь (json.dumps, default=str) против serialization"""
+    import json
+    headers = list(data[0].keys()) if data else []
+
+    def legacy():
+        rows = [[value.isoformat() if isinstance(value, datetime) else value for value in item.values()]
+                for item in data]
+        return json.dumps({'h': headers, 'd': rows, 'c': len(rows)},
+                          separators=(',', ':'), ensure_ascii=False, default=str).encode('utf-8')
+
+    def encoder(encode):
+        def run():
+            compact = APIFormatter.to_compact_format(data, {}, dictionary_encode=False)
+            return encode({'h': compact.headers, 'd': compact.data, 'c': len(compact.data)})
+        return run
+
+    def measure(build):
+        best = None
+        for _ in range(repeats):
+            start = time.perf_counter()
+            body = build()
+            elapsed = (time.perf_counter() - start) * 1000
+            best = elapsed if best is None else min(best, elapsed)
+        return best, len(body)
+
+    baseline_time, baseline_size = measure(legacy)
+    print(f"\n  5️⃣  КОДИРОВЩИКИ JSON (сборка строк + сериализация, лучшее из {repeats}):")
+    print(f"      json, default=str (NUMERIC строкой): {baseline_time:.0f} ms, {baseline_size / 1024 / 1024:.2f} MB")
+    for name in serialization.ENCODER_PREFERENCE[::-1]:
+        if name not in serialization.ENCODERS:
+            print(f"      {name}: не установлен")
+            continue
+        encode_time, encode_size = measure(encoder(serialization.ENCODERS[name]))
+        print(f"      {name} (NUMERIC числом): {encode_time:.0f} ms, {encode_size / 1024 / 1024:.2f} MB, "
+              f"x{baseline_time / max(encode_time, 1e-6):.1f} по скорости, "
+              f"{(1 - encode_size / baseline_size) * 100:.1f}% меньше")
+
+
+async def run_benchmark():
     """Тестирует размер и скорость различных форматов"""
 
     db_manager = DatabaseManager(config.DATABASE_URL)
@@ -71,7 +111,7 @@ async def test_endpoints():
             ultra_row = {}
             for key, value in row.items():
                 if isinstance(value, datetime):
-                    ultra_row[key] = int(value.timestamp())
+                    ultra_row[key] = int(serialization.epoch_seconds(value))
                 else:
                     ultra_row[key] = value
             ultra_data.append(ultra_row)
@@ -97,6 +137,8 @@ async def test_endpoints():
         print(f"      📉 Сжатие vs оригинал: {(1 - gzipped_size / full_size) * 100:.1f}%")
         print(f"      🚀 ФИНАЛЬНОЕ сжатие: {full_size / gzipped_size:.1f}x")
 
+        benchmark_json_encoders(data)
+
         # Оценка скорости загрузки
         print(f"\n  ⏱️  ПРИМЕРНОЕ ВРЕМЯ ЗАГРУЗКИ:")
         # Предполагаем скорость интернета 10 MB/s (типичный DSL)
@@ -115,9 +157,18 @@ async def test_endpoints():
     await db_manager.close()
 
 
+def test_endpoints():
+    """Запуск под pytest - синхронно, как тесты в tests/; без доступной базы из config - пропуск"""
+    import pytest
+    try:
+        asyncio.run(run_benchmark())
+    except (OSError, asyncio.TimeoutError) as e:
+        pytest.skip(f"База данных недоступна: {e}")
+
+
 if __name__ == '__main__':
     try:
-        asyncio.run(test_endpoints())
+        asyncio.run(run_benchmark())
     except KeyboardInterrupt:
         print("\n\n⚠️ Тест прерван пользователем")
         sys.exit(0)
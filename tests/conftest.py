@@ -0,0 +1,32 @@
+import asyncio
+import sys
+import warnings
+from pathlib import Path
+
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer
+
+# Модули приложения (data_manager, routes, middlewares) импортируются из корня репозитория
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+
+def make_app(handlers, middlewares=(), **state) -> web.Application:
+    """Приложение с маршрутами {(метод, путь): обработчик} и объектами app[...] (обычно фейками)"""
+    app = web.Application(middlewares=list(middlewares))
+    for (method, path), handler in handlers.items():
+        app.router.add_route(method, path, handler)
+    with warnings.catch_warnings():
+        # Приложение хранит объекты под строковыми ключами app['...']
+        warnings.simplefilter('ignore', web.NotAppKeyWarning)
+        for key, value in state.items():
+            app[key] = value
+    return app
+
+
+def fetch(app: web.Application, method: str, path: str, **kwargs):
+    """Выполняет запрос к приложению: (статус, заголовки, тело в байтах)"""
+    async def run():
+        async with TestClient(TestServer(app)) as client:
+            response = await client.request(method, path, **kwargs)
+            return response.status, response.headers, await response.read()
+    return asyncio.run(run())
@@ -0,0 +1,70 @@
+from datetime import datetime
+from decimal import Decimal
+
+import pytest
+
+from data_manager.query_engine import QueryEngine
+
+
+COLUMN_TYPES = {
+    'id': 'integer',
+    'timestamp': 'timestamp without time zone',
+    'server_name': 'character varying',
+    'region': 'character varying',
+    'cpu_usage': 'numeric',
+    'request_count': 'integer',
+}
+
+
+def test_aggregate_query_groups_and_measures():
+    config = {
+        'dimensions': [{'field': 'region'}],
+        'measures': [{'field': 'cpu_usage', 'aggregation': 'avg'}, {'name': 'rows', 'aggregation': 'count'}],
+    }
+    query, params, headers = QueryEngine.build_aggregate_query('server_metrics', config, COLUMN_TYPES, limit=10)
+
+    assert headers == ['region', 'cpu_usage', 'rows']
+    assert 'AVG("cpu_usage")::double precision AS "cpu_usage"' in query
+    assert 'COUNT(*) AS "rows"' in query
+    assert 'GROUP BY 1' in query
+    assert params == [10]
+
+
+def test_aggregate_query_date_dimension_is_epoch_bucket():
+    config = {'dimensions': [{'field': 'timestamp', 'granularity': 'hour'}], 'measures': [{'aggregation': 'count'}]}
+    query, _, _ = QueryEngine.build_aggregate_query('server_metrics', config, COLUMN_TYPES)
+    assert "EXTRACT(EPOCH FROM date_trunc('hour', \"timestamp\"))::bigint" in query
+
+
+@pytest.mark.parametrize('config', [
+    {'measures': []},
+    {'measures': [{'field': 'cpu_usage', 'aggregation': 'median'}]},
+    {'measures': [{'field': 'missing', 'aggregation': 'sum'}]},
+    {'measures': [{'field': 'region', 'aggregation': 'sum'}]},
+    {'dimensions': [{'field': 'timestamp', 'granularity': 'decade'}], 'measures': [{'aggregation': 'count'}]},
+])
+def test_aggregate_query_rejects_invalid_config(config):
+    with pytest.raises(ValueError):
+        QueryEngine.build_aggregate_query('server_metrics', config, COLUMN_TYPES)
+
+
+def test_build_where_coerces_values_to_column_types():
+    where, params = QueryEngine.build_where(
+        {'request_count': '5', 'cpu_usage': [1, '2.5', None], 'region': None},
+        COLUMN_TYPES,
+        date_range={'start': '2025-01-01T00:00:00', 'end': '2025-01-02T00:00:00'}
+    )
+    assert where == ('"request_count" = $1 AND "cpu_usage" = ANY($2) AND "region" IS NULL'
+                     ' AND "timestamp" >= $3 AND "timestamp" <= $4')
+    assert params == [5, [Decimal('1'), Decimal('2.5')], datetime(2025, 1, 1), datetime(2025, 1, 2)]
+
+
+@pytest.mark.parametrize('filters', [
+    {'request_count': 'abc'},
+    {'timestamp': 'yesterday'},
+    {'cpu_usage': ['x']},
+    {'unknown': 1},
+])
+def test_build_where_rejects_bad_values_with_value_error(filters):
+    with pytest.raises(ValueError):
+        QueryEngine.build_where(filters, COLUMN_TYPES)
@@ -0,0 +1,42 @@
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from data_manager import columnar
+from test_columnar import make_store
+
+
+def make_rows(count):
+    return [(None, f'web-{index % 5}', float(index)) for index in range(count)]
+
+
+def test_bitmap_filters_match_plain_mask():
+    rows = make_rows(103)
+    store = make_store(rows)
+    assert 'server_name' in store._bitmaps
+
+    filters = {'server_name': ['web-1', 'web-3', 'missing']}
+    bits, rest = store.filter_bits(filters)
+    assert rest == {}
+    expected = np.array([row[1] in filters['server_name'] for row in rows])
+    assert np.unpackbits(bits, count=store.size).view(bool).tolist() == expected.tolist()
+    assert store.mask(filters).tolist() == expected.tolist()
+
+
+def test_bitmaps_follow_appends_in_partial_bytes():
+    rows = make_rows(13)
+    store = make_store(rows)
+    store._append([(100 + index, None, 'web-9', 0.0) for index in range(6)])
+
+    counts = store.facet_counts('server_name')
+    assert counts['web-9'] == 6 and sum(counts.values()) == 19
+    assert store.facet_counts('server_name', filters={'server_name': 'web-9'}) == {'web-9': 6}
+
+
+def test_high_cardinality_column_drops_bitmap(monkeypatch):
+    monkeypatch.setattr(columnar, 'BITMAP_MAX_CARDINALITY', 4)
+    rows = make_rows(20)
+    store = make_store(rows)
+
+    assert 'server_name' not in store._bitmaps
+    assert store.facet_counts('server_name') == {f'web-{index}': 4 for index in range(5)}
@@ -0,0 +1,134 @@
+import asyncio
+
+from data_manager.cache import DataCache
+
+
+def test_lru_eviction_by_byte_budget():
+    cache = DataCache(max_bytes=10)
+    cache.set('a', b'xxxx')
+    cache.set('b', b'xxxx')
+    assert cache.get('a') is not None  # 'a' становится недавно использованной
+    cache.set('c', b'xxxx')
+
+    assert cache.peek('b') is None
+    assert cache.peek('a') is not None and cache.peek('c') is not None
+    assert cache.bytes_held == 8 and cache.stats()['evictions'] == 1
+
+
+def test_value_larger_than_budget_is_not_stored():
+    cache = DataCache(max_bytes=10)
+    cache.set('small', b'xx')
+    entry = cache.set('big', b'x' * 11)
+    assert entry.value == b'x' * 11
+    assert cache.peek('big') is None and cache.peek('small') is not None
+
+
+def test_entry_of_other_version_is_dropped():
+    cache = DataCache(max_bytes=100)
+    cache.set('k', b'v', version=(1,))
+    assert cache.get('k', version=(2,)) is None
+    assert cache.peek('k') is None and cache.bytes_held == 0
+
+
+def test_concurrent_misses_share_one_computation():
+    cache = DataCache(max_bytes=100)
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return b'value'
+
+    async def run():
+        return await asyncio.gather(*[cache.get_or_compute('k', compute) for _ in range(5)])
+
+    results = asyncio.run(run())
+    assert len(calls) == 1
+    assert sorted(status for _, status in results) == ['COALESCED'] * 4 + ['MISS']
+    assert all(entry.value == b'value' for entry, _ in results)
+    assert cache.stats()['in_flight'] == 0
+
+
+def test_failed_computation_is_not_cached_and_can_retry():
+    cache = DataCache(max_bytes=100)
+    attempts = []
+
+    async def compute():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise RuntimeError('db down')
+        return b'ok'
+
+    async def run():
+        try:
+            await cache.get_or_compute('k', compute)
+        except RuntimeError:
+            pass
+        return await cache.get_or_compute('k', compute)
+
+    entry, status = asyncio.run(run())
+    assert status == 'MISS' and entry.value == b'ok' and len(attempts) == 2
+
+
+
+def age(cache, key, seconds):
+    """Состаривает запись на seconds секунд"""
+    cache.peek(key).created_at -= seconds
+
+
+def test_stale_entry_is_served_while_refreshing():
+    cache = DataCache(max_bytes=100, ttl=10, stale_ttl=5)
+    values = iter([b'old', b'new'])
+
+    async def compute():
+        return next(values)
+
+    async def run():
+        first = await cache.get_or_compute('k', compute)
+        age(cache, 'k', 12)
+        stale = await cache.get_or_compute('k', compute)
+        assert cache.is_refreshing('k')
+        await asyncio.sleep(0.01)
+        fresh = await cache.get_or_compute('k', compute)
+        return first, stale, fresh
+
+    first, stale, fresh = asyncio.run(run())
+    assert (first[1], first[0].value) == ('MISS', b'old')
+    assert (stale[1], stale[0].value) == ('STALE', b'old')
+    assert (fresh[1], fresh[0].value) == ('HIT', b'new')
+
+
+def test_entry_past_stale_window_is_recomputed():
+    cache = DataCache(max_bytes=100, ttl=10, stale_ttl=5)
+    cache.set('k', b'old')
+    age(cache, 'k', 16)
+
+    async def compute():
+        return b'new'
+
+    entry, status = asyncio.run(cache.get_or_compute('k', compute))
+    assert (status, entry.value) == ('MISS', b'new')
+
+
+def test_is_due_and_refresh_use_saved_recipe():
+    cache = DataCache(max_bytes=100, ttl=10)
+    version = [1]
+
+    async def compute():
+        return b'v%d' % version[0]
+
+    async def run():
+        await cache.get_or_compute('k', compute, version_fn=lambda: tuple(version))
+        entry = cache.peek('k')
+        assert not cache.is_due(entry, margin=2)
+        entry.created_at -= 8.5
+        assert cache.is_due(entry, margin=2)
+        entry.created_at += 8.5
+        version[0] = 2
+        assert cache.is_due(entry, margin=2)
+        await cache.refresh('k')
+        return cache.peek('k')
+
+    entry = asyncio.run(run())
+    assert entry.value == b'v2' and entry.version == (2,)
+    assert cache.refresh('missing') is None
@@ -0,0 +1,50 @@
+import pytest
+
+from data_manager.catalog import TableSchema, quote_ident
+
+
+def catalog_row(table, column, data_type, nullable=True, length=None):
+    return {
+        'table_name': table, 'column_name': column, 'data_type': data_type, 'nullable': nullable,
+        'character_maximum_length': length, 'numeric_precision': None, 'numeric_scale': None,
+        'row_estimate': 1000,
+    }
+
+
+@pytest.fixture
+def schema():
+    rows = [
+        catalog_row('server_metrics', 'id', 'bigint', nullable=False),
+        catalog_row('server_metrics', 'timestamp', 'timestamp without time zone'),
+        catalog_row('server_metrics', 'server_name', 'character varying', length=100),
+        catalog_row('other', 'id', 'integer'),
+    ]
+    return TableSchema.from_rows(rows)['server_metrics']
+
+
+def test_quote_ident_escapes_double_quotes():
+    assert quote_ident('cpu') == '"cpu"'
+    assert quote_ident('a"b') == '"a""b"'
+
+
+def test_schema_from_catalog_rows(schema):
+    assert schema.data_columns == ['timestamp', 'server_name']
+    assert schema.text_columns == ['server_name']
+    assert schema.columns[2].max_length == 100
+    assert schema.describe()['nullable'] == ['timestamp', 'server_name']
+
+    schema.check_columns(['timestamp'])
+    with pytest.raises(ValueError):
+        schema.check_columns(['timestamp', 'id; DROP TABLE x'])
+
+
+def test_statements_are_stable_and_cached(schema):
+    select = schema.statement('select')
+    assert select == 'SELECT "timestamp", "server_name" FROM "server_metrics" LIMIT $1'
+    assert schema.statement('select') is select
+    assert schema.statement('since').endswith('WHERE id > $1 ORDER BY id LIMIT $2')
+    assert schema.select_where('"server_name" = $1', 2, with_id=True, order_by='id') == (
+        'SELECT id, "timestamp", "server_name" FROM "server_metrics" WHERE "server_name" = $1 ORDER BY id LIMIT $2'
+    )
+    with pytest.raises(ValueError):
+        schema.statement('delete')
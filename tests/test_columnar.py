@@ -0,0 +1,71 @@
+from datetime import datetime
+
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from data_manager.columnar import ColumnarStore
+from data_manager.query_engine import QueryEngine
+
+
+COLUMN_TYPES = {
+    'id': 'bigint',
+    'timestamp': 'timestamp without time zone',
+    'server_name': 'character varying',
+    'cpu_usage': 'numeric',
+}
+
+
+class FakeDatabase:
+    def on_table_change(self, callback):
+        pass
+
+
+def make_store(rows):
+    store = ColumnarStore(FakeDatabase())
+    store._init_schema(COLUMN_TYPES)
+    store._append([(index, *row) for index, row in enumerate(rows, start=1)])
+    return store
+
+
+ROWS = [
+    (datetime(2024, 1, 1, 10, 0, 0, 250000), 'web-1', 10.0),
+    (datetime(2024, 1, 1, 10, 0, 0, 750000), 'web-2', 30.0),
+    (datetime(2024, 1, 1, 11, 30, 0), 'web-1', None),
+    (None, 'web-3', 5.0),
+]
+
+
+def test_select_keeps_microseconds():
+    rows = make_store(ROWS).select()
+
+    assert [row['timestamp'] for row in rows] == [row[0] for row in ROWS]
+    assert rows[2]['cpu_usage'] is None
+    assert rows[0] == {'timestamp': ROWS[0][0], 'server_name': 'web-1', 'cpu_usage': 10.0}
+
+
+def test_date_range_compares_below_one_second():
+    store = make_store(ROWS)
+    selected = store.mask(date_range={'start': '2024-01-01T10:00:00.500000'},
+                          parse_datetime=QueryEngine.parse_datetime)
+    assert selected.tolist() == [False, True, True, False]
+
+    rows = store.select(filters={'timestamp': ROWS[1][0].isoformat()}, parse_datetime=QueryEngine.parse_datetime)
+    assert [row['server_name'] for row in rows] == ['web-2']
+
+
+def test_aggregate_matches_sql_epoch_seconds():
+    store = make_store(ROWS[:3])
+    config = {
+        'dimensions': [{'field': 'timestamp', 'granularity': 'hour'}],
+        'measures': [{'field': 'cpu_usage', 'aggregation': 'avg'}, {'field': 'timestamp', 'aggregation': 'max'}],
+    }
+    compiled = QueryEngine._compile_panel(config, COLUMN_TYPES)
+    rows = store.aggregate(config, compiled)
+
+    hour = int(datetime(2024, 1, 1, 10).timestamp() - datetime(1970, 1, 1).timestamp())
+    keys = [key for key, _ in compiled['measures']]
+    assert [row['timestamp'] for row in rows] == [hour, hour + 3600]
+    assert rows[0][keys[0]] == 20.0 and rows[1][keys[0]] is None
+    # 10:00:00.75 округляется до секунды, как ::bigint
+    assert rows[0][keys[1]] == hour + 1
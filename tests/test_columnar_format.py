@@ -0,0 +1,57 @@
+import json
+import math
+import struct
+from datetime import datetime, timezone
+from decimal import Decimal
+
+from data_manager.api_formatter import APIFormatter
+from data_manager.models import ColumnarData
+
+
+def decode(body: bytes):
+    """Разбирает ответ BSC1: (заголовок, {колонка: (тип, значения, словарь)})"""
+    assert body[:4] == ColumnarData.MAGIC
+    header_length = struct.unpack_from('<I', body, 4)[0]
+    header = json.loads(body[8:8 + header_length])
+    start = 8 + header_length
+    start += -start % 8
+    formats = {'i32': 'i', 'f64': 'd', 'date': 'd', 'bool': 'B', 'dict8': 'B', 'dict16': 'H', 'dict32': 'i'}
+    columns = {}
+    for column in header['cols']:
+        assert column['o'] % 8 == 0
+        typecode = formats[column['t']]
+        count = column['l'] // struct.calcsize(typecode)
+        values = list(struct.unpack_from(f'<{count}{typecode}', body, start + column['o']))
+        columns[column['n']] = (column['t'], values, column.get('v'))
+    return header, columns
+
+
+def test_columnar_roundtrip_types():
+    rows = [
+        {'id': 1, 'ts': datetime(2025, 1, 1, tzinfo=timezone.utc), 'cpu': Decimal('1.5'), 'ok': True, 'name': 'a'},
+        {'id': 2, 'ts': None, 'cpu': None, 'ok': False, 'name': 'b'},
+        {'id': 3, 'ts': datetime(2025, 1, 2, tzinfo=timezone.utc), 'cpu': Decimal('2.25'), 'ok': True, 'name': 'a'},
+    ]
+    header, columns = decode(APIFormatter.to_columnar(rows, {'watermark': 3}))
+
+    assert header['c'] == 3 and header['w'] == 3
+    assert columns['id'] == ('i32', [1, 2, 3], None)
+    ts_type, ts_values, _ = columns['ts']
+    assert ts_type == 'date' and ts_values[0] == 1735689600.0 and math.isnan(ts_values[1])
+    cpu_type, cpu_values, _ = columns['cpu']
+    assert cpu_type == 'f64' and cpu_values[0] == 1.5 and math.isnan(cpu_values[1]) and cpu_values[2] == 2.25
+    assert columns['ok'] == ('bool', [1, 0, 1], None)
+    assert columns['name'] == ('dict8', [0, 1, 0], ['a', 'b'])
+
+
+def test_columnar_wide_integers_and_large_dictionaries():
+    rows = [{'big': 2 ** 40 + i, 'name': f'v{i}'} for i in range(300)]
+    _, columns = decode(APIFormatter.to_columnar(rows))
+    assert columns['big'][0] == 'f64' and columns['big'][1][5] == float(2 ** 40 + 5)
+    name_type, codes, dictionary = columns['name']
+    assert name_type == 'dict16' and dictionary[codes[299]] == 'v299'
+
+
+def test_columnar_empty():
+    header, columns = decode(APIFormatter.to_columnar([]))
+    assert header['c'] == 0 and columns == {}
@@ -0,0 +1,55 @@
+from datetime import datetime
+
+from data_manager.api_formatter import APIFormatter
+from data_manager.models import CompactData
+
+
+def make_rows(count):
+    return [
+        {'timestamp': datetime(2025, 1, 1, i % 24), 'server_name': f'srv-{i}', 'status': ('ok', 'warn')[i % 2], 'v': i}
+        for i in range(count)
+    ]
+
+
+def test_low_cardinality_strings_are_dictionary_encoded():
+    rows = make_rows(10)
+    compact = APIFormatter.to_compact_format(rows, {'total_records': 10})
+
+    # server_name уникален в каждой строке, timestamp (строка ISO) - 10 значений на 10 строк
+    assert compact.dictionaries == {'status': ['ok', 'warn']}
+    assert [row[2] for row in compact.data[:3]] == [0, 1, 0]
+    assert compact.data[0][0] == '2025-01-01T00:00:00'
+
+
+def test_dictionary_encoding_round_trip():
+    rows = make_rows(50)
+    restored = APIFormatter.from_compact_format(APIFormatter.to_compact_format(rows))
+    assert [row['status'] for row in restored] == [row['status'] for row in rows]
+    assert restored[3]['timestamp'] == '2025-01-01T03:00:00'
+
+
+def test_detect_dictionary_columns_limits():
+    assert CompactData.detect_dictionary_columns([]) == []
+    # Уникальных значений больше половины строк - словарь невыгоден
+    assert CompactData.detect_dictionary_columns([['a'], ['b'], ['a']]) == []
+    assert CompactData.detect_dictionary_columns([['a', 1], ['a', 2], ['b', 3], ['a', 4]]) == [0]
+    many = [[f'v{i % 300}'] for i in range(10000)]
+    assert CompactData.detect_dictionary_columns(many) == []
+
+
+def test_to_json_is_compact_and_keeps_metadata():
+    compact = CompactData(headers=['a'], data=[[1]], metadata={'total_records': 1, 'watermark': 7, 'next_cursor': 'x'})
+    assert compact.to_json() == '{"h":["a"],"d":[[1]],"c":1,"n":"x","w":7}'
+
+
+def test_from_json_decodes_to_json_output():
+    rows = make_rows(10)
+    payload = APIFormatter.to_json(rows, {'total_records': 10, 'next_cursor': 'abc', 'watermark': 9})
+
+    compact = CompactData.from_json(payload)
+    assert compact.metadata == {'total_records': 10, 'next_cursor': 'abc', 'watermark': 9}
+    assert compact.dictionaries == {'status': ['ok', 'warn']}
+    assert APIFormatter.from_json(payload)[1] == {
+        'timestamp': '2025-01-01T01:00:00', 'server_name': 'srv-1', 'status': 'warn', 'v': 1
+    }
+    assert CompactData.from_json(APIFormatter.to_json([])).metadata == {}
@@ -0,0 +1,55 @@
+import gzip
+
+import pytest
+from aiohttp import web
+
+from conftest import fetch, make_app
+from data_manager.compression import PrecompressedBody, negotiate_encoding, parse_accept_encoding
+from middlewares import compress_middleware
+
+
+def test_parse_accept_encoding():
+    assert parse_accept_encoding('gzip;q=0.5, br , zstd;q=abc,,') == {'gzip': 0.5, 'br': 1.0, 'zstd': 0.0}
+
+
+@pytest.mark.parametrize('header, available, expected', [
+    ('gzip, br', {'gzip', 'br'}, 'br'),
+    ('gzip, br', {'gzip'}, 'gzip'),
+    ('gzip;q=1, br;q=0.5', {'gzip', 'br'}, 'gzip'),
+    ('br;q=0, gzip;q=0', {'gzip', 'br'}, None),
+    ('*', {'gzip', 'zstd'}, 'zstd'),
+    ('*, zstd;q=0', {'gzip', 'zstd'}, 'gzip'),
+    ('identity', {'gzip'}, None),
+    ('', {'gzip'}, None),
+])
+def test_negotiate_encoding(header, available, expected):
+    assert negotiate_encoding(header, available) == expected
+
+
+def test_precompressed_body_selects_variant():
+    body = PrecompressedBody.build('{"a":1}' * 100)
+    assert body.select('') == (None, body.content)
+    encoding, content = body.select('gzip')
+    assert encoding == 'gzip' and gzip.decompress(content) == body.content
+    assert body.size_bytes == len(body.content) + sum(map(len, body.variants.values()))
+
+
+@pytest.mark.parametrize('header, expected', [
+    ('gzip, deflate', 'gzip'),
+    ('gzip;q=0.5, deflate', 'deflate'),
+    ('gzip;q=0, deflate', 'deflate'),
+    ('gzip;q=0, deflate;q=0', None),
+    ('x-gzip-like', None),
+    ('identity', None),
+])
+def test_compress_middleware_respects_q_values(header, expected):
+    async def handler(request):
+        return web.Response(text='{"a":1}' * 100, content_type='application/json')
+
+    app = make_app({('GET', '/'): handler}, middlewares=[compress_middleware])
+    status, headers, body = fetch(app, 'GET', '/', headers={'Accept-Encoding': header}, auto_decompress=False)
+
+    assert status == 200
+    assert headers.get('Content-Encoding') == expected
+    if expected is None:
+        assert body == b'{"a":1}' * 100
@@ -0,0 +1,123 @@
+import asyncio
+import math
+
+import pytest
+
+from data_manager.downsampling import lttb
+from data_manager.query_engine import QueryEngine
+
+
+COLUMN_TYPES = {
+    'timestamp': 'timestamp without time zone',
+    'server_name': 'character varying',
+    'cpu_usage': 'numeric',
+}
+
+
+def test_lttb_keeps_endpoints_and_peaks():
+    points = [(float(x), math.sin(x / 10)) for x in range(1000)]
+    points[500] = (500.0, 50.0)
+    sampled = lttb(points, 50)
+
+    assert len(sampled) == 50
+    assert sampled[0] == points[0] and sampled[-1] == points[-1]
+    assert (500.0, 50.0) in sampled
+    assert [x for x, _ in sampled] == sorted(x for x, _ in sampled)
+
+
+@pytest.mark.parametrize('threshold', [2, 10, 11])
+def test_lttb_returns_input_when_nothing_to_drop(threshold):
+    points = [(float(x), float(x)) for x in range(10)]
+    assert lttb(points, threshold) == points
+
+
+def test_downsample_plan_and_bucket_count():
+    query, params, plan = QueryEngine.build_downsample_query(
+        'server_metrics', {'measure': 'cpu_usage', 'points': 100}, COLUMN_TYPES
+    )
+    assert plan['method'] == 'lttb' and plan['buckets'] == 100 * QueryEngine.LTTB_PRESELECT_RATIO // 2
+    assert plan['series_query'] is None
+    assert params == [plan['buckets']]
+    assert 'rn_min = 1 OR rn_max = 1' in query
+
+    _, params, plan = QueryEngine.build_downsample_query(
+        'server_metrics', {'measure': 'cpu_usage', 'points': 10 ** 9, 'method': 'minmax'}, COLUMN_TYPES
+    )
+    assert plan['points'] == QueryEngine.MAX_DOWNSAMPLE_POINTS == plan['buckets']
+    assert plan['headers'] == ['timestamp', 'cpu_usage_min', 'cpu_usage_max', 'cpu_usage_avg', 'count']
+
+
+def test_series_count_query_shares_filters_and_is_bounded():
+    _, params, plan = QueryEngine.build_downsample_query(
+        'server_metrics', {'measure': 'cpu_usage', 'seriesField': 'server_name'}, COLUMN_TYPES,
+        filters={'server_name': ['a', 'b']}
+    )
+    series_query, series_params = plan['series_query']
+    assert 'SELECT DISTINCT "server_name"' in series_query and 'LIMIT $2' in series_query
+    assert series_params == [['a', 'b'], QueryEngine.MAX_DOWNSAMPLE_SERIES + 1]
+    assert params[0] == ['a', 'b']
+
+
+@pytest.mark.parametrize('spec', [
+    {'measure': 'server_name'},
+    {'measure': 'cpu_usage', 'timeField': 'server_name'},
+    {'measure': 'cpu_usage', 'method': 'avg'},
+    {'measure': 'cpu_usage', 'points': 'many'},
+    {'measure': 'cpu_usage', 'seriesField': 'missing'},
+])
+def test_downsample_rejects_invalid_spec(spec):
+    with pytest.raises(ValueError):
+        QueryEngine.build_downsample_query('server_metrics', spec, COLUMN_TYPES)
+
+
+class FakeConnection:
+    def __init__(self, series_count):
+        self.series_count = series_count
+        self.fetched = []
+
+    async def fetchval(self, query, *params):
+        return min(self.series_count, params[-1])
+
+    async def fetch(self, query, *params):
+        self.fetched.append(query)
+        return []
+
+
+class FakePool:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def acquire(self):
+        pool = self
+
+        class Acquire:
+            async def __aenter__(self):
+                return pool.conn
+
+            async def __aexit__(self, *exc):
+                return False
+        return Acquire()
+
+
+class FakeDatabase:
+    def __init__(self, conn):
+        self.pool = FakePool(conn)
+
+    async def get_table_schema(self, table):
+        class Schema:
+            column_types = COLUMN_TYPES
+        return Schema()
+
+
+def test_too_many_series_rejected_before_points_are_fetched():
+    conn = FakeConnection(series_count=10 ** 6)
+    engine = QueryEngine(FakeDatabase(conn))
+    spec = {'measure': 'cpu_usage', 'seriesField': 'server_name'}
+
+    with pytest.raises(ValueError, match='Слишком много серий'):
+        asyncio.run(engine.downsample('server_metrics', spec))
+    assert conn.fetched == []
+
+    conn.series_count = 3
+    assert asyncio.run(engine.downsample('server_metrics', spec))['c'] == 0
+    assert len(conn.fetched) == 1
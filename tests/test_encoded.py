@@ -0,0 +1,128 @@
+import asyncio
+import json
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+
+from conftest import fetch, make_app
+from data_manager import serialization
+from data_manager.api_formatter import APIFormatter
+from data_manager.catalog import ColumnInfo, TableSchema
+from data_manager.database import DatabaseManager
+from data_manager.models import EncodedRows
+from routes import api_data_compact
+
+
+SCHEMA = TableSchema('metrics', [
+    ColumnInfo('id', 'bigint', False),
+    ColumnInfo('timestamp', 'timestamp without time zone', True),
+    ColumnInfo('zone', 'character varying', True),
+    ColumnInfo('host', 'text', True),
+])
+
+
+def test_compact_chunk_appends_new_dictionary_values():
+    query = SCHEMA.compact_chunk(True, ['zone'])
+
+    assert 'WHERE id > $1 ORDER BY id LIMIT $2' in query
+    assert 'EXCEPT SELECT unnest($3::text[])' in query
+    assert 'unnest($3::text[] || (SELECT new_values FROM added_0))' in query
+    assert 'AS added_0' in query and '$4' not in query
+    assert 'extract(epoch FROM chunk."timestamp")::bigint::text' in query
+    assert SCHEMA.compact_chunk(True, ['zone']) is query
+
+
+class FakeTransaction:
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+class FakeConnection:
+    """Профиль начала выборки и порции строк; новые значения словаря - в added_0"""
+
+    def __init__(self, chunks):
+        self.chunks = list(chunks)
+        self.calls = []
+
+    def transaction(self, **kwargs):
+        return FakeTransaction()
+
+    async def fetchval(self, query, *params):
+        return 42
+
+    async def fetchrow(self, query, *params):
+        # Словари дописываются на месте - запоминаем копию параметров
+        self.calls.append(tuple(list(param) if isinstance(param, list) else param for param in params))
+        if 'selected' in query:
+            return {'total': 2, 'zone': ['eu'], 'host': ['a', 'b']}
+        return self.chunks.pop(0)
+
+
+class FakePool:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def acquire(self):
+        conn = self.conn
+
+        class Acquire:
+            async def __aenter__(self):
+                return conn
+
+            async def __aexit__(self, *exc):
+                return False
+        return Acquire()
+
+
+def test_snapshot_profiles_a_prefix_and_grows_dictionaries():
+    conn = FakeConnection([
+        {'rows': '[0,0]', 'last_id': 2, 'row_count': 2, 'added_0': []},
+        {'rows': '[0,1]', 'last_id': 5, 'row_count': 1, 'added_0': ['us']},
+    ])
+    manager = DatabaseManager('postgresql://localhost/test')
+    manager.pool = FakePool(conn)
+    manager.catalog['metrics'] = SCHEMA
+    manager.DICTIONARY_PROFILE_ROWS = 100
+
+    async def run():
+        async with manager.compact_snapshot('metrics', limit=10 ** 6, chunk_size=2) as rows:
+            return await APIFormatter.encoded_to_json(rows)
+    result = json.loads(asyncio.run(run()))
+
+    # Профиль - только по первым DICTIONARY_PROFILE_ROWS строкам; host (2 значения на 2 строки) - не словарь
+    assert conn.calls[0] == (100, 257)
+    # Короткая порция - последняя: запросов строк два
+    assert conn.calls[1:] == [(0, 2, ['eu']), (2, 2, ['eu'])]
+    assert result == {'h': ['timestamp', 'zone', 'host'], 'd': [[0, 0], [0, 1]],
+                      'x': {'zone': ['eu', 'us']}, 'c': 3, 'w': 42}
+
+
+def test_stream_sends_rows_before_dictionaries_and_total():
+    async def chunks():
+        yield '["2025-01-01T00:00:00",0]'
+        encoded.dictionaries['zone'].append('us')
+        encoded.total = 2
+        yield '["2025-01-02T00:00:00",1]'
+
+    encoded = EncodedRows(headers=['timestamp', 'zone'], dictionaries={'zone': ['eu']},
+                          total=0, watermark=7, chunks=chunks())
+
+    class FakeDatabase:
+        @asynccontextmanager
+        async def compact_snapshot(self, table_name, limit=None, epoch_dates=False):
+            yield encoded
+
+    app = make_app({('GET', '/api/data/compact'): api_data_compact}, db_manager=FakeDatabase(), data_cache=None)
+    status, headers, body = fetch(app, 'GET', '/api/data/compact?stream=true')
+
+    assert status == 200 and headers['X-Watermark'] == '7'
+    assert json.loads(body) == {'h': ['timestamp', 'zone'], 'd': [['2025-01-01T00:00:00', 0],
+                                                                   ['2025-01-02T00:00:00', 1]],
+                                'x': {'zone': ['eu', 'us']}, 'c': 2, 'w': 7}
+
+
+def test_epoch_seconds_treats_naive_timestamps_as_utc():
+    assert serialization.epoch_seconds(datetime(1970, 1, 2)) == 86400
+    assert serialization.epoch_seconds(datetime(1970, 1, 2, tzinfo=timezone.utc)) == 86400
@@ -0,0 +1,52 @@
+from aiohttp import web
+
+from conftest import fetch, make_app
+from middlewares import etag_middleware
+
+
+class FakeDatabase:
+    def __init__(self):
+        self.version = '7'
+
+    def get_table_version(self, table):
+        return self.version
+
+
+def app_with(db, calls):
+    async def handler(request):
+        calls.append(request.path)
+        return web.json_response({'ok': True})
+    return make_app({('GET', '/api/data/compact'): handler, ('GET', '/api/other'): handler},
+                    middlewares=[etag_middleware], db_manager=db)
+
+
+def test_etag_then_not_modified_without_calling_handler():
+    db, calls = FakeDatabase(), []
+    status, headers, _ = fetch(app_with(db, calls), 'GET', '/api/data/compact?limit=5')
+    etag = headers['ETag']
+    assert status == 200 and etag.startswith('"7-') and headers['Cache-Control'] == 'no-cache'
+
+    status, headers, body = fetch(app_with(db, calls), 'GET', '/api/data/compact?limit=5',
+                                  headers={'If-None-Match': f'W/{etag}, "other"'})
+    assert status == 304 and body == b'' and headers['ETag'] == etag
+    assert calls == ['/api/data/compact']
+
+
+def test_etag_changes_with_table_version_and_representation():
+    db, calls = FakeDatabase(), []
+    first = fetch(app_with(db, calls), 'GET', '/api/data/compact?limit=5')[1]['ETag']
+    other_query = fetch(app_with(db, calls), 'GET', '/api/data/compact?limit=6')[1]['ETag']
+    other_accept = fetch(app_with(db, calls), 'GET', '/api/data/compact?limit=5',
+                         headers={'Accept': 'application/vnd.blinksense.columnar'})[1]['ETag']
+    db.version = '8'
+    status, headers, _ = fetch(app_with(db, calls), 'GET', '/api/data/compact?limit=5',
+                               headers={'If-None-Match': first})
+
+    assert len({first, other_query, other_accept}) == 3
+    assert status == 200 and headers['ETag'] != first
+
+
+def test_other_paths_are_not_conditional():
+    db, calls = FakeDatabase(), []
+    status, headers, _ = fetch(app_with(db, calls), 'GET', '/api/other', headers={'If-None-Match': '*'})
+    assert status == 200 and 'ETag' not in headers
@@ -0,0 +1,30 @@
+from data_manager.query_engine import QueryEngine
+
+
+COLUMN_TYPES = {
+    'timestamp': 'timestamp without time zone',
+    'server_name': 'character varying',
+    'environment': 'character varying',
+}
+
+
+def test_top_facets_orders_by_count_and_filters_prefix():
+    counts = {'web-2': 5, 'Web-1': 5, 'db-1': 9, None: 100}
+
+    top = QueryEngine._top_facets(counts, limit=2)
+    assert top == {'values': [['db-1', 9], ['Web-1', 5]], 'distinct': 3, 'truncated': True}
+
+    assert QueryEngine._top_facets(counts, prefix='WEB') == {
+        'values': [['Web-1', 5], ['web-2', 5]], 'distinct': 2, 'truncated': False
+    }
+
+
+def test_facet_query_applies_filters_prefix_and_limit():
+    query, params = QueryEngine.build_facet_query(
+        'server_metrics', 'server_name', COLUMN_TYPES, filters={'environment': 'prod'}, prefix='web_1%', limit=10
+    )
+
+    assert params == ['prod', 'web\\_1\\%%', 10]
+    assert '"server_name"::text ILIKE $2' in query
+    assert '"server_name" IS NOT NULL' in query
+    assert query.endswith('GROUP BY 1 ORDER BY 2 DESC, 1 LIMIT $3')
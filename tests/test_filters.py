@@ -0,0 +1,91 @@
+import json
+from datetime import datetime
+from decimal import Decimal
+
+import pytest
+
+from conftest import fetch, make_app
+from data_manager.query_engine import QueryEngine
+from routes import api_data_filtered
+
+
+COLUMN_TYPES = {
+    'timestamp': 'timestamp without time zone',
+    'server_name': 'character varying',
+    'cpu_usage': 'numeric',
+    'port': 'integer',
+    'healthy': 'boolean',
+}
+
+
+def test_filter_tree_compiles_to_numbered_typed_params():
+    spec = {'and': [
+        {'field': 'timestamp', 'op': 'range', 'gte': '2025-01-01', 'lt': '2025-01-02'},
+        {'field': 'server_name', 'op': 'in', 'values': ['a', None]},
+        {'or': [{'field': 'cpu_usage', 'op': 'range', 'gt': '90.5'}, {'field': 'port', 'op': 'eq', 'value': '8080'}]},
+    ]}
+    sql, params = QueryEngine.build_filter(spec, COLUMN_TYPES, start_index=3)
+
+    assert sql == ('(("timestamp" >= $3 AND "timestamp" < $4) AND ("server_name" = ANY($5) OR "server_name" IS NULL)'
+                   ' AND ("cpu_usage" > $6 OR "port" = $7))')
+    assert params == [datetime(2025, 1, 1), datetime(2025, 1, 2), ['a'], Decimal('90.5'), 8080]
+
+
+def test_prefix_uses_escaped_like_and_byte_range():
+    sql, params = QueryEngine.build_filter({'field': 'server_name', 'op': 'prefix', 'value': 'web_'}, COLUMN_TYPES)
+    assert sql == '("server_name" LIKE $1 AND "server_name" ~>=~ $2 AND "server_name" ~<~ $3)'
+    assert params == ['web\\_%', 'web_', 'web`']
+
+
+@pytest.mark.parametrize('spec', [
+    [],
+    {'field': 'missing', 'op': 'eq', 'value': 1},
+    {'field': 'port', 'op': 'like', 'value': 1},
+    {'field': 'port', 'op': 'range', 'gt': 1, 'gte': 2},
+    {'field': 'port', 'op': 'prefix', 'value': '80'},
+    {'and': [{'field': 'port', 'op': 'eq', 'value': 1}], 'or': []},
+    {'and': [{'or': [{'and': [{'or': [{'and': [{'or': [{'and': [{'or': [{'and': [{'port': 1}]}]}]}]}]}]}]}]}]},
+])
+def test_invalid_filters_raise_value_error(spec):
+    with pytest.raises(ValueError):
+        QueryEngine.build_filter(spec, COLUMN_TYPES)
+
+
+@pytest.mark.parametrize('value, data_type, expected', [
+    ('42', 'integer', 42),
+    (42.0, 'bigint', 42),
+    (1.5, 'numeric', Decimal('1.5')),
+    ('false', 'boolean', False),
+    ('2025-01-01T10:00:00+02:00', 'timestamp without time zone', datetime(2025, 1, 1, 8)),
+    (7, 'character varying', '7'),
+])
+def test_coerce_value(value, data_type, expected):
+    assert QueryEngine.coerce_value(value, data_type, 'field') == expected
+
+
+@pytest.mark.parametrize('value, data_type', [
+    (True, 'integer'), (1.5, 'integer'), ('abc', 'numeric'), ('yes', 'boolean'), ([1], 'character varying'),
+])
+def test_coerce_value_rejects(value, data_type):
+    with pytest.raises(ValueError):
+        QueryEngine.coerce_value(value, data_type, 'field')
+
+
+def test_simple_filters_only_for_equalities():
+    assert QueryEngine.simple_filters(None) == {}
+    assert QueryEngine.simple_filters({'server_name': 'a'}) == {'server_name': 'a'}
+    assert QueryEngine.simple_filters({'and': [
+        {'field': 'server_name', 'op': 'in', 'values': ['a', 'b']}, {'field': 'port', 'value': 80},
+    ]}) == {'server_name': ['a', 'b'], 'port': 80}
+    assert QueryEngine.simple_filters({'or': [{'field': 'port', 'value': 80}]}) is None
+    assert QueryEngine.simple_filters({'field': 'port', 'op': 'range', 'gt': 80}) is None
+    assert QueryEngine.simple_filters({'field': 'port', 'value': None}) is None
+
+
+def test_filtered_endpoint_rejects_non_object_body():
+    app = make_app({('POST', '/api/data/filtered'): api_data_filtered}, db_manager=None, query_engine=None)
+    status, _, body = fetch(app, 'POST', '/api/data/filtered', data='[1, 2]',
+                            headers={'Content-Type': 'application/json'})
+
+    assert status == 400
+    assert 'JSON объектом' in json.loads(body)['error']
@@ -0,0 +1,97 @@
+import asyncio
+from datetime import datetime
+from decimal import Decimal
+
+import pytest
+
+from data_manager.catalog import ColumnInfo, TableSchema
+from data_manager.ingest import RowIngester
+
+
+SCHEMA = TableSchema('events', [
+    ColumnInfo('id', 'bigint', False),
+    ColumnInfo('timestamp', 'timestamp without time zone', False),
+    ColumnInfo('message', 'text', True),
+    ColumnInfo('code', 'smallint', True),
+    ColumnInfo('amount', 'numeric', True, numeric_precision=5, numeric_scale=2),
+])
+
+
+class FakeStream:
+    def __init__(self, body: bytes):
+        self.body = body
+
+    async def iter_chunked(self, size):
+        for start in range(0, len(self.body), size):
+            yield self.body[start:start + size]
+
+
+def ingest(body: bytes, data_format: str, chunk_bytes: int = 7):
+    ingester = RowIngester(SCHEMA, data_format)
+    ingester.READ_CHUNK_BYTES = chunk_bytes
+
+    async def run():
+        return [record async for record in ingester.records(FakeStream(body))]
+    return asyncio.run(run()), ingester.result
+
+
+def test_csv_quoted_fields_span_lines_and_chunks():
+    body = (
+        'timestamp,message,code,amount\r\n'
+        '2024-01-01T00:00:00,"first line\nsecond, line",1,\r\n'
+        '2024-01-01T01:00:00,"say ""hi""",,1.5\n'
+        '\n'
+        '2024-01-01T02:00:00,,70000,1\n'
+        '2024-01-01T03:00:00,"never closed,1,1\n'
+    ).encode('utf-8')
+    records, result = ingest(body, 'csv')
+
+    assert records == [
+        (datetime(2024, 1, 1, 0), 'first line\nsecond, line', 1, None),
+        (datetime(2024, 1, 1, 1), 'say "hi"', None, Decimal('1.5')),
+    ]
+    assert result.accepted == 2 and result.rejected == 2
+    assert [error['line'] for error in result.errors] == [6, 7]
+
+
+def test_csv_header_must_match_schema():
+    with pytest.raises(ValueError, match='Неизвестные колонки'):
+        ingest(b'timestamp,bogus\n2024-01-01,1\n', 'csv')
+    with pytest.raises(ValueError, match='обязательных колонок'):
+        ingest(b'message\nhello\n', 'csv')
+
+
+def test_ndjson_rejects_bad_rows_and_keeps_going():
+    body = b'\n'.join([
+        b'{"timestamp": "2024-01-01T00:00:00", "amount": 999.99}',
+        b'[1, 2]',
+        b'{"timestamp": "2024-01-01T00:00:00", "amount": 1000}',
+        b'{"message": "no time"}',
+        b'{"timestamp": 0, "code": "7", "extra": 1}',
+        b'{"timestamp": 0, "code": "7"}',
+    ])
+    records, result = ingest(body, 'ndjson', chunk_bytes=16)
+
+    assert records == [
+        (datetime(2024, 1, 1), None, None, Decimal('999.99')),
+        (datetime(1970, 1, 1), None, 7, None),
+    ]
+    assert [error['line'] for error in result.errors] == [2, 3, 4, 5]
+
+
+def test_line_longer_than_limit_stops_the_body():
+    ingester = RowIngester(SCHEMA, 'ndjson')
+    ingester.MAX_LINE_BYTES = 10
+
+    async def run():
+        return [record async for record in ingester.records(FakeStream(b'{"message": "' + b'x' * 100))]
+    with pytest.raises(ValueError, match='длиннее'):
+        asyncio.run(run())
+
+
+def test_detect_format():
+    assert RowIngester.detect_format('text/csv') == 'csv'
+    assert RowIngester.detect_format('application/json', requested='CSV') == 'csv'
+    assert RowIngester.detect_format(None) == 'ndjson'
+    with pytest.raises(ValueError):
+        RowIngester(SCHEMA, 'xml')
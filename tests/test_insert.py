@@ -0,0 +1,122 @@
+import asyncio
+from datetime import datetime
+
+import pytest
+
+from data_manager.catalog import ColumnInfo, TableSchema
+from data_manager.database import DatabaseManager
+
+
+class FakeTransaction:
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+class FakeConnection:
+    def __init__(self, pool):
+        self.pool = pool
+
+    def transaction(self):
+        return FakeTransaction()
+
+    async def execute(self, query, *params):
+        self.pool.statements.append(query)
+
+    async def fetchval(self, query, *params):
+        return 1
+
+    async def copy_records_to_table(self, table_name, records, columns):
+        if self.pool.fail_on is not None and any(self.pool.fail_on in record for record in records):
+            raise RuntimeError('copy failed')
+        self.pool.copied.append((columns, list(records)))
+
+
+class FakePool:
+    def __init__(self, fail_on=None):
+        self.copied = []
+        self.statements = []
+        self.fail_on = fail_on
+
+    def get_max_size(self):
+        return 10
+
+    def acquire(self):
+        conn = FakeConnection(self)
+
+        class Acquire:
+            async def __aenter__(self):
+                return conn
+
+            async def __aexit__(self, *exc):
+                return False
+        return Acquire()
+
+
+def make_manager(pool):
+    manager = DatabaseManager('postgresql://localhost/test')
+    manager.pool = pool
+    manager.catalog['metrics'] = TableSchema('metrics', [
+        ColumnInfo('id', 'bigint', False), ColumnInfo('timestamp', 'timestamp without time zone', True),
+        ColumnInfo('value', 'integer', True),
+    ])
+    return manager
+
+
+def test_value_bounds_skip_nulls():
+    assert DatabaseManager._value_bounds([3, None, 1, 2]) == (1, 3)
+    assert DatabaseManager._value_bounds([None]) == (None, None)
+
+
+@pytest.mark.parametrize('parallel', [1, 3])
+def test_insert_data_copies_batches_and_runs_hooks(parallel):
+    pool = FakePool()
+    manager = make_manager(pool)
+    rows = [{'timestamp': datetime(2024, 1, 1, hour), 'value': hour} for hour in range(10)]
+    bounds, hooks = [], []
+    manager.add_batch_hook('metrics', 'timestamp', lambda conn, low, high: _record(bounds, (low, high)))
+    manager.add_write_hook('metrics', lambda conn: _record(hooks, 'hook'))
+
+    assert asyncio.run(manager.insert_data('metrics', iter(rows), batch_size=4, parallel=parallel)) == 10
+
+    assert sorted(len(records) for _, records in pool.copied) == [2, 4, 4]
+    assert all(columns == ['timestamp', 'value'] for columns, _ in pool.copied)
+    assert sorted(record[1] for _, records in pool.copied for record in records) == list(range(10))
+    assert (datetime(2024, 1, 1, 0), datetime(2024, 1, 1, 3)) in bounds
+    assert hooks == ['hook'] and manager.get_table_version('metrics') == '1'
+
+
+def test_known_bounds_run_batch_hooks_once_before_copy():
+    pool = FakePool()
+    manager = make_manager(pool)
+    bounds = []
+    manager.add_batch_hook('metrics', 'timestamp', lambda conn, low, high: _record(bounds, (low, high, len(pool.copied))))
+    rows = [{'timestamp': datetime(2024, 1, 1, hour), 'value': hour} for hour in range(10)]
+
+    asyncio.run(manager.insert_data('metrics', rows, batch_size=2, parallel=3,
+                                    bounds={'timestamp': (datetime(2024, 1, 1), datetime(2024, 1, 1, 9))}))
+    assert bounds == [(datetime(2024, 1, 1), datetime(2024, 1, 1, 9), 0)]
+    assert len(pool.copied) == 5
+
+
+def test_parallel_failure_still_publishes_committed_batches():
+    pool = FakePool(fail_on=7)
+    manager = make_manager(pool)
+    rows = [(None, value) for value in range(10)]
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(manager.insert_data('metrics', rows, columns=['timestamp', 'value'], batch_size=2, parallel=2))
+    assert manager.get_table_version('metrics') == '1'
+
+
+def test_unknown_column_is_rejected_before_copy():
+    pool = FakePool()
+    with pytest.raises(ValueError):
+        asyncio.run(make_manager(pool).insert_data('metrics', [{'value': 1, 'bogus': 2}]))
+    assert pool.copied == []
+
+
+async def _record(target, item):
+    target.append(item)
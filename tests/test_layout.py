@@ -0,0 +1,103 @@
+from datetime import datetime
+
+import pytest
+
+from data_manager.query_engine import QueryEngine
+
+
+COLUMN_TYPES = {
+    'timestamp': 'timestamp without time zone',
+    'region': 'character varying',
+    'status': 'character varying',
+    'cpu_usage': 'numeric',
+}
+
+
+def compile_panels(*configs):
+    return [QueryEngine._compile_panel(config, COLUMN_TYPES) for config in configs]
+
+
+def test_grouping_sets_share_one_scan_and_split_rows_by_mask():
+    panels = compile_panels(
+        {'dimensions': [{'field': 'region'}], 'measures': [{'field': 'cpu_usage', 'aggregation': 'avg'}]},
+        {'dimensions': [{'field': 'status'}], 'measures': [{'field': 'cpu_usage', 'aggregation': 'avg'}]},
+        {'measures': [{'name': 'rows', 'aggregation': 'count'}]},
+    )
+    query, params, panel_sets = QueryEngine.build_grouping_sets_query('server_metrics', panels, COLUMN_TYPES)
+
+    assert 'GROUP BY GROUPING SETS (("region"), ("status"), ())' in query
+    assert 'GROUPING("region", "status") AS grouping_mask' in query
+    # Одинаковая мера панелей вычисляется один раз
+    assert query.count('AVG("cpu_usage")') == 1
+    assert params == []
+    assert [panel_set['mask'] for panel_set in panel_sets] == [0b01, 0b10, 0b11]
+
+    rows = [
+        {'g0': 'eu', 'g1': None, 'grouping_mask': 0b01, 'm0': 1.5, 'm1': 2},
+        {'g0': None, 'g1': 'ok', 'grouping_mask': 0b10, 'm0': 2.5, 'm1': 3},
+        {'g0': None, 'g1': None, 'grouping_mask': 0b11, 'm0': 2.0, 'm1': 5},
+    ]
+    assert QueryEngine._extract_panel_rows(rows, panels[0], panel_sets[0]) == [{'region': 'eu', 'cpu_usage': 1.5}]
+    assert QueryEngine._extract_panel_rows(rows, panels[1], panel_sets[1]) == [{'status': 'ok', 'cpu_usage': 2.5}]
+    assert QueryEngine._extract_panel_rows(rows, panels[2], panel_sets[2]) == [{'rows': 5}]
+
+
+def test_same_dimensions_in_different_order_share_one_grouping_set():
+    measures = [{'field': 'cpu_usage', 'aggregation': 'max'}]
+    panels = compile_panels(
+        {'dimensions': [{'field': 'region'}, {'field': 'status'}], 'measures': measures},
+        {'dimensions': [{'field': 'status'}, {'field': 'region'}], 'measures': measures},
+    )
+    query, _, panel_sets = QueryEngine.build_grouping_sets_query('server_metrics', panels, COLUMN_TYPES)
+
+    assert 'GROUP BY GROUPING SETS (("region", "status"))' in query
+    assert [panel_set['mask'] for panel_set in panel_sets] == [0, 0]
+
+    rows = [{'g0': 'eu', 'g1': 'ok', 'grouping_mask': 0, 'm0': 90}]
+    for compiled, panel_set in zip(panels, panel_sets):
+        assert QueryEngine._extract_panel_rows(rows, compiled, panel_set) == [
+            {'region': 'eu', 'status': 'ok', 'cpu_usage': 90}
+        ]
+
+
+def test_split_by_grouping_limit(monkeypatch):
+    monkeypatch.setattr(QueryEngine, 'MAX_GROUPING_COLUMNS', 2)
+    panels = [(None, None, {'groups': [(name, name)]}) for name in ('a', 'b', 'c', 'a')]
+    chunks = QueryEngine._split_by_grouping_limit(panels)
+    assert [[panel[2]['groups'][0][0] for panel in chunk] for chunk in chunks] == [['a', 'b'], ['c', 'a']]
+
+
+def test_sort_rows_puts_nulls_last_and_respects_order():
+    rows = [{'k': 'b', 'v': 1}, {'k': None, 'v': 3}, {'k': 'a', 'v': 1}]
+    assert QueryEngine._sort_rows(rows, [('v', True), ('k', False)]) == [
+        {'k': None, 'v': 3}, {'k': 'a', 'v': 1}, {'k': 'b', 'v': 1}
+    ]
+
+
+def test_layout_tables_and_cache_key():
+    layout = {'panels': [{'config': {'table': 'b'}}, {'config': {}}, {'config': {'table': 'b'}}]}
+    assert QueryEngine.layout_tables(layout) == ('b', 'server_metrics')
+
+    key = QueryEngine.layout_cache_key('main', 'default', layout, limit=10)
+    assert key.startswith('layout_main_default_10_')
+    assert key == QueryEngine.layout_cache_key('main', 'default', {'panels': list(layout['panels'])}, limit=10)
+    assert key != QueryEngine.layout_cache_key('main', 'default', {'panels': layout['panels'][:1]}, limit=10)
+
+
+@pytest.mark.parametrize('value, expected', [
+    (0, datetime(1970, 1, 1)),
+    (1735700400.5, datetime(2025, 1, 1, 3, 0, 0, 500000)),
+    ('2025-01-01T03:00:00', datetime(2025, 1, 1, 3)),
+    ('2025-01-01T03:00:00Z', datetime(2025, 1, 1, 3)),
+    ('2025-01-01T03:00:00+03:00', datetime(2025, 1, 1, 0)),
+    ('2025-01-01', datetime(2025, 1, 1)),
+    (datetime(2025, 1, 1, 3), datetime(2025, 1, 1, 3)),
+])
+def test_parse_datetime_returns_naive_utc(value, expected):
+    assert QueryEngine.parse_datetime(value) == expected
+
+
+@pytest.mark.parametrize('value', [True, False, 'yesterday', '', 1e20])
+def test_parse_datetime_rejects_invalid_values(value):
+    with pytest.raises(ValueError):
+        QueryEngine.parse_datetime(value)
@@ -0,0 +1,25 @@
+import base64
+from datetime import datetime
+
+import pytest
+
+from data_manager.database import DatabaseManager
+
+
+def test_page_cursor_round_trip():
+    timestamp = datetime(2025, 1, 1, 12, 30, 15, 250000)
+    cursor = DatabaseManager.encode_page_cursor(timestamp, 42)
+    assert '=' not in cursor.rstrip('=') and '/' not in cursor and '+' not in cursor
+    assert DatabaseManager.decode_page_cursor(cursor) == (timestamp, 42)
+
+
+@pytest.mark.parametrize('cursor', [
+    'not base64!',
+    base64.urlsafe_b64encode(b'{"a":1}').decode(),
+    base64.urlsafe_b64encode(b'["2025-01-01T00:00:00"]').decode(),
+    base64.urlsafe_b64encode(b'["not a date",1]').decode(),
+    base64.urlsafe_b64encode(b'["2025-01-01T00:00:00","x"]').decode(),
+])
+def test_invalid_page_cursor_is_value_error(cursor):
+    with pytest.raises(ValueError):
+        DatabaseManager.decode_page_cursor(cursor)
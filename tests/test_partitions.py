@@ -0,0 +1,81 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from data_manager.partitions import PartitionManager
+
+
+class FakeTransaction:
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+class FakeConnection:
+    """Секция по умолчанию со строками в периодах default_periods"""
+
+    def __init__(self, default_periods=()):
+        self.default_periods = set(default_periods)
+        self.statements = []
+
+    def transaction(self):
+        return FakeTransaction()
+
+    async def fetch(self, query, *params):
+        return []
+
+    async def fetchval(self, query, *params):
+        return params[0] in self.default_periods
+
+    async def execute(self, query, *params):
+        self.statements.append(query.split(' PARTITION')[0].strip())
+        return 'INSERT 0 3'
+
+
+def make_manager(interval='day'):
+    return PartitionManager(db_manager=None, interval=interval)
+
+
+def test_period_start_and_partition_name():
+    manager = make_manager('week')
+    start = manager.period_start(datetime(2025, 1, 9, 0, 30, tzinfo=timezone(timedelta(hours=3))))
+    assert start == datetime(2025, 1, 6)
+    assert manager.partition_name(start) == 'server_metrics_p20250106'
+    assert make_manager().period_start(datetime(2025, 1, 9, 23, 59)) == datetime(2025, 1, 9)
+
+
+def test_write_path_only_creates_partitions():
+    manager = make_manager()
+    conn = FakeConnection(default_periods=[datetime(2025, 1, 2)])
+
+    created = asyncio.run(manager.ensure_range(conn, datetime(2025, 1, 1, 5), datetime(2025, 1, 3, 1)))
+
+    assert created == 2
+    assert conn.statements == ['CREATE TABLE IF NOT EXISTS "server_metrics_p20250101"',
+                               'CREATE TABLE IF NOT EXISTS "server_metrics_p20250103"']
+    assert datetime(2025, 1, 2) not in manager.partitions
+
+
+def test_rescue_moves_rows_out_of_default_partition():
+    manager = make_manager()
+    conn = FakeConnection(default_periods=[datetime(2025, 1, 2)])
+
+    assert asyncio.run(manager.ensure_range(conn, datetime(2025, 1, 2), datetime(2025, 1, 2), rescue=True)) == 1
+    assert conn.statements[0] == 'ALTER TABLE "server_metrics" DETACH'
+    assert conn.statements[-1] == 'ALTER TABLE "server_metrics" ATTACH'
+    assert manager._stats['moved_from_default'] == 3
+
+
+def test_too_wide_range_is_left_to_default_partition():
+    conn = FakeConnection()
+    created = asyncio.run(make_manager().ensure_range(conn, datetime(2000, 1, 1), datetime(2025, 1, 1)))
+    assert created == 0 and conn.statements == []
+
+
+@pytest.mark.parametrize('interval, mode', [('month', 'drop'), ('day', 'truncate')])
+def test_invalid_settings(interval, mode):
+    with pytest.raises(ValueError):
+        PartitionManager(db_manager=None, interval=interval, retention_mode=mode)
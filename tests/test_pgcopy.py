@@ -0,0 +1,104 @@
+import struct
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from data_manager.catalog import ColumnInfo
+from data_manager.generator import DataGenerator
+from data_manager.pgcopy import COPY_HEADER, COPY_TRAILER, BinaryCopyEncoder, DictColumn
+
+
+PG_EPOCH = datetime(2000, 1, 1)
+
+COLUMNS = [
+    ColumnInfo('timestamp', 'timestamp without time zone', False),
+    ColumnInfo('day', 'date', False),
+    ColumnInfo('name', 'character varying', False),
+    ColumnInfo('zone', 'text', False),
+    ColumnInfo('count', 'integer', False),
+    ColumnInfo('ratio', 'double precision', False),
+    ColumnInfo('amount', 'numeric', False, numeric_precision=10, numeric_scale=2),
+    ColumnInfo('ok', 'boolean', False),
+]
+
+
+def decode_numeric(payload: bytes) -> Decimal:
+    ndigits, weight, sign, dscale = struct.unpack('>hhhh', payload[:8])
+    digits = struct.unpack(f'>{ndigits}h', payload[8:])
+    value = sum(Decimal(digit) * Decimal(10000) ** (weight - index) for index, digit in enumerate(digits))
+    return (-value if sign else value).quantize(Decimal(1).scaleb(-dscale))
+
+
+DECODERS = {
+    'timestamp without time zone': lambda raw: PG_EPOCH + timedelta(microseconds=struct.unpack('>q', raw)[0]),
+    'date': lambda raw: date(2000, 1, 1) + timedelta(days=struct.unpack('>i', raw)[0]),
+    'character varying': lambda raw: raw.decode('utf-8'),
+    'text': lambda raw: raw.decode('utf-8'),
+    'integer': lambda raw: struct.unpack('>i', raw)[0],
+    'double precision': lambda raw: struct.unpack('>d', raw)[0],
+    'numeric': decode_numeric,
+    'boolean': lambda raw: raw == b'\x01',
+}
+
+
+def decode_copy(data: bytes, columns):
+    """Разбор потока COPY BINARY, как его читает PostgreSQL"""
+    assert data.startswith(COPY_HEADER) and data.endswith(COPY_TRAILER)
+    body, offset, rows = data[len(COPY_HEADER):-len(COPY_TRAILER)], 0, []
+    while offset < len(body):
+        (field_count,) = struct.unpack_from('>h', body, offset)
+        assert field_count == len(columns)
+        offset += 2
+        row = []
+        for column in columns:
+            (length,) = struct.unpack_from('>i', body, offset)
+            row.append(DECODERS[column.data_type](body[offset + 4:offset + 4 + length]))
+            offset += 4 + length
+        rows.append(tuple(row))
+    return rows
+
+
+def test_encoded_rows_decode_to_original_values():
+    chunk = {
+        'timestamp': np.array(['2024-01-01T00:00:00.000001', '1999-12-31T23:00:00'], dtype='datetime64[us]'),
+        'day': np.array(['2024-02-29', '1970-01-01'], dtype='datetime64[D]'),
+        'name': DictColumn(np.array([1, 0]), ['srv', 'сервер-длинный']),
+        'zone': np.array(['eu', 'us-east']),
+        'count': np.array([7, -2 ** 31]),
+        'ratio': np.array([0.5, -1e300]),
+        'amount': np.array([12345678.91, -0.05]),
+        'ok': np.array([True, False]),
+    }
+    rows = decode_copy(BinaryCopyEncoder(COLUMNS).encode(chunk), COLUMNS)
+
+    assert rows == [
+        (datetime(2024, 1, 1, 0, 0, 0, 1), date(2024, 2, 29), 'сервер-длинный', 'eu', 7, 0.5,
+         Decimal('12345678.91'), True),
+        (datetime(1999, 12, 31, 23), date(1970, 1, 1), 'srv', 'us-east', -2 ** 31, -1e300, Decimal('-0.05'), False),
+    ]
+
+
+@pytest.mark.parametrize('values', [[1e8], [float('nan')]])
+def test_numeric_out_of_range_or_nan_is_rejected(values):
+    column = ColumnInfo('amount', 'numeric', False, numeric_precision=10, numeric_scale=2)
+    with pytest.raises(ValueError):
+        BinaryCopyEncoder([column]).encode({'amount': np.array(values)})
+
+
+def test_generator_chunks_are_reproducible_and_cover_all_rows():
+    generator = DataGenerator()
+    chunks = list(generator.iter_chunks(server_count=3, days=1, interval_hours=6, chunk_size=5, seed=1))
+
+    assert [len(chunk['timestamp']) for chunk in chunks] == [5, 5, 2]
+    again = generator.generate_chunk(1, server_count=3, days=1, interval_hours=6, chunk_size=5, seed=1)
+    assert np.array_equal(again['cpu_usage'], chunks[1]['cpu_usage'])
+    assert chunks[0]['server_name'].decode().tolist()[:5] == ['SRV-001'] * 4 + ['SRV-002']
+
+    columns = [ColumnInfo('timestamp', 'timestamp without time zone', False),
+               ColumnInfo('server_name', 'character varying', False)]
+    copied = [row for data in generator.iter_copy_chunks(columns, server_count=3, days=1, chunk_size=5, seed=1)
+              for row in decode_copy(data, columns)]
+    assert len(copied) == 12 and copied[4][1] == 'SRV-002'
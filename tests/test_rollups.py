@@ -0,0 +1,114 @@
+import asyncio
+
+import asyncpg
+
+from data_manager.catalog import ColumnInfo, TableSchema
+from data_manager.rollups import Rollup, RollupManager
+
+
+def make_schema(measures):
+    columns = [ColumnInfo('id', 'bigint', False), ColumnInfo('timestamp', 'timestamp without time zone', False)]
+    columns += [ColumnInfo(name, 'character varying', False) for name in RollupManager.DIMENSIONS]
+    columns += [ColumnInfo(name, 'numeric', False) for name in measures]
+    columns.append(ColumnInfo('note', 'numeric', True))
+    return TableSchema('server_metrics', columns)
+
+
+class FakeTransaction:
+    def __init__(self, conn):
+        self.conn = conn
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.conn.savepoints.append('rollback' if exc_type else 'release')
+        return False
+
+
+class FakeConnection:
+    """Слияние в rollup падает для таблиц из broken, как после удаления колонки меры"""
+
+    def __init__(self, broken=()):
+        self.broken = set(broken)
+        self.savepoints = []
+        self.merged = []
+
+    def transaction(self):
+        return FakeTransaction(self)
+
+    async def fetchval(self, query, *params):
+        return 0 if 'rollup_state' in query else 100
+
+    async def execute(self, query, *params):
+        for name in self.broken:
+            if f'INSERT INTO "{name}"' in query:
+                raise asyncpg.UndefinedColumnError('column "cpu_usage" does not exist')
+        if 'INSERT INTO' in query:
+            self.merged.append(query)
+        return 'INSERT 0 1'
+
+
+class FakeDatabase:
+    def __init__(self, schema):
+        self.catalog = {'server_metrics': schema}
+
+
+def make_manager(measures=('cpu_usage',)):
+    manager = RollupManager(FakeDatabase(make_schema(measures)))
+    for rollup in manager.rollups:
+        rollup.measures = list(measures)
+        rollup.ready = True
+    manager._initialized = True
+    return manager
+
+
+def test_measures_are_numeric_not_null_columns():
+    assert RollupManager._measures_of(make_schema(['cpu_usage', 'memory_usage'])) == ['cpu_usage', 'memory_usage']
+
+
+def test_can_answer_checks_dimensions_measures_and_grain():
+    rollup = Rollup('r', 'server_metrics', 'day', list(RollupManager.DIMENSIONS), ['cpu_usage'])
+    config = {
+        'dimensions': [{'field': 'timestamp', 'granularity': 'month'}, {'field': 'server_zone'}],
+        'measures': [{'field': 'cpu_usage', 'aggregation': 'avg'}],
+    }
+    assert rollup.can_answer(config)
+    assert not rollup.can_answer({**config, 'dimensions': [{'field': 'timestamp', 'granularity': 'hour'}]})
+    assert not rollup.can_answer({**config, 'measures': [{'field': 'memory_usage', 'aggregation': 'sum'}]})
+    assert not rollup.can_answer(config, filters={'hostname': 'a'})
+
+
+def test_schema_error_disables_rollup_without_failing_write(monkeypatch):
+    manager = make_manager()
+    scheduled = []
+    monkeypatch.setattr(asyncio, 'ensure_future', lambda coro: scheduled.append(coro.close()))
+    hour, day = manager.rollups
+    conn = FakeConnection(broken=[hour.name])
+
+    asyncio.run(manager.apply_new_rows(conn))
+
+    assert hour.stale and not hour.ready
+    assert day.ready and not day.stale
+    assert conn.savepoints == ['rollback', 'release']
+    assert len(scheduled) == 1
+
+    # Отключенный rollup больше не сливается, пока его не перестроят
+    conn = FakeConnection()
+    asyncio.run(manager.apply_new_rows(conn))
+    assert len(conn.merged) == 1 and day.name in conn.merged[0]
+
+
+def test_schema_notification_marks_changed_rollups(monkeypatch):
+    manager = make_manager(measures=('cpu_usage', 'memory_usage'))
+    scheduled = []
+    monkeypatch.setattr(asyncio, 'ensure_future', lambda coro: scheduled.append(coro.close()))
+
+    manager.on_schema_change('other_table')
+    manager.on_schema_change('server_metrics')
+    assert not scheduled and all(rollup.ready for rollup in manager.rollups)
+
+    manager.db_manager.catalog['server_metrics'] = make_schema(['cpu_usage'])
+    manager.on_schema_change('server_metrics')
+    assert all(rollup.stale and not rollup.ready for rollup in manager.rollups)
+    assert len(scheduled) == 1
@@ -0,0 +1,51 @@
+from datetime import datetime
+from decimal import Decimal
+
+import pytest
+
+from data_manager import serialization
+
+
+VALUE = {
+    'name': 'сервер',
+    'values': [1.5, float('nan'), float('inf'), -float('inf'), None, True],
+    'decimals': (Decimal('1.50'), Decimal('NaN'), Decimal('-Infinity'), Decimal('1e400')),
+    'at': datetime(2025, 1, 1, 12, 30),
+}
+EXPECTED = (
+    '{"name":"сервер","values":[1.5,null,null,null,null,true],'
+    '"decimals":[1.5,null,null,null],"at":"2025-01-01T12:30:00"}'
+).encode('utf-8')
+
+
+@pytest.fixture
+def encoder():
+    previous = serialization.encoder_name()
+    yield serialization.use_encoder
+    serialization.use_encoder(previous)
+
+
+def test_stdlib_encoder_maps_non_finite_numbers_to_null(encoder):
+    encoder('json')
+    assert serialization.dumps_bytes(VALUE) == EXPECTED
+    assert serialization.dumps(VALUE) == EXPECTED.decode('utf-8')
+    assert serialization.dumps([1, 2]) == '[1,2]'
+
+
+def test_encoders_produce_the_same_bytes(encoder):
+    pytest.importorskip('orjson')
+    encoder('orjson')
+    assert serialization.dumps_bytes(VALUE) == EXPECTED
+
+
+def test_numpy_scalars_are_numbers(encoder):
+    np = pytest.importorskip('numpy')
+    encoder('json')
+    value = {'n': np.int64(3), 'f': np.float64('nan'), 'g': np.float32('inf')}
+    assert serialization.dumps(value) == '{"n":3,"f":null,"g":null}'
+
+
+def test_unknown_encoder_is_rejected():
+    with pytest.raises(ValueError):
+        serialization.use_encoder('ujson')
+    assert serialization.loads(b'{"a": [1]}') == {'a': [1]}
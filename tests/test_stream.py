@@ -0,0 +1,143 @@
+import asyncio
+import json
+from contextlib import asynccontextmanager
+
+import pytest
+from aiohttp.test_utils import TestClient, TestServer
+
+from conftest import make_app
+from data_manager.api_formatter import APIFormatter
+from data_manager.catalog import ColumnInfo, TableSchema
+from data_manager.database import DatabaseManager
+from data_manager.models import EncodedRows
+from routes import api_data_compact
+
+
+SCHEMA = TableSchema('metrics', [
+    ColumnInfo('id', 'bigint', False),
+    ColumnInfo('value', 'numeric', True),
+])
+
+
+class FakeTransaction:
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+class FakeConnection:
+    """Таблица из ids; порция - строки с id > last_id по порядку id, как keyset-запрос compact_chunk"""
+
+    def __init__(self, ids):
+        self.ids = sorted(ids)
+        self.requests = []
+
+    def transaction(self, **kwargs):
+        return FakeTransaction()
+
+    async def fetchval(self, query, *params):
+        return self.ids[-1] if self.ids else None
+
+    async def fetchrow(self, query, *params):
+        if 'selected' in query:
+            return {'total': len(self.ids)}
+        last_id, size = params[:2]
+        self.requests.append((last_id, size))
+        chunk = [row_id for row_id in self.ids if row_id > last_id][:size]
+        return {
+            'rows': ','.join(f'[{row_id}]' for row_id in chunk),
+            'last_id': chunk[-1] if chunk else None,
+            'row_count': len(chunk),
+        }
+
+
+class FakePool:
+    def __init__(self, conn):
+        self.conn = conn
+
+    @asynccontextmanager
+    async def acquire(self):
+        yield self.conn
+
+
+def read_snapshot(ids, limit=None, chunk_size=2):
+    conn = FakeConnection(ids)
+    manager = DatabaseManager('postgresql://localhost/test')
+    manager.pool = FakePool(conn)
+    manager.catalog['metrics'] = SCHEMA
+
+    async def run():
+        async with manager.compact_snapshot('metrics', limit=limit, chunk_size=chunk_size) as rows:
+            chunks = [chunk async for chunk in rows.chunks]
+            return chunks, rows.total
+    return asyncio.run(run()), conn.requests
+
+
+def test_chunks_follow_id_order_and_stop_at_limit():
+    (chunks, total), requests = read_snapshot([7, 3, 10, 1, 4, 12], limit=5)
+
+    assert chunks == ['[1],[3]', '[4],[7]', '[10]']
+    assert total == 5
+    # Следующая порция начинается после последнего id предыдущей, последняя - укорочена до limit
+    assert requests == [(0, 2), (3, 2), (7, 1)]
+
+
+def test_chunk_boundaries_without_limit():
+    # Полная последняя порция - конец узнается по пустой следующей
+    (chunks, total), requests = read_snapshot([1, 2, 3, 4])
+    assert chunks == ['[1],[2]', '[3],[4]'] and total == 4
+    assert requests == [(0, 2), (2, 2), (4, 2)]
+
+    # Короткая порция - последняя, лишнего запроса нет
+    (chunks, total), requests = read_snapshot([1, 2, 3])
+    assert chunks == ['[1],[2]', '[3]'] and total == 3
+    assert requests == [(0, 2), (2, 2)]
+
+
+def test_encoded_json_joins_chunks_in_order():
+    async def chunks():
+        yield '[1],[2]'
+        yield ''
+        yield '[3]'
+
+    rows = EncodedRows(headers=['value'], dictionaries={}, total=3, watermark=None, chunks=chunks())
+    assert asyncio.run(APIFormatter.encoded_to_json(rows)) == '{"h":["value"],"d":[[1],[2],[3]],"c":3}'
+
+
+@pytest.mark.parametrize('accept_encoding, content_encoding', [
+    ('identity', None),
+    ('gzip', 'gzip'),
+    ('gzip;q=0, deflate', 'deflate'),
+])
+def test_first_rows_are_sent_before_the_rest_is_read(accept_encoding, content_encoding):
+    async def run():
+        released = asyncio.Event()
+
+        async def chunks():
+            yield '[1]'
+            # Вторая порция читается только после того, как клиент получил первую
+            await released.wait()
+            yield '[2]'
+
+        encoded = EncodedRows(headers=['value'], dictionaries={}, total=2, watermark=2, chunks=chunks())
+
+        class FakeDatabase:
+            @asynccontextmanager
+            async def compact_snapshot(self, table_name, limit=None, epoch_dates=False):
+                yield encoded
+
+        app = make_app({('GET', '/api/data/compact'): api_data_compact}, db_manager=FakeDatabase(),
+                       data_cache=None)
+        async with TestClient(TestServer(app)) as client:
+            response = await client.get('/api/data/compact?stream=true',
+                                        headers={'Accept-Encoding': accept_encoding})
+            first = await asyncio.wait_for(response.content.readany(), timeout=2)
+            released.set()
+            return response.headers, first + await response.read()
+
+    headers, body = asyncio.run(run())
+
+    assert headers.get('Content-Encoding') == content_encoding
+    assert json.loads(body) == {'h': ['value'], 'd': [[1], [2]], 'c': 2, 'w': 2}
@@ -0,0 +1,61 @@
+import json
+from datetime import datetime
+
+import routes
+from conftest import fetch, make_app
+
+
+class FakeDatabase:
+    def __init__(self, rows, watermark):
+        self.rows = rows
+        self.watermark = watermark
+        self.calls = []
+
+    def get_table_version(self, table):
+        return 1
+
+    async def get_data_since(self, table, since_id, limit=None):
+        self.calls.append((table, since_id, limit))
+        if since_id < 0:
+            raise ValueError('since_id < 0')
+        rows = [row for row in self.rows if row['id'] > since_id]
+        return [{key: value for key, value in row.items() if key != 'id'} for row in rows], self.watermark
+
+
+ROWS = [
+    {'id': 1, 'timestamp': datetime(2025, 1, 1, 0, 0), 'status': 'ok'},
+    {'id': 2, 'timestamp': datetime(2025, 1, 1, 1, 0), 'status': 'ok'},
+]
+
+
+def app_with(db):
+    return make_app({
+        ('GET', '/api/data/compact'): routes.api_data_compact,
+        ('GET', '/api/data/ultra'): routes.api_data_ultra_compact,
+    }, db_manager=db)
+
+
+def test_since_id_returns_only_newer_rows_and_watermark():
+    db = FakeDatabase(ROWS, watermark=2)
+    status, headers, body = fetch(app_with(db), 'GET', '/api/data/compact?since_id=1')
+
+    assert status == 200
+    assert headers['X-Watermark'] == '2' and headers['X-Cache'] == 'BYPASS'
+    payload = json.loads(body)
+    assert payload['d'] == [['2025-01-01T01:00:00', 'ok']] and payload['c'] == 1 and payload['w'] == 2
+    assert db.calls == [('server_metrics', 1, None)]
+
+
+def test_since_id_ultra_uses_epoch_seconds():
+    db = FakeDatabase(ROWS, watermark=2)
+    status, _, body = fetch(app_with(db), 'GET', '/api/data/ultra?since_id=0&limit=10')
+
+    assert status == 200
+    assert [row[0] for row in json.loads(body)['d']] == [1735689600, 1735693200]
+    assert db.calls == [('server_metrics', 0, '10')]
+
+
+def test_invalid_since_id_is_bad_request():
+    db = FakeDatabase(ROWS, watermark=2)
+    assert fetch(app_with(db), 'GET', '/api/data/compact?since_id=abc')[0] == 400
+    assert fetch(app_with(db), 'GET', '/api/data/compact?since_id=-1')[0] == 400
@@ -0,0 +1,45 @@
+import json
+from datetime import datetime
+
+from data_manager.database import DatabaseManager
+
+
+def make_manager():
+    manager = DatabaseManager('postgresql://localhost/test')
+    events = []
+    manager.on_table_change(lambda table, version: events.append((table, version)))
+    return manager, events
+
+
+def notify(manager, change):
+    payload = change if isinstance(change, str) else json.dumps(change)
+    manager._on_table_change_notification(None, 0, DatabaseManager.TABLE_CHANGES_CHANNEL, payload)
+
+
+def test_only_newer_versions_reach_subscribers():
+    manager, events = make_manager()
+    notify(manager, {'table': 'server_metrics', 'version': 2})
+    notify(manager, {'table': 'server_metrics', 'version': 2})
+    notify(manager, {'table': 'server_metrics', 'version': 1})
+    notify(manager, {'table': 'server_metrics', 'version': 3})
+
+    assert events == [('server_metrics', 2), ('server_metrics', 3)]
+    assert manager.get_table_version('server_metrics') == '3' and manager.get_table_version('other') == '0'
+
+
+def test_malformed_notifications_are_ignored():
+    manager, events = make_manager()
+    for payload in ['not json', '{"version": 1}', '{"table": "t", "version": "x"}']:
+        notify(manager, payload)
+    assert events == [] and manager.table_versions == {}
+
+
+def test_horizon_is_applied_before_version_and_only_grows():
+    manager, events = make_manager()
+    seen = []
+    manager.on_table_change(lambda table, version: seen.append(manager.get_table_horizon(table)))
+
+    notify(manager, {'table': 't', 'version': 1, 'horizon': '2025-01-10T00:00:00'})
+    notify(manager, {'table': 't', 'version': 2, 'horizon': '2025-01-05T00:00:00'})
+
+    assert seen == [datetime(2025, 1, 10), datetime(2025, 1, 10)]